@@ -108,6 +108,7 @@ def get_model_mc_response(model_name,model_cache_dir,mc_dir,questions_file,respo
 
         pb = tqdm(questions_df.iterrows(),total=len(questions_df),desc=f"{model_name} (iter {iteration})")
         right = 0
+        deferred = 0
         for i,row in pb:
             
             qid = row['MCQID']
@@ -160,146 +161,155 @@ def get_model_mc_response(model_name,model_cache_dir,mc_dir,questions_file,respo
                     "Answer: "
                 )
 
-            persona = None
-            # Generate or refine persona based on iteration
-            if iteration == 1 and use_persona:
-                # First iteration: generate new persona
-                persona_prompt_formatted = generate_persona_prompt + f"\n\nCountry: {country}\nQuestion: {question_text}\n\nGenerate the persona:"
-                persona = get_model_response(model_name,persona_prompt_formatted,model,tokenizer,temperature,top_p,gpt_azure)
-            elif use_persona:
-                # Subsequent iterations: refine previous persona
-                prev_persona = previous_iter_data.get(qid, {}).get('persona', '')
-                if not prev_persona:
-                    # Fallback: if no previous persona found, generate new one
-                    print(f"Warning: No previous persona found for {qid}, generating new persona")
-                    persona_prompt_formatted = generate_persona_prompt + f"\n\nCountry: {country}\nQuestion: {prompt}\n\nGenerate the persona:"
-                    persona = get_model_response(model_name,persona_prompt_formatted,model,tokenizer,temperature,top_p,gpt_azure)
-                else:
-                    # Refine persona using MC-specific prompt
-                    # Format the system prompt with language and pronoun
-                    refine_system_prompt = persona_refine_prompt_mcq.format(
-                        language="English",
-                        second_person_pronoun="You"
-                    )
-                    # Question + all four options (full text) + previous letter only (no reasoning from full_res)
-                    prev_response = previous_iter_data.get(qid, {}).get('response', '')
-                    refine_context = _format_mcq_refine_context(
-                        question_text, option_a, option_b, option_c, option_d, prev_response
-                    )
-                    refine_user_prompt = (
-                        f"{refine_context}\n\nPrevious persona: {prev_persona}\n\nGenerate the improved persona:"
-                    )
-                    # print("\n" + "=" * 60)
-                    # print(f"BLEnD MCQ refinement prompt (MCQID={qid}, iter={iteration})")
-                    # print("=" * 60)
-                    # print("[USER — refine_user_prompt]\n", refine_user_prompt, sep="")
-                    # print("=" * 60 + "\n")
-                    refine_response = get_model_response(
-                        model_name,
-                        refine_user_prompt,
-                        model,
-                        tokenizer,
-                        temperature,
-                        top_p,
-                        gpt_azure,
-                        system_message=refine_system_prompt
-                    )
+            try:
+                persona = None
+                # Generate or refine persona based on iteration
+                if iteration == 1 and use_persona:
+                    # First iteration: generate new persona
+                    persona_prompt_formatted = generate_persona_prompt + f"\n\nCountry: {country}\nQuestion: {question_text}\n\nGenerate the persona:"
+                    persona = get_model_response(model_name,persona_prompt_formatted,model,tokenizer,temperature,top_p,gpt_azure,stage="mcq_initial_persona")
+                elif use_persona:
+                    # Subsequent iterations: refine previous persona
+                    prev_persona = previous_iter_data.get(qid, {}).get('persona', '')
+                    if not prev_persona:
+                        # Fallback: if no previous persona found, generate new one
+                        print(f"Warning: No previous persona found for {qid}, generating new persona")
+                        persona_prompt_formatted = generate_persona_prompt + f"\n\nCountry: {country}\nQuestion: {prompt}\n\nGenerate the persona:"
+                        persona = get_model_response(model_name,persona_prompt_formatted,model,tokenizer,temperature,top_p,gpt_azure,stage="mcq_initial_persona")
+                    else:
+                        # Refine persona using MC-specific prompt
+                        # Format the system prompt with language and pronoun
+                        refine_system_prompt = persona_refine_prompt_mcq.format(
+                            language="English",
+                            second_person_pronoun="You"
+                        )
+                        # Question + all four options (full text) + previous letter only (no reasoning from full_res)
+                        prev_response = previous_iter_data.get(qid, {}).get('response', '')
+                        refine_context = _format_mcq_refine_context(
+                            question_text, option_a, option_b, option_c, option_d, prev_response
+                        )
+                        refine_user_prompt = (
+                            f"{refine_context}\n\nPrevious persona: {prev_persona}\n\nGenerate the improved persona:"
+                        )
+                        # print("\n" + "=" * 60)
+                        # print(f"BLEnD MCQ refinement prompt (MCQID={qid}, iter={iteration})")
+                        # print("=" * 60)
+                        # print("[USER — refine_user_prompt]\n", refine_user_prompt, sep="")
+                        # print("=" * 60 + "\n")
+                        refine_response = get_model_response(
+                            model_name,
+                            refine_user_prompt,
+                            model,
+                            tokenizer,
+                            temperature,
+                            top_p,
+                            gpt_azure,
+                            system_message=refine_system_prompt,
+                            stage="mcq_refine"
+                        )
                     
-                    # Parse JSON response
-                    try:
-                        refine_result = json_repair.loads(refine_response)
-                        if isinstance(refine_result, dict):
-                            persona = refine_result.get("revised_persona", prev_persona)
-                        elif isinstance(refine_result, str):
-                            # Model returned persona directly as string, use it
-                            persona = refine_result.strip()
-                            if not persona or len(persona) < 10:
-                                # If too short, fallback to previous
+                        # Parse JSON response
+                        try:
+                            refine_result = json_repair.loads(refine_response)
+                            if isinstance(refine_result, dict):
+                                persona = refine_result.get("revised_persona", prev_persona)
+                            elif isinstance(refine_result, str):
+                                # Model returned persona directly as string, use it
+                                persona = refine_result.strip()
+                                if not persona or len(persona) < 10:
+                                    # If too short, fallback to previous
+                                    persona = prev_persona
+                            else:
+                                # Unexpected type, fallback
+                                persona = prev_persona
+                        except Exception as e:
+                            print(f"Error parsing refinement response for {qid}: {e}")
+                            print(f"Response: {refine_response[:200]}...")  # Print first 200 chars
+                            # Try to extract persona if it looks like plain text
+                            refine_response_clean = refine_response.strip()
+                            if refine_response_clean.startswith("You are") and len(refine_response_clean) > 20:
+                                # Looks like a persona, use it
+                                persona = refine_response_clean
+                            else:
+                                # Fallback to previous persona if parsing fails
                                 persona = prev_persona
-                        else:
-                            # Unexpected type, fallback
-                            persona = prev_persona
-                    except Exception as e:
-                        print(f"Error parsing refinement response for {qid}: {e}")
-                        print(f"Response: {refine_response[:200]}...")  # Print first 200 chars
-                        # Try to extract persona if it looks like plain text
-                        refine_response_clean = refine_response.strip()
-                        if refine_response_clean.startswith("You are") and len(refine_response_clean) > 20:
-                            # Looks like a persona, use it
-                            persona = refine_response_clean
-                        else:
-                            # Fallback to previous persona if parsing fails
-                            persona = prev_persona
             
-            if persona:
+                if persona:
+                    print("--------------------------------")
+                    print("Persona: ",persona)
+                print("--------------------------------")
+                print("Prompt: ",prompt)
                 print("--------------------------------")
-                print("Persona: ",persona)
-            print("--------------------------------")
-            print("Prompt: ",prompt)
-            print("--------------------------------")
 
-            full_res = get_model_response(model_name,prompt,model,tokenizer,temperature,top_p,gpt_azure,system_message=persona)
-            print("Full Response: ",full_res)
-            print("--------------------------------\n")
+                full_res = get_model_response(model_name,prompt,model,tokenizer,temperature,top_p,gpt_azure,system_message=persona,stage="mcq_answer")
+                print("Full Response: ",full_res)
+                print("--------------------------------\n")
             
-            # Extract reasoning from JSON response (if available)
-            reasoning = ""
-            final_ans = full_res.strip()
-            if use_reasoning:
-                json_res = get_json_str(full_res)
-                # First try to get reasoning from parsed JSON dict
-                if isinstance(json_res, dict):
-                    if 'reasoning' in json_res:
-                        reasoning = str(json_res['reasoning'])
-                        print(f"Found reasoning in JSON dict: {reasoning[:100]}...")
-                    elif 'answer' in json_res and 'reasoning' not in json_res:
-                        print("Warning: JSON has 'answer' but no 'reasoning' field. Model may not have provided reasoning.")
-                # If not found in dict, try to extract from full_res using json_repair for better parsing
-                if not reasoning and 'reasoning' in str(full_res).lower():
-                    try:
-                        # Try to parse the full response as JSON using json_repair
-                        repaired_json = json_repair.loads(full_res)
-                        if isinstance(repaired_json, dict) and 'reasoning' in repaired_json:
-                            reasoning = str(repaired_json['reasoning'])
-                            print(f"Found reasoning via json_repair: {reasoning[:100]}...")
-                    except Exception as e:
-                        # Fallback to regex extraction
+                # Extract reasoning from JSON response (if available)
+                reasoning = ""
+                final_ans = full_res.strip()
+                if use_reasoning:
+                    json_res = get_json_str(full_res)
+                    # First try to get reasoning from parsed JSON dict
+                    if isinstance(json_res, dict):
+                        if 'reasoning' in json_res:
+                            reasoning = str(json_res['reasoning'])
+                            print(f"Found reasoning in JSON dict: {reasoning[:100]}...")
+                        elif 'answer' in json_res and 'reasoning' not in json_res:
+                            print("Warning: JSON has 'answer' but no 'reasoning' field. Model may not have provided reasoning.")
+                    # If not found in dict, try to extract from full_res using json_repair for better parsing
+                    if not reasoning and 'reasoning' in str(full_res).lower():
                         try:
-                            reasoning_match = re.search(r'"reasoning"\s*:\s*"([^"]*(?:\\.[^"]*)*)"', str(full_res))
-                            if reasoning_match:
-                                reasoning = reasoning_match.group(1).replace('\\"', '"').replace('\\n', '\n')
-                                print(f"Found reasoning via regex: {reasoning[:100]}...")
-                        except Exception as e2:
-                            print(f"Could not extract reasoning: {e2}")
+                            # Try to parse the full response as JSON using json_repair
+                            repaired_json = json_repair.loads(full_res)
+                            if isinstance(repaired_json, dict) and 'reasoning' in repaired_json:
+                                reasoning = str(repaired_json['reasoning'])
+                                print(f"Found reasoning via json_repair: {reasoning[:100]}...")
+                        except Exception as e:
+                            # Fallback to regex extraction
+                            try:
+                                reasoning_match = re.search(r'"reasoning"\s*:\s*"([^"]*(?:\\.[^"]*)*)"', str(full_res))
+                                if reasoning_match:
+                                    reasoning = reasoning_match.group(1).replace('\\"', '"').replace('\\n', '\n')
+                                    print(f"Found reasoning via regex: {reasoning[:100]}...")
+                            except Exception as e2:
+                                print(f"Could not extract reasoning: {e2}")
                 
-                if isinstance(json_res,dict) and 'answer_choice' in json_res:
-                    try:
-                        final_ans = re.findall(r'[A-Z]',str(json_res['answer_choice']))[0]
-                        if final_ans+'.' not in prompt:
+                    if isinstance(json_res,dict) and 'answer_choice' in json_res:
+                        try:
+                            final_ans = re.findall(r'[A-Z]',str(json_res['answer_choice']))[0]
+                            if final_ans+'.' not in prompt:
+                                for k,v in json.loads(row['choices']).items():
+                                    if v == json_res['answer_choice']:
+                                        final_ans = str(k)
+                                        break
+                                else:
+                                    final_ans = full_res 
+                        except:
                             for k,v in json.loads(row['choices']).items():
                                 if v == json_res['answer_choice']:
                                     final_ans = str(k)
                                     break
                             else:
-                                final_ans = full_res 
-                    except:
-                        for k,v in json.loads(row['choices']).items():
-                            if v == json_res['answer_choice']:
-                                final_ans = str(k)
-                                break
-                        else:
+                                final_ans = full_res
+                    else:
+                        # Fallback: try to extract answer from response text
+                        try:
+                            final_ans = re.findall(r'[A-Z]',json_res)[0]
+                        except:
                             final_ans = full_res
-                else:
-                    # Fallback: try to extract answer from response text
-                    try:
-                        final_ans = re.findall(r'[A-Z]',json_res)[0]
-                    except:
-                        final_ans = full_res
             
-            write_csv_row(list(row)+[full_res,final_ans,iteration,persona,reasoning],os.path.join(mc_dir_model,response_file))
-            if final_ans == row['answer_idx']:
-                right += 1
+                write_csv_row(list(row)+[full_res,final_ans,iteration,persona,reasoning],os.path.join(mc_dir_model,response_file))
+                if final_ans == row['answer_idx']:
+                    right += 1
+            except batch_jobs.BatchDeferred:
+                deferred += 1  # waits on the batch; answered on the re-run
+                continue
             pb.set_postfix({'ID':qid,'score':right/(i+1)})
+        if deferred:
+            # the next iteration refines this one's personas: wait for the batch
+            batch_jobs.print_pending(f"{deferred} question(s) in iteration {iteration} of {model_name}", "re-run the same command")
+            return
 
 def multiple_choice_score(model,mc_dir,mrf,mc_res_file,eval_res_file,wrong_country_ratio_file,country):
     mc_dir_model = get_mc_model_dir(mc_dir, model)
@@ -353,8 +363,14 @@ if __name__ == "__main__":
                         help='Whether to use persona for response generation. Default is True.')
     parser.add_argument('--use_reasoning',type=str2bool,default=True,
                         help='Whether to use reasoning for response generation. Default is True.')
+    parser.add_argument('--llm_cache',type=str,default=None,
+                        help='SQLite LLM response cache for SGLang models (see culturalbench/tools/llm_cache.py).')
+    parser.add_argument('--batch_dir',type=str,default=None,
+                        help='Offline batch mode (needs --llm_cache): export uncached SGLang requests per stage to <dir>/<stage>.jsonl, '
+                             'ingest completions with culturalbench\'s python -m tools.batch_jobs, then re-run.')
     
     args = parser.parse_args()
+    configure_batch_mode(args.llm_cache, args.batch_dir)
     
     get_model_mc_response(model_name=args.model,
                           model_cache_dir=args.model_cache_dir,
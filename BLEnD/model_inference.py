@@ -50,8 +50,24 @@ parser.add_argument('--use_persona',type=str2bool,default=True,
                     help='Whether to use persona for response generation. Default is True.')
 parser.add_argument('--use_reasoning',type=str2bool,default=True,
                     help='Whether to use reasoning for response generation. Default is True.')
+parser.add_argument('--endpoints_config',type=str,default=None,
+                    help='JSON file mapping SGLang models to replica base URLs (see culturalbench/tools/endpoints.py).')
+parser.add_argument('--adaptive_concurrency',type=str2bool,default=False,
+                    help='Gate SGLang requests per endpoint with the AIMD controller (see culturalbench/tools/adaptive_concurrency.py).')
+parser.add_argument('--max_concurrent',type=int,default=1,
+                    help='Starting requests in flight per SGLang endpoint for --adaptive_concurrency.')
+parser.add_argument('--llm_cache',type=str,default=None,
+                    help='SQLite LLM response cache for SGLang models (see culturalbench/tools/llm_cache.py).')
+parser.add_argument('--batch_dir',type=str,default=None,
+                    help='Offline batch mode (needs --llm_cache): export uncached SGLang requests per stage to <dir>/<stage>.jsonl, '
+                         'ingest completions with culturalbench\'s python -m tools.batch_jobs, then re-run.')
 
 args = parser.parse_args()
+if args.endpoints_config:
+    load_endpoints_config(args.endpoints_config)
+if args.adaptive_concurrency:
+    adaptive_concurrency.configure(args.max_concurrent)
+configure_batch_mode(args.llm_cache, args.batch_dir)
 
 def generate_response(model_name,model_path,tokenizer,model,language,country,q_df,q_col,id_col,output_dir,iteration=1, use_persona=True, use_reasoning=True):
     replace_country_flag = False
@@ -99,6 +115,7 @@ def generate_response(model_name,model_path,tokenizer,model,language,country,q_d
         write_csv_row([id_col,q_col,'prompt','response','iteration','persona','reasoning'],output_filename)
       
     pb = tqdm(q_df.iterrows(),desc=f"{model_name} (iter {iteration})",total=len(q_df))
+    deferred = 0
     for _,d in pb:
         q = d[q_col]
         guid = d[id_col]
@@ -125,87 +142,92 @@ def generate_response(model_name,model_path,tokenizer,model,language,country,q_d
                 "Output only the answer."
             )
 
-        # Generate or refine persona based on iteration
-        persona = None
-        if iteration == 1 and use_persona:
-            # First iteration: generate new persona
-            persona_prompt_formatted = persona_prompt_saq.format(country=country,q=q)
-            print("CHAT INPUT INITIAL PERSONA PROMPT (line 129)")
-            persona = get_model_response(model_name,persona_prompt_formatted,model,tokenizer,temperature=args.temperature,top_p=args.top_p,gpt_azure=args.gpt_azure)
-            print("CHAT OUTPUT INITIAL PERSONA (line 131)")
-        elif use_persona:
-            # Subsequent iterations: refine previous persona
-            prev_data = previous_iter_data.get(guid, {})
-            prev_persona = prev_data.get('persona', '')
-            prev_response = prev_data.get('response', '')
+        try:
+            # Generate or refine persona based on iteration
+            persona = None
+            if iteration == 1 and use_persona:
+                # First iteration: generate new persona
+                persona_prompt_formatted = persona_prompt_saq.format(country=country,q=q)
+                print("CHAT INPUT INITIAL PERSONA PROMPT (line 129)")
+                persona = get_model_response(model_name,persona_prompt_formatted,model,tokenizer,temperature=args.temperature,top_p=args.top_p,gpt_azure=args.gpt_azure,stage="saq_initial_persona")
+                print("CHAT OUTPUT INITIAL PERSONA (line 131)")
+            elif use_persona:
+                # Subsequent iterations: refine previous persona
+                prev_data = previous_iter_data.get(guid, {})
+                prev_persona = prev_data.get('persona', '')
+                prev_response = prev_data.get('response', '')
 
-            # Refine persona (include model's previous answer from previous iteration)
-            # Format the system prompt with language and pronoun
-            refine_system_prompt = persona_refine_prompt_saq.format(
-                language="English",
-                second_person_pronoun="You"
-            )
-            # Create user prompt with question, previous persona, and previous answer
-            refine_user_prompt = f"Question: {q}\n\nPrevious persona: {prev_persona}\n\n"
-            if prev_response and str(prev_response).strip():
-                refine_user_prompt += f"Model's previous answer (from previous iteration): {prev_response}\n\n"
-            refine_user_prompt += "Generate the improved persona:"
-            print("CHAT INPUT REFINE PERSONA PROMPT (line 149)")
-            refine_response = get_model_response(
-                model_name,
-                refine_user_prompt,
-                model,
-                tokenizer,
-                temperature=args.temperature,
-                top_p=args.top_p,
-                gpt_azure=args.gpt_azure,
-                system_message=refine_system_prompt
-            )
-            print("CHAT OUTPUT REFINED PERSONA (line 160)")
-            # Parse JSON response
-            try:
-                refine_result = json_repair.loads(refine_response)
-                if isinstance(refine_result, dict):
-                    persona = refine_result.get("revised_persona", prev_persona)
-                elif isinstance(refine_result, str):
-                    # Model returned persona directly as string, use it
-                    persona = refine_result.strip()
-                    if not persona or len(persona) < 10:
-                        # If too short, fallback to previous
+                # Refine persona (include model's previous answer from previous iteration)
+                # Format the system prompt with language and pronoun
+                refine_system_prompt = persona_refine_prompt_saq.format(
+                    language="English",
+                    second_person_pronoun="You"
+                )
+                # Create user prompt with question, previous persona, and previous answer
+                refine_user_prompt = f"Question: {q}\n\nPrevious persona: {prev_persona}\n\n"
+                if prev_response and str(prev_response).strip():
+                    refine_user_prompt += f"Model's previous answer (from previous iteration): {prev_response}\n\n"
+                refine_user_prompt += "Generate the improved persona:"
+                print("CHAT INPUT REFINE PERSONA PROMPT (line 149)")
+                refine_response = get_model_response(
+                    model_name,
+                    refine_user_prompt,
+                    model,
+                    tokenizer,
+                    temperature=args.temperature,
+                    top_p=args.top_p,
+                    gpt_azure=args.gpt_azure,
+                    system_message=refine_system_prompt,
+                    stage="saq_refine"
+                )
+                print("CHAT OUTPUT REFINED PERSONA (line 160)")
+                # Parse JSON response
+                try:
+                    refine_result = json_repair.loads(refine_response)
+                    if isinstance(refine_result, dict):
+                        persona = refine_result.get("revised_persona", prev_persona)
+                    elif isinstance(refine_result, str):
+                        # Model returned persona directly as string, use it
+                        persona = refine_result.strip()
+                        if not persona or len(persona) < 10:
+                            # If too short, fallback to previous
+                            persona = prev_persona
+                    else:
+                        # Unexpected type, fallback
+                        persona = prev_persona
+                except Exception as e:
+                    print(f"Error parsing refinement response for {guid}: {e}")
+                    print(f"Response: {refine_response[:200]}...")  # Print first 200 chars
+                    # Try to extract persona if it looks like plain text
+                    refine_response_clean = refine_response.strip()
+                    if refine_response_clean.startswith("You are") and len(refine_response_clean) > 20:
+                        # Looks like a persona, use it
+                        persona = refine_response_clean
+                    else:
+                        # Fallback to previous persona if parsing fails
                         persona = prev_persona
-                else:
-                    # Unexpected type, fallback
-                    persona = prev_persona
-            except Exception as e:
-                print(f"Error parsing refinement response for {guid}: {e}")
-                print(f"Response: {refine_response[:200]}...")  # Print first 200 chars
-                # Try to extract persona if it looks like plain text
-                refine_response_clean = refine_response.strip()
-                if refine_response_clean.startswith("You are") and len(refine_response_clean) > 20:
-                    # Looks like a persona, use it
-                    persona = refine_response_clean
-                else:
-                    # Fallback to previous persona if parsing fails
-                    persona = prev_persona
 
-        # Use persona as system_message when generating response
-        print("CHAT INPUT SEL_OP PROMPT WITH REFINED PERSONA (line 188)")
-        response = get_model_response(model_name,prompt,model,tokenizer,temperature=args.temperature,top_p=args.top_p,gpt_azure=args.gpt_azure,system_message=persona)
-        print("CHAT OUTPUT NEW ANSWER WITH REFINED PERSONA (line 190)")
-        print(response)
+            # Use persona as system_message when generating response
+            print("CHAT INPUT SEL_OP PROMPT WITH REFINED PERSONA (line 188)")
+            response = get_model_response(model_name,prompt,model,tokenizer,temperature=args.temperature,top_p=args.top_p,gpt_azure=args.gpt_azure,system_message=persona,stage="saq_answer")
+            print("CHAT OUTPUT NEW ANSWER WITH REFINED PERSONA (line 190)")
+            print(response)
         
-        # Extract reasoning from JSON response (if available)
-        reasoning = ""
-        try:
-            json_res = get_json_str(response)
-            if isinstance(json_res, dict) and 'reasoning' in json_res:
-                reasoning = str(json_res['reasoning'])
-        except:
-            pass  # If parsing fails, leave reasoning empty
+            # Extract reasoning from JSON response (if available)
+            reasoning = ""
+            try:
+                json_res = get_json_str(response)
+                if isinstance(json_res, dict) and 'reasoning' in json_res:
+                    reasoning = str(json_res['reasoning'])
+            except:
+                pass  # If parsing fails, leave reasoning empty
         
-        write_csv_row([guid,q,prompt,response,iteration,persona,reasoning],output_filename)
+            write_csv_row([guid,q,prompt,response,iteration,persona,reasoning],output_filename)
+        except batch_jobs.BatchDeferred:
+            deferred += 1  # waits on the batch; answered on the re-run
         
     del guid_list
+    return deferred
             
 def get_response_from_all():
     models = args.model
@@ -266,13 +288,18 @@ def get_response_from_all():
             print(f"Starting Iteration {iteration}/{args.num_iterations}")
             print(f"{'='*60}\n")
             
+            deferred = 0
             if isinstance(languages,str):
                 questions = get_questions(languages,countries)
-                generate_response(model_name,model_path,tokenizer,model,languages,countries,questions,question_col,id_col,output_dir,iteration=iteration,use_persona=use_persona,use_reasoning=use_reasoning)
+                deferred += generate_response(model_name,model_path,tokenizer,model,languages,countries,questions,question_col,id_col,output_dir,iteration=iteration,use_persona=use_persona,use_reasoning=use_reasoning)
             else:
                 for l,c in zip(languages,countries):
                     questions = get_questions(l,c)
-                    generate_response(model_name,model_path,tokenizer,model,l,c,questions,question_col,id_col,output_dir,iteration=iteration,use_persona=use_persona,use_reasoning=use_reasoning)
+                    deferred += generate_response(model_name,model_path,tokenizer,model,l,c,questions,question_col,id_col,output_dir,iteration=iteration,use_persona=use_persona,use_reasoning=use_reasoning)
+            if deferred:
+                # the next iteration refines this one's personas: wait for the batch
+                batch_jobs.print_pending(f"{deferred} question(s) in iteration {iteration} of {model_name}", "re-run the same command")
+                break
         
     if isinstance(models,str):
        generate_response_per_model(models,use_persona=use_persona,use_reasoning=use_reasoning)
@@ -282,4 +309,7 @@ def get_response_from_all():
 
  
 if __name__ == "__main__":
-    get_response_from_all()    
\ No newline at end of file
+    get_response_from_all()
+    print_limiter_stats()
+    print_endpoint_stats()
+    adaptive_concurrency.print_concurrency_stats()    
\ No newline at end of file
@@ -21,6 +21,18 @@ import openai
 from openai import AzureOpenAI,OpenAI
 from typing import Union
 
+# Shared SGLang client pool and per-endpoint rate limiter live in culturalbench/tools
+_CULTURALBENCH_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'culturalbench')
+if _CULTURALBENCH_DIR not in sys.path:
+    sys.path.append(_CULTURALBENCH_DIR)
+from tools.sglang_client import get_sync_client
+from tools.rate_limiter import call_with_retries, print_limiter_stats
+from tools.endpoints import get_pool, load_endpoints_config, print_endpoint_stats
+from tools import adaptive_concurrency
+from tools.adaptive_concurrency import endpoint_slot_sync
+from tools import llm_cache
+from tools import batch_jobs
+
 
 MODEL_PATHS = {
     "gpt-3.5-turbo-0125":"gpt-3.5-turbo-0125",
@@ -269,9 +281,14 @@ def get_sglang_response(
     max_try=10,
     dialogue_history=None,
     system_message=None,
-    base_url=None
+    base_url=None,
+    stage=None
 ):
-    """Get response from SGLang server using OpenAI-compatible API."""
+    """Get response from SGLang server using OpenAI-compatible API.
+
+    Served from the LLM cache when one is configured; in batch mode a miss is exported
+    to the stage's batch file and raises BatchDeferred (see culturalbench/tools/batch_jobs.py).
+    """
     if base_url is None:
         if (
             'qwen3.5' in model_name.lower()
@@ -287,56 +304,60 @@ def get_sglang_response(
             base_url = SGLANG_BASE_URL_QWEN3_14B
         else:
             base_url = SGLANG_BASE_URL_LLAMA
-    client = OpenAI(
-        base_url=base_url,
-        api_key="EMPTY"
+    # replicas from the endpoints config if the model is listed there, else the URL above
+    pool = get_pool(model_name, fallback_urls=[base_url])
+
+    messages = []
+    if system_message:
+        messages.append({"role": "system", "content": system_message})
+    messages.append({"role": "user", "content": text})
+
+    kwargs = dict(
+        model=model_name,
+        messages=messages,
+        temperature=temperature,
+        top_p=top_p,
+        max_tokens=max_tokens,
     )
-    
-    n_try = 0
-    while True:
-        if n_try == max_try:
-            response = None
-            break
-        try:
-            time.sleep(0.5)
-            messages = []
-            if system_message:
-                messages.append({"role": "system", "content": system_message})
-            messages.append({"role": "user", "content": text})
-            
-            kwargs = dict(
-                model=model_name,
-                messages=messages,
-                temperature=temperature,
-                top_p=top_p,
-                max_tokens=max_tokens,
-            )
-            if "qwen3" in model_name.lower():
-                kwargs["extra_body"] = {
-                    "chat_template_kwargs": {
-                        "enable_thinking": False
-                    }
-                }
+    if "qwen3" in model_name.lower():
+        kwargs["extra_body"] = {
+            "chat_template_kwargs": {
+                "enable_thinking": False
+            }
+        }
+
+    cached = llm_cache.lookup(kwargs)
+    if cached is not None:
+        return _strip_think_block(cached) if "qwen3" in model_name.lower() else cached
+    if batch_jobs.is_enabled():
+        batch_jobs.defer(kwargs, stage)
+
+    def _create(client, replica_url):
+        with endpoint_slot_sync(replica_url):
             response = client.chat.completions.create(**kwargs)
-        
-            response = response.choices[0].message.content.strip()
-            if "qwen3" in model_name.lower():
-                response = _strip_think_block(response)
-            break
-        except KeyboardInterrupt:
-            raise Exception("KeyboardInterrupted!")
-        except Exception as e:
-            try:
-                print(response)
-            except Exception:
-                pass
-            print(f"SGLang exception (base_url={base_url or 'default'}, model={model_name}): {e}")
-            print("Sleep for 10 sec, then retry...")
-            time.sleep(10)
-            n_try += 1
-            continue
-            
-    return response
+        response = response.choices[0].message.content.strip()
+        llm_cache.store(kwargs, response)
+        if "qwen3" in model_name.lower():
+            response = _strip_think_block(response)
+        return response
+
+    tried = []
+    try:
+        for _ in pool.replicas:
+            with pool.lease(exclude=tried) as replica_url:
+                client = get_sync_client(replica_url)
+                response = call_with_retries(
+                    replica_url,
+                    lambda: _create(client, replica_url),
+                    label=f"SGLang (model={model_name}): ",
+                    max_tries=max_try,
+                )
+            if response is not None:
+                return response
+            tried.append(replica_url)
+    except KeyboardInterrupt:
+        raise Exception("KeyboardInterrupted!")
+    return None
     
 def get_cohere_response(
     text,
@@ -929,7 +950,21 @@ def get_palm2_response(prompt,model_name,
         return response.safety_attributes
     return res.strip()  
 
-def get_model_response(model_name,prompt,model,tokenizer,temperature,top_p,gpt_azure,system_message=None,max_tokens=None):
+def configure_batch_mode(llm_cache_path=None, batch_dir=None):
+    """LLM cache and offline batch mode for SGLang models (see culturalbench/tools/batch_jobs.py).
+
+    In batch mode uncached requests are exported to batch_dir/<stage>.jsonl instead of sent;
+    questions waiting on them are skipped and picked up when the script is re-run after
+    the completions have been ingested into the cache.
+    """
+    llm_cache.configure(llm_cache_path)
+    if batch_dir:
+        if llm_cache.get_cache() is None:
+            print("ERROR: --batch_dir needs --llm_cache (ingested completions are served from it)")
+            exit()
+        batch_jobs.configure(batch_dir)
+
+def get_model_response(model_name,prompt,model,tokenizer,temperature,top_p,gpt_azure,system_message=None,max_tokens=None,stage=None):
     _max = max_tokens if max_tokens is not None else 512
 
     if gpt_azure:
@@ -957,7 +992,7 @@ def get_model_response(model_name,prompt,model,tokenizer,temperature,top_p,gpt_a
             prompt = f"{system_message}\n\n{prompt}"
         response = get_cohere_response(prompt,model_name=model_name,temperature=temperature,top_p=top_p,max_tokens=_max)
     elif 'llama-3-8b-instruct' in model_name:
-        response = get_sglang_response(prompt,model_name=MODEL_PATHS[model_name],temperature=temperature,top_p=top_p,system_message=system_message,max_tokens=_max)
+        response = get_sglang_response(prompt,model_name=MODEL_PATHS[model_name],temperature=temperature,top_p=top_p,system_message=system_message,max_tokens=_max,stage=stage)
     elif (
         'qwen3.5' in model_name.lower()
         or '35b-a3b' in model_name.lower()
@@ -967,9 +1002,9 @@ def get_model_response(model_name,prompt,model,tokenizer,temperature,top_p,gpt_a
         or 'gemma-3-12b' in model_name.lower()
         or 'google/gemma-3-12b-it' in model_name.lower()
     ):
-        response = get_sglang_response(prompt,model_name=MODEL_PATHS.get(model_name, model_name),temperature=temperature,top_p=top_p,system_message=system_message,max_tokens=_max,base_url=SGLANG_BASE_URL_GEMMA3_12B)
+        response = get_sglang_response(prompt,model_name=MODEL_PATHS.get(model_name, model_name),temperature=temperature,top_p=top_p,system_message=system_message,max_tokens=_max,base_url=SGLANG_BASE_URL_GEMMA3_12B,stage=stage)
     elif 'qwen3-14b' in model_name:
-        response = get_sglang_response(prompt,model_name=MODEL_PATHS[model_name],temperature=temperature,top_p=top_p,system_message=system_message,max_tokens=_max,base_url=SGLANG_BASE_URL_QWEN3_14B)
+        response = get_sglang_response(prompt,model_name=MODEL_PATHS[model_name],temperature=temperature,top_p=top_p,system_message=system_message,max_tokens=_max,base_url=SGLANG_BASE_URL_QWEN3_14B,stage=stage)
     elif 'Qwen' in model_name:
         response = get_together_response(prompt,model_name=model_name,temperature=temperature,top_p=top_p,system_message=system_message,max_tokens=_max)
     else:
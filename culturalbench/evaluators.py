@@ -4,12 +4,13 @@ import asyncio
 import os
 from datasets import load_dataset
 from tqdm.auto import tqdm
-from persona_generator import generate_persona_description, cap
+from persona_generator import generate_persona_description, cap, shared_prefixes
 from tools.utils import country_to_language
 from tools.llm_utils import (
     get_llm,
     generate_text_funcs,
     async_generate,
+    generate_batch,
     GEMMA3_12B_SGLANG_MODEL_ID,
     LEGACY_QWEN3_06B_SGLANG_MODEL_ID,
     LEGACY_MISTRAL_SGLANG_MODEL_ID,
@@ -19,6 +20,11 @@ from tools import llm_utils
 from tools.db.db_utils import save_results, save_accuracy
 from tools.memory import get_memory_store
 from tools.response_utils import parse_easy_answer, parse_hard_answer
+from tools.structured_output import record_attempts
+from tools import telemetry
+from tools import deadlines
+from tools import batch_jobs
+from tools import warmup
 import json_repair
 from token_counter import add_input_tokens, add_output_tokens, get_model_folder
 
@@ -50,17 +56,25 @@ async def _process_hard_set(i, ds, mode, difficulty, sem):
         if not is_valid_set(ds, i):
             return None
 
-        isCorrect = True
-        cur_set_data = []
-        persona_description = None
-        pretranslated = None
-        persona_refine_reasoning = None
+        rows = [ds[i + j] for j in range(4)]
 
-        for j in range(4):
-            cur_row = ds[i + j]
+        # use same persona description for same question (4 at a time)
+        pretranslated, translated, persona_refine_reasoning = await generate_persona_description(
+            rows[0]["prompt_question"], rows[0]["country"], mode, difficulty,
+        )
+        if "l2e" in mode or "e2l" in mode:
+            persona_description = translated
+        else:
+            persona_description = pretranslated
+        if persona_description is None:
+            return None
+
+        # Qwen3-4B reasons in the target language inside <think> in ling modes; a schema would forbid it
+        use_think = "ling" in mode and llm_utils.MODEL_NAME == "Qwen/Qwen3-4B"
+        chat_inputs = []
+        for cur_row in rows:
             prompt_question = cur_row["prompt_question"]
             prompt_option = cur_row["prompt_option"]
-            prompt_answer = cur_row["answer"]
             country = cur_row["country"]
 
             if "eng" in mode or "e2l" in mode:
@@ -68,20 +82,8 @@ async def _process_hard_set(i, ds, mode, difficulty, sem):
             else:
                 language = country_to_language[cap(country)].capitalize()
 
-            # use same persona description for same question (4 at a time)
-            if j == 0:
-                pretranslated, translated, persona_refine_reasoning = await generate_persona_description(
-                    prompt_question, country, mode, difficulty,
-                )
-                if "l2e" in mode or "e2l" in mode:
-                    persona_description = translated
-                else:
-                    persona_description = pretranslated
-                if persona_description is None:
-                    return None
-
             thinking_instruction = ""
-            if "ling" in mode and llm_utils.MODEL_NAME == "Qwen/Qwen3-4B":
+            if use_think:
                 thinking_instruction = f"You MUST write internal reasoning inside <think>...</think> in {language}. If any part of <think>...</think> is not {language}, regenerate the reasoning.\n\n"
 
             chat_input = [
@@ -101,54 +103,78 @@ async def _process_hard_set(i, ds, mode, difficulty, sem):
                     f"Answer: {prompt_option}"
                 )}
             ]
-
             add_input_tokens(difficulty, mode, chat_input)
-            llm_instance = get_llm()
-            parsed_tf = None
-            thinking_content = None
-            response = ""
-            for attempt in range(3):
-                thinking_content, response = await async_generate(
-                    llm_instance, chat_input, enable_thinking_bool=False
+            chat_inputs.append(chat_input)
+
+        def _judge(j, output, attempt):
+            thinking_content, response = output
+            parsed[j] = parse_hard_answer(response)
+            if parsed[j]:
+                thinking_contents[j] = thinking_content
+                out_text = (thinking_content or "") + "\n" + (response or "")
+                add_output_tokens(difficulty, mode, out_text)
+                return parsed[j]
+            preview = (response or "")[:300]
+            if not (response or "").strip():
+                print(
+                    f"Error: empty model response set {i//4} opt {j} "
+                    f"(attempt {attempt + 1}/3). Is SGLang running?"
+                )
+            else:
+                print(
+                    f"Error parsing T/F JSON set {i//4} opt {j} "
+                    f"(attempt {attempt + 1}/3): {preview!r}"
                 )
-                parsed_tf = parse_hard_answer(response)
-                if parsed_tf:
-                    out_text = (thinking_content or "") + "\n" + (response or "")
-                    add_output_tokens(difficulty, mode, out_text)
-                    break
-                preview = (response or "")[:300]
-                if not (response or "").strip():
-                    print(
-                        f"Error: empty model response set {i//4} opt {j} "
-                        f"(attempt {attempt + 1}/3). Is SGLang running?"
-                    )
-                else:
-                    print(
-                        f"Error parsing T/F JSON set {i//4} opt {j} "
-                        f"(attempt {attempt + 1}/3): {preview!r}"
-                    )
-
-            if not parsed_tf:
-                return None
-
-            thinks_correct, reasoning = parsed_tf
+            # out of attempts: the set fails, so the options still running are cancelled
+            return None if attempt == 2 else False
+
+        # all four options go out as one batch; only options that failed to parse are re-sent
+        llm_instance = get_llm()
+        parsed = [None] * 4
+        thinking_contents = [None] * 4
+        pending = list(range(4))
+        attempts = [0] * 4
+        for attempt in range(3):
+            sent = pending
+            for j in sent:
+                attempts[j] += 1
+            await generate_batch(
+                llm_instance, [chat_inputs[j] for j in sent],
+                check=lambda k, output: _judge(sent[k], output, attempt),
+                enable_thinking_bool=False, stop_field="correct", stage="answer_hard",
+                schema=None if use_think else "answer_hard",
+            )
+            pending = [j for j in sent if not parsed[j]]
+            if not pending:
+                break
+
+        for j in range(4):
+            record_attempts("answer_hard", attempts[j], j not in pending)
+        if pending:
+            return None
+
+        isCorrect = True
+        cur_set_data = []
+        for j, cur_row in enumerate(rows):
+            thinks_correct, reasoning = parsed[j]
+            prompt_answer = cur_row["answer"]
 
             item_data = {
-                "question": prompt_question,
-                "prompt_option": prompt_option,
+                "question": cur_row["prompt_question"],
+                "prompt_option": cur_row["prompt_option"],
                 "persona_description": persona_description,
                 "refine_reasoning": persona_refine_reasoning or "",
                 "correct_answer": prompt_answer,
                 "model_answer": thinks_correct,
                 "reasoning": reasoning,
-                "country": country,
+                "country": cur_row["country"],
                 "iteration": 1
             }
 
             if "l2e" in mode or "e2l" in mode:
                 item_data["pretranslated_persona"] = pretranslated
-            if thinking_content is not None:
-                item_data["thinking_content"] = thinking_content
+            if thinking_contents[j] is not None:
+                item_data["thinking_content"] = thinking_contents[j]
 
             cur_set_data.append(item_data)
 
@@ -165,17 +191,25 @@ async def _process_hard_set(i, ds, mode, difficulty, sem):
 
 
 async def evaluate_hard_initial(ds, mode, difficulty="Hard"):
-    sem = asyncio.Semaphore(llm_utils.MAX_CONCURRENT)
+    sem = llm_utils.question_semaphore()
     set_indices = [i for i in range(0, len(ds), 4)]
 
-    tasks = [_process_hard_set(i, ds, mode, difficulty, sem) for i in set_indices]
     results = []
-    for coro in tqdm(asyncio.as_completed(tasks), total=len(tasks), desc="Initial eval (Hard)", unit="set"):
-        results.append(await coro)
+    with deadlines.scope(llm_utils.ITERATION_BUDGET):
+        tasks = [deadlines.bounded(batch_jobs.deferrable(_process_hard_set(i, ds, mode, difficulty, sem))) for i in set_indices]
+        for coro in tqdm(asyncio.as_completed(tasks), total=len(tasks), desc="Initial eval (Hard)", unit="set"):
+            results.append(await coro)
 
     data = {}
-    correct = total = 0
+    correct = total = overdue = deferred = 0
     for r in results:
+        if r is deadlines.OVERDUE:
+            overdue += 1
+            total += 1
+            continue
+        if r is batch_jobs.DEFERRED:
+            deferred += 1
+            continue
         if r is None:
             continue
         set_data, is_correct = r
@@ -184,6 +218,8 @@ async def evaluate_hard_initial(ds, mode, difficulty="Hard"):
             correct += 1
         total += 1
 
+    batch_jobs.raise_if_deferred(deferred, "iteration 1")
+    deadlines.report_overdue(overdue, "iteration 1")
     return data, correct, total
 
 
@@ -243,7 +279,8 @@ async def _process_easy_one(i, cur_row, mode, difficulty, sem):
         response = ""
         for attempt in range(3):
             thinking_content, response = await async_generate(
-                llm_instance, chat_input, enable_thinking_bool=False
+                llm_instance, chat_input, enable_thinking_bool=False,
+                stop_field="answer", stage="answer_easy", schema="answer_easy",
             )
             parsed = parse_easy_answer(response)
             if parsed:
@@ -256,6 +293,7 @@ async def _process_easy_one(i, cur_row, mode, difficulty, sem):
             else:
                 print(f"Error parsing answer JSON (attempt {attempt + 1}/3): {preview!r}")
 
+        record_attempts("answer_easy", attempt + 1, bool(parsed))
         if not parsed:
             return None
 
@@ -284,17 +322,25 @@ async def _process_easy_one(i, cur_row, mode, difficulty, sem):
 
 
 async def evaluate_easy_initial(ds, mode, difficulty="Easy"):
-    sem = asyncio.Semaphore(llm_utils.MAX_CONCURRENT)
+    sem = llm_utils.question_semaphore()
     n_questions = len(ds)
 
-    tasks = [_process_easy_one(i, ds[i], mode, difficulty, sem) for i in range(n_questions)]
     results = []
-    for coro in tqdm(asyncio.as_completed(tasks), total=len(tasks), desc="Initial eval (Easy)", unit="q"):
-        results.append(await coro)
+    with deadlines.scope(llm_utils.ITERATION_BUDGET):
+        tasks = [deadlines.bounded(batch_jobs.deferrable(_process_easy_one(i, ds[i], mode, difficulty, sem))) for i in range(n_questions)]
+        for coro in tqdm(asyncio.as_completed(tasks), total=len(tasks), desc="Initial eval (Easy)", unit="q"):
+            results.append(await coro)
 
     data = {}
-    correct = total = 0
+    correct = total = overdue = deferred = 0
     for r in results:
+        if r is deadlines.OVERDUE:
+            overdue += 1
+            total += 1
+            continue
+        if r is batch_jobs.DEFERRED:
+            deferred += 1
+            continue
         if r is None:
             continue
         idx, item_data, is_correct = r
@@ -303,6 +349,8 @@ async def evaluate_easy_initial(ds, mode, difficulty="Easy"):
             correct += 1
         total += 1
 
+    batch_jobs.raise_if_deferred(deferred, "iteration 1")
+    deadlines.report_overdue(overdue, "iteration 1")
     return data, correct, total
 
 
@@ -319,8 +367,14 @@ async def run_initial_eval(difficulty, mode, custom=None, max_questions=None, us
     Returns:
         Tuple of (accuracy, db_path)
     """
+    telemetry.set_iteration(1)
+    # warm servers, embedder and tokenizer while the dataset loads (no-op if iterate.py already did)
+    warm = asyncio.ensure_future(warmup.warm_up(
+        shared_prefixes(mode, difficulty, use_memory=use_memory), embedder=use_memory and mode == "eng"
+    ))
     print(f"Loading CulturalBench dataset ({difficulty})...")
-    ds = load_dataset("kellycyy/CulturalBench", f"CulturalBench-{difficulty}", split="test")
+    ds = await asyncio.to_thread(load_dataset, "kellycyy/CulturalBench", f"CulturalBench-{difficulty}", split="test")
+    await warm
     if max_questions is not None and max_questions > 0:
         if difficulty == "Hard":
             n_rows = min(max_questions * 4, len(ds))
@@ -356,6 +410,7 @@ async def run_initial_eval(difficulty, mode, custom=None, max_questions=None, us
         db_path += f"_{custom}"
     db_path += ".db"
     os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    telemetry.attach(db_path)
 
     save_results(db_path, data, difficulty, mode)
 
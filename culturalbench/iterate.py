@@ -5,8 +5,26 @@ import asyncio
 import os
 from evaluators import run_initial_eval
 from iteration_runner import run_iterations
+from persona_generator import shared_prefixes
 from tools.llm_utils import cleanup
-from tools.db.db_utils import load_results, get_all_iterations
+from tools.sglang_client import aclose_clients
+from tools.rate_limiter import print_limiter_stats
+from tools import llm_cache
+from tools.prefix_scheduler import PrefixScheduler, print_prefix_cache_stats
+from tools.endpoints import load_endpoints_config, print_endpoint_stats
+from tools.streaming import get_stream_stats, print_stream_stats
+from tools.structured_output import get_retry_stats, print_retry_stats
+from tools import adaptive_concurrency
+from tools import telemetry
+from tools import singleflight
+from tools import token_budget
+from tools import warmup
+from tools import batch_jobs
+from tools import stage_pipeline
+from tools.hedging import HedgePolicy, DEFAULT_MAX_EXTRA
+from tools.convergence import ConvergencePolicy
+from tools.max_tokens import MaxTokensPolicy, DEFAULT_MARGIN, WINDOW as MAX_TOKENS_WINDOW
+from tools.db.db_utils import load_results, get_all_iterations, get_completed_iterations
 from token_counter import write_to_json, get_totals, reset
 import tools.llm_utils
 from tools import llm_utils
@@ -53,6 +71,32 @@ def calculate_accuracy_from_db(db_path, iteration, difficulty, mode):
     
     return correct / total if total > 0 else 0
 
+def run_stats(args, convergence):
+    """(name in the token-count JSON, get_stats, print_stats or None) of every optimization this run used."""
+    sources = [
+        ("llm_cache", llm_cache.get_stats, llm_cache.print_stats),
+        ("stream_early_stop", get_stream_stats, print_stream_stats),
+        ("parse_retries", get_retry_stats, print_retry_stats),
+    ]
+    if args.singleflight:
+        sources.append(("singleflight", singleflight.get_stats, singleflight.print_stats))
+    for name, policy in (
+        ("hedging", tools.llm_utils.HEDGE_POLICY),
+        ("adaptive_max_tokens", tools.llm_utils.MAX_TOKENS_POLICY),
+    ):
+        if policy is not None:
+            sources.append((name, policy.get_stats, policy.print_stats))
+    sources += [
+        ("adaptive_concurrency", adaptive_concurrency.get_concurrency_stats, adaptive_concurrency.print_concurrency_stats),
+        ("token_budget", token_budget.get_budget_stats, token_budget.print_budget_stats),
+        ("stage_pipeline", stage_pipeline.get_stats, stage_pipeline.print_stats),
+    ]
+    if convergence is not None:
+        sources.append(("convergence", convergence.get_stats, convergence.print_stats))
+    sources.append(("warmup", warmup.get_timings, None))
+    return sources
+
+
 async def main():
     """Main async function to run evaluation and iterations."""
     parser = argparse.ArgumentParser(description="Run initial evaluation and iterations")
@@ -82,6 +126,19 @@ async def main():
         default="Qwen/Qwen3-32B",
         help="Model to load for steering (must have pre-computed axis). Default: Qwen/Qwen3-32B.",
     )
+    parser.add_argument(
+        "--steering_batch_size",
+        type=int,
+        default=1,
+        help="Micro-batch up to this many concurrent steering generations (use with --max_concurrent > 1). Default 1 = one at a time.",
+    )
+    parser.add_argument(
+        "--steering_shared_prefix",
+        action="store_true",
+        default=False,
+        help="Hard mode with steering: prefill the four options' shared prompt prefix once and reuse its KV cache "
+             "(all steering calls then run on the batching worker, with --steering_batch_size as its batch size)",
+    )
     parser.add_argument(
         "--max_concurrent",
         type=int,
@@ -100,15 +157,195 @@ async def main():
         default=False,
         help="Disable long-term memory retrieval (enabled by default for eng mode)",
     )
+    parser.add_argument(
+        "--question_chains",
+        action="store_true",
+        default=False,
+        help="Without memory (--no-memory or a non-eng mode): run each question through iterations 2..N on its own, "
+             "streaming rows to the DB and saving per-iteration accuracies at the end, instead of waiting for every "
+             "question at each iteration",
+    )
+    parser.add_argument(
+        "--converge_after",
+        type=int,
+        default=None,
+        metavar="K",
+        help="Carry a question (Hard: a set) forward without LLM calls once it was correct in K consecutive "
+             "iterations; its rows are copied with carried_forward=1 (off by default)",
+    )
     parser.add_argument(
         "--debug-memory",
         action="store_true",
         default=False,
         help="Print retrieved memory summaries for each question",
     )
+    parser.add_argument(
+        "--endpoints_config",
+        type=str,
+        default=None,
+        help="JSON file mapping models to SGLang replica base URLs (see tools/endpoints.py)",
+    )
+    parser.add_argument(
+        "--adaptive_concurrency",
+        action="store_true",
+        default=False,
+        help="Tune requests in flight per SGLang endpoint with AIMD, starting from --max_concurrent",
+    )
+    parser.add_argument(
+        "--max_concurrent_cap",
+        type=int,
+        default=adaptive_concurrency.DEFAULT_MAX_LIMIT,
+        help="With --adaptive_concurrency: upper bound on requests in flight per endpoint",
+    )
+    parser.add_argument(
+        "--prefix_scheduling",
+        action="store_true",
+        default=False,
+        help="Group in-flight requests by shared prefix (persona / refine template) for SGLang's radix cache",
+    )
+    parser.add_argument(
+        "--prefix_lookahead",
+        type=int,
+        default=4,
+        help="With --prefix_scheduling: questions in progress per request slot, i.e. how many waiting requests the scheduler can reorder",
+    )
+    parser.add_argument(
+        "--stream_early_stop",
+        action="store_true",
+        default=False,
+        help="Stream answer prompts and close the stream once \"answer\"/\"correct\" is complete (answer reasoning becomes optional)",
+    )
+    parser.add_argument(
+        "--constrained_decoding",
+        action="store_true",
+        default=False,
+        help="Send JSON-schema response_format constraints for answer, refine and initial-persona prompts (SGLang grammar backend)",
+    )
+    parser.add_argument(
+        "--token_budget",
+        type=str,
+        default=None,
+        help="Admit requests per SGLang endpoint by estimated tokens in flight (prompt + max_tokens) instead of count: "
+             "a token count, or 'auto' for 90%% of the server's KV capacity. Pair with a high --max_concurrent",
+    )
+    parser.add_argument(
+        "--stage_pipeline",
+        action="store_true",
+        default=False,
+        help="Run refinement iterations as a stage pipeline: feedback, memory, refine, translate and answer each get "
+             "their own concurrency limit instead of one question slot held across the chain",
+    )
+    parser.add_argument(
+        "--stage_concurrency",
+        type=str,
+        default=None,
+        help="With --stage_pipeline: per-stage limits, e.g. 'feedback=16,refine=32,answer=64' "
+             "(unset stages use --max_concurrent, or the AIMD caps with --adaptive_concurrency)",
+    )
+    parser.add_argument(
+        "--llm_call_timeout",
+        type=float,
+        default=None,
+        help="Deadline in seconds for one LLM call including retries and fail-over; the HTTP request is cancelled when it runs out",
+    )
+    parser.add_argument(
+        "--iteration_budget",
+        type=float,
+        default=None,
+        help="Deadline in seconds per iteration; questions still running then are cancelled and counted as failed. "
+             "With --question_chains each question's step gets this budget from when the step starts",
+    )
+    parser.add_argument(
+        "--hedge_percentile",
+        type=float,
+        default=None,
+        help="Hedge requests slower than this latency percentile of their stage (e.g. 95) with a duplicate on another replica",
+    )
+    parser.add_argument(
+        "--hedge_max_extra",
+        type=float,
+        default=DEFAULT_MAX_EXTRA,
+        help="With --hedge_percentile: cap on duplicate requests as a fraction of all requests",
+    )
+    parser.add_argument(
+        "--adaptive_max_tokens",
+        type=float,
+        default=None,
+        help="Send each stage's output-length percentile (e.g. 99) times --max_tokens_margin as max_tokens; "
+             "responses cut by it are retried once with the full cap",
+    )
+    parser.add_argument(
+        "--max_tokens_margin",
+        type=float,
+        default=DEFAULT_MARGIN,
+        help="With --adaptive_max_tokens: multiplier on the observed length percentile",
+    )
+    parser.add_argument(
+        "--max_tokens_profile",
+        type=str,
+        default=None,
+        help="With --adaptive_max_tokens: results DB (or .telemetry.db) of earlier runs to seed output lengths from",
+    )
+    parser.add_argument(
+        "--singleflight",
+        action="store_true",
+        default=False,
+        help="Share one upstream call between identical requests in flight at the same time. Only reproducible "
+             "requests are shared: the SGLang models sample at temperature 0.6, so this needs --llm_cache",
+    )
+    parser.add_argument(
+        "--batch_dir",
+        type=str,
+        default=None,
+        help="Offline batch mode (requires --llm_cache): export each stage's uncached requests to <dir>/<stage>.jsonl "
+             "and stop; ingest completions with python -m tools.batch_jobs and re-run",
+    )
+    parser.add_argument(
+        "--no-warmup",
+        action="store_true",
+        default=False,
+        help="Skip the start-up warm-up (prefilling shared system prompts on every replica, loading the embedder and tokenizer)",
+    )
+    parser.add_argument(
+        "--no-telemetry",
+        action="store_true",
+        default=False,
+        help="Do not record per-request LLM telemetry (<results db>.telemetry.db; report with python -m tools.telemetry)",
+    )
+    parser.add_argument(
+        "--llm_cache",
+        type=str,
+        default=None,
+        help="Path to a SQLite LLM response cache (opt-in; identical requests are served from it on re-runs)",
+    )
+    parser.add_argument(
+        "--llm_cache_mode",
+        type=str,
+        default="readwrite",
+        choices=list(llm_cache.CACHE_MODES),
+        help="readwrite: serve hits and store misses; replay: serve hits only, never call the server",
+    )
+    parser.add_argument("--llm_cache_max_mb", type=float, default=llm_cache.DEFAULT_MAX_MB, help="LRU size budget for the LLM cache")
+    parser.add_argument("--llm_cache_max_age_days", type=float, default=None, help="Evict LLM cache entries older than this")
     args = parser.parse_args()
     use_memory = not args.no_memory
     debug_memory = args.debug_memory
+    if args.endpoints_config:
+        load_endpoints_config(args.endpoints_config)
+    telemetry.configure(enabled=not args.no_telemetry)
+    warmup.configure(enabled=not args.no_warmup)
+    llm_cache.configure(
+        args.llm_cache,
+        mode=args.llm_cache_mode,
+        max_mb=args.llm_cache_max_mb,
+        max_age_days=args.llm_cache_max_age_days,
+    )
+    if args.batch_dir:
+        if llm_cache.get_cache() is None or llm_cache.is_replay_only():
+            print("ERROR: --batch_dir needs --llm_cache in readwrite mode (ingested completions are served from it)")
+            return
+        batch_jobs.configure(args.batch_dir)
+        warmup.configure(enabled=False)  # nothing is sent interactively
 
     # Set concurrency (auto-downgrade for local GPU models)
     if args.max_concurrent > 1 and args.model in tools.llm_utils.LOCAL_MODELS:
@@ -116,12 +353,51 @@ async def main():
         tools.llm_utils.MAX_CONCURRENT = 1
     else:
         tools.llm_utils.MAX_CONCURRENT = args.max_concurrent
+    adaptive = args.adaptive_concurrency and tools.llm_utils.MAX_CONCURRENT > 1
+    if adaptive:
+        adaptive_concurrency.configure(tools.llm_utils.MAX_CONCURRENT, max_limit=args.max_concurrent_cap)
+    if args.prefix_scheduling and tools.llm_utils.MAX_CONCURRENT > 1:
+        # requests in flight stay at max_concurrent; more questions run so the scheduler has a window to group
+        tools.llm_utils.PREFIX_SCHEDULER = PrefixScheduler(
+            tools.llm_utils.endpoint_capacity if adaptive else tools.llm_utils.MAX_CONCURRENT
+        )
+        tools.llm_utils.MAX_CONCURRENT *= max(1, args.prefix_lookahead)
+        tools.llm_utils.QUESTION_HEADROOM = max(tools.llm_utils.QUESTION_HEADROOM, args.prefix_lookahead)
+    tools.llm_utils.STREAM_EARLY_STOP = args.stream_early_stop
+    tools.llm_utils.CONSTRAINED_DECODING = args.constrained_decoding
+    tools.llm_utils.SINGLEFLIGHT = args.singleflight
+    if args.singleflight and llm_cache.get_cache() is None:
+        print("WARNING: --singleflight only coalesces temperature-0 requests without --llm_cache; "
+              "the SGLang models sample at 0.6, so nothing will be shared")
+    tools.llm_utils.LLM_CALL_TIMEOUT = args.llm_call_timeout
+    if args.stage_pipeline:
+        try:
+            stage_pipeline.configure(stage_pipeline.parse_limits(args.stage_concurrency), tools.llm_utils.stage_capacity)
+        except ValueError as e:
+            print(f"ERROR: --stage_concurrency: {e}")
+            return
+    tools.llm_utils.ITERATION_BUDGET = args.iteration_budget
+    convergence = ConvergencePolicy(args.converge_after) if args.converge_after else None
+    if args.hedge_percentile is not None:
+        tools.llm_utils.HEDGE_POLICY = HedgePolicy(args.hedge_percentile, max_extra=args.hedge_max_extra)
+    if args.adaptive_max_tokens is not None:
+        policy = MaxTokensPolicy(args.adaptive_max_tokens, margin=args.max_tokens_margin)
+        if args.max_tokens_profile:
+            if os.path.exists(telemetry.telemetry_path(args.max_tokens_profile)):
+                lengths, _ = telemetry.output_lengths(args.max_tokens_profile, limit=MAX_TOKENS_WINDOW)
+                n = policy.seed(lengths)
+                print(f"Adaptive max_tokens: seeded {n} output lengths from {telemetry.telemetry_path(args.max_tokens_profile)}")
+            else:
+                print(f"Adaptive max_tokens: no telemetry at {telemetry.telemetry_path(args.max_tokens_profile)}; learning from this run")
+        tools.llm_utils.MAX_TOKENS_POLICY = policy
 
     # Assistant-axis steering: use steering model and set coefficient (positive=assistant, negative=persona)
     if args.steering_coefficient is not None:
         tools.llm_utils.MODEL_NAME = args.steering_model
         tools.llm_utils.STEERING_MODEL = args.steering_model
         tools.llm_utils.STEERING_COEFFICIENT = args.steering_coefficient
+        tools.llm_utils.STEERING_BATCH_SIZE = max(1, args.steering_batch_size)
+        tools.llm_utils.STEERING_SHARED_PREFIX = args.steering_shared_prefix
     elif args.model:
         tools.llm_utils.MODEL_NAME = args.model
     # use specified temperature (default is 0.0)
@@ -140,79 +416,106 @@ async def main():
     effective_model = tools.llm_utils.MODEL_NAME
     if args.steering_coefficient is None:
         tools.llm_utils.verify_sglang_model(effective_model)
+    if args.token_budget:
+        replicas = [] if args.steering_coefficient is not None else [
+            r.base_url for r in tools.llm_utils._sglang_pool(effective_model).replicas
+        ]
+        try:
+            token_budget.configure(
+                args.token_budget if args.token_budget == "auto" else int(args.token_budget), endpoints=replicas
+            )
+        except RuntimeError as e:
+            print(f"ERROR: {e}")
+            return
     print(f"Config: mode={args.mode} difficulty={difficulty} model={effective_model} temperature={args.temperature} num_iterations={args.num_iterations} memory={use_memory} debug_memory={debug_memory} steering_coefficient={args.steering_coefficient} max_concurrent={tools.llm_utils.MAX_CONCURRENT}")
     print(f"Resume: {args.resume}")
 
-    # track all accuracies
-    all_accuracies = []
+    await warmup.warm_up(
+        shared_prefixes(args.mode, difficulty, external=args.external, use_memory=use_memory),
+        embedder=use_memory and args.mode == "eng",
+    )
 
-    # run initial evaluation (if not resuming)
-    if not args.resume:
-        print("Running initial evaluation (iteration 1)...")
-        initial_accuracy, db_path = await run_initial_eval(
-            difficulty, args.mode, effective_custom, max_questions=args.max_questions, use_memory=use_memory
-        )
-        all_accuracies.append(initial_accuracy)
-    # calculate initial accuracy from database (if resuming)
-    else:
-        print(f"Resume: calculating initial accuracy from database")
-        model_to_save = {
-            "Qwen/Qwen3-4B": "qwen3_4b",
-            "meta-llama/Meta-Llama-3-8B-Instruct": "llama3_8b",
-            "Qwen/Qwen3-14B": "qwen3_14b",
-            tools.llm_utils.GEMMA3_12B_SGLANG_MODEL_ID: "gemma3_12b",
-            tools.llm_utils.LEGACY_QWEN3_06B_SGLANG_MODEL_ID: "gemma3_12b",
-            tools.llm_utils.LEGACY_MISTRAL_SGLANG_MODEL_ID: "gemma3_12b",
-            "Qwen/Qwen3.5-35B-A3B": "qwen3.5_35b",
-            "Qwen/Qwen3-32B": "qwen3_32b",
-            "google/gemma-2-27b-it": "gemma2_27b",
-            "meta-llama/Llama-3.3-70B-Instruct": "llama33_70b",
-            "zai-org/GLM-4-9B-0414": "glm4_9b",
-        }
-        from token_counter import get_model_folder
-        model_folder = get_model_folder(llm_utils.MODEL_NAME)
-        db_path = f"../results/{args.mode}/{model_folder}/{difficulty.lower()}_t{args.temperature}_{model_to_save[llm_utils.MODEL_NAME]}"
-        if effective_custom:
-            db_path += f"_{effective_custom}"
-        db_path += ".db"
-        all_accuracies.append(calculate_accuracy_from_db(db_path, 1, difficulty, args.mode))
-        if use_memory and args.mode == "eng":
-            import asyncio
-            from tools.memory import get_memory_store
-            asyncio.run(
-                get_memory_store(db_path, difficulty, args.mode, enabled=True).sync_from_sqlite_async()
+    try:
+        # track all accuracies
+        all_accuracies = []
+
+        # run initial evaluation (if not resuming)
+        if not args.resume:
+            print("Running initial evaluation (iteration 1)...")
+            initial_accuracy, db_path = await run_initial_eval(
+                difficulty, args.mode, effective_custom, max_questions=args.max_questions, use_memory=use_memory
             )
+            all_accuracies.append(initial_accuracy)
+        # calculate initial accuracy from database (if resuming)
+        else:
+            print(f"Resume: calculating initial accuracy from database")
+            model_to_save = {
+                "Qwen/Qwen3-4B": "qwen3_4b",
+                "meta-llama/Meta-Llama-3-8B-Instruct": "llama3_8b",
+                "Qwen/Qwen3-14B": "qwen3_14b",
+                tools.llm_utils.GEMMA3_12B_SGLANG_MODEL_ID: "gemma3_12b",
+                tools.llm_utils.LEGACY_QWEN3_06B_SGLANG_MODEL_ID: "gemma3_12b",
+                tools.llm_utils.LEGACY_MISTRAL_SGLANG_MODEL_ID: "gemma3_12b",
+                "Qwen/Qwen3.5-35B-A3B": "qwen3.5_35b",
+                "Qwen/Qwen3-32B": "qwen3_32b",
+                "google/gemma-2-27b-it": "gemma2_27b",
+                "meta-llama/Llama-3.3-70B-Instruct": "llama33_70b",
+                "zai-org/GLM-4-9B-0414": "glm4_9b",
+            }
+            from token_counter import get_model_folder
+            model_folder = get_model_folder(llm_utils.MODEL_NAME)
+            db_path = f"../results/{args.mode}/{model_folder}/{difficulty.lower()}_t{args.temperature}_{model_to_save[llm_utils.MODEL_NAME]}"
+            if effective_custom:
+                db_path += f"_{effective_custom}"
+            db_path += ".db"
+            all_accuracies.append(calculate_accuracy_from_db(db_path, 1, difficulty, args.mode))
+            telemetry.attach(db_path)
+            # the memory store is synced from the DB by run_iterations before the first resumed iteration
 
-    if args.resume:
-        # read last iteration from database
-        print(f"Resume: reading last iteration from database")
-        iterations = get_all_iterations(db_path, difficulty=difficulty, mode=args.mode)
-        last_iteration = max(iterations) if iterations else 1
-        start_iteration = last_iteration + 1
+        if args.resume:
+            # read last completed iteration from database; questions saved by an interrupted
+            # iteration after it are kept and skipped by run_iterations
+            print(f"Resume: reading last iteration from database")
+            iterations = get_completed_iterations(db_path, difficulty=difficulty, mode=args.mode)
+            last_iteration = max(iterations) if iterations else 1
+            start_iteration = last_iteration + 1
+            partial = [i for i in get_all_iterations(db_path, difficulty=difficulty, mode=args.mode) if i > last_iteration]
+            if partial:
+                print(f"Resume: iteration(s) {partial} were interrupted; continuing from their saved questions")
         
-        for i in range(2, start_iteration):
-            all_accuracies.append(calculate_accuracy_from_db(db_path, i, difficulty, args.mode))
-        print(f"Calculated accuracies up to iteration {last_iteration}")
-        print("Accuracies: " + str(all_accuracies))
-    else:
-        start_iteration = 2
+            for i in range(2, start_iteration):
+                all_accuracies.append(calculate_accuracy_from_db(db_path, i, difficulty, args.mode))
+            print(f"Calculated accuracies up to iteration {last_iteration}")
+            print("Accuracies: " + str(all_accuracies))
+        else:
+            start_iteration = 2
 
-    # run additional iterations
-    if args.num_iterations > 1:
-        iteration_accuracies = await run_iterations(
-            args.mode,
-            args.num_iterations,
-            difficulty,
-            db_path,
-            start_iteration,
-            args.external,
-            use_memory,
-            debug_memory,
-        )
-        all_accuracies.extend(iteration_accuracies)
-    else:
-        print("\nNo additional iterations to run (num_iterations = 1)")
+        # run additional iterations
+        if args.num_iterations > 1:
+            iteration_accuracies = await run_iterations(
+                args.mode,
+                args.num_iterations,
+                difficulty,
+                db_path,
+                start_iteration,
+                args.external,
+                use_memory,
+                debug_memory,
+                args.question_chains,
+                args.resume,
+                convergence,
+            )
+            all_accuracies.extend(iteration_accuracies)
+        else:
+            print("\nNo additional iterations to run (num_iterations = 1)")
     
+    except batch_jobs.BatchDeferred as e:
+        # every finished request replays from the LLM cache, so the same command continues the run
+        batch_jobs.print_pending(e, "re-run the same command")
+        telemetry.close()
+        await aclose_clients()
+        return
+
     print(f"\n=== Accuracy Summary for {difficulty} and {args.mode}===")
     for i, accuracy in enumerate(all_accuracies, start=1):
         summary_line = f"Persona Accuracy for {difficulty} - Iteration {i}: {accuracy:.4f}"
@@ -244,6 +547,20 @@ async def main():
                 print(f"  {k}: avg input_tokens={v['input_tokens']}, avg output_tokens={v['output_tokens']} (per question, n={v['num_questions']})")
             else:
                 print(f"  {k}: input_tokens={v['input_tokens']}, output_tokens={v['output_tokens']}")
+    for name, get_stats, print_stats in run_stats(args, convergence):
+        stats = get_stats()
+        if stats:
+            write_to_json(totals_dict={name: stats})
+            if print_stats is not None:
+                print_stats()
+    print_prefix_cache_stats(tools.llm_utils.PREFIX_SCHEDULER)
+    print_limiter_stats()
+    print_endpoint_stats()
+    if telemetry.is_enabled():
+        telemetry.flush()
+        telemetry.print_report(db_path, by=("stage",), run_id=telemetry.get_run_id())
+        telemetry.close()
+    await aclose_clients()
 
 if __name__ == "__main__":
     try:
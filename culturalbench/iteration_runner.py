@@ -5,10 +5,15 @@ import json
 from tqdm.auto import tqdm
 from persona_generator import generate_new_persona, cap
 from tools.utils import country_to_language
-from tools.llm_utils import get_llm, generate_text_funcs, async_generate, get_external_feedback
+from tools.llm_utils import get_llm, generate_text_funcs, async_generate, generate_batch, get_external_feedback
 from tools import llm_utils
-from tools.db.db_utils import save_results, save_accuracy, load_previous_iteration
+from tools.db.db_utils import save_accuracy, load_results, load_previous_iteration, clear_results, ResultsWriter
 from tools.memory import get_memory_store
+from tools.structured_output import record_attempts
+from tools import telemetry
+from tools import deadlines
+from tools import batch_jobs
+from tools import stage_pipeline
 from token_counter import add_input_tokens, add_output_tokens
 import json_repair
 
@@ -45,18 +50,220 @@ def _format_easy_options_and_answer(item):
     return "\n".join(lines).strip()
 
 
-def append_to_db(db_path, new_data, correct, total, iteration, difficulty, mode):
-    """Append iteration data to database."""
-    save_results(db_path, new_data, difficulty, mode)
+def _iteration_stages(mode, external, memory_store, is_translation_mode):
+    """{stage: model} of the steps an iteration's questions go through (for tools/stage_pipeline.py)."""
+    stages = {}
+    if external:
+        stages["feedback"] = llm_utils.EXTERNAL_FEEDBACK_MODEL
+    if memory_store:
+        stages["memory"] = None
+    stages["refine"] = llm_utils.MODEL_NAME
+    if is_translation_mode:
+        stages["translate"] = None
+    stages["answer"] = llm_utils.MODEL_NAME
+    return stages
+
+
+def _save_iteration_accuracy(db_path, correct, total, iteration, difficulty, mode):
+    """Write the iteration's accuracy row, which also marks the iteration complete (see --resume)."""
     accuracy = correct / total if total > 0 else 0
     save_accuracy(db_path, iteration, difficulty, mode, accuracy, correct, total)
     print(f"Iteration {iteration} Accuracy: {accuracy}")
     return accuracy
 
 
-async def _process_easy_iter_one(i, item, mode, cur_iteration, is_translation_mode, external, sem, memory_store=None):
+def _unit_size(difficulty):
+    return 1 if difficulty == "Easy" else 4
+
+
+def _unit_key(row):
+    return (row["question"], row["country"])
+
+
+def _unit_rows(data, i, difficulty):
+    return {i + j: data[i + j] for j in range(_unit_size(difficulty))}
+
+
+def _llm_calls_per_unit(difficulty, external):
+    """LLM calls one Easy question / Hard set makes per iteration: feedback, refine, answer(s)."""
+    return (1 if external else 0) + 1 + _unit_size(difficulty)
+
+
+def _saved_units(db_path, iteration, difficulty, mode):
+    """Rows an interrupted run already saved for iteration, per Easy question / Hard set:
+    {(question, country): [rows, ...]} (a set's 4 rows are inserted together, so they are contiguous)."""
+    rows = load_results(db_path, iteration=iteration, difficulty=difficulty, mode=mode)
+    size = _unit_size(difficulty)
+    saved = {}
+    for k in range(0, len(rows) - size + 1, size):
+        saved.setdefault(_unit_key(rows[k]), []).append(rows[k:k + size])
+    return saved
+
+
+def _take_saved(saved, data, i):
+    """The saved rows of the unit starting at data[i] as {index: row}, or None if it has to be run."""
+    groups = saved.get(_unit_key(data[i]))
+    if not groups:
+        return None
+    return {i + j: row for j, row in enumerate(groups.pop(0))}
+
+
+def _correct_streaks(db_path, iteration, k, difficulty, mode):
+    """{(question, country): iterations in a row, at most k, the unit was correct just before iteration}."""
+    streaks = {}
+    alive = None
+    for n, it in enumerate(range(iteration - 1, max(0, iteration - 1 - k), -1)):
+        correct = {
+            key for key, groups in _saved_units(db_path, it, difficulty, mode).items()
+            if _rows_correct(dict(enumerate(groups[0])), difficulty)
+        }
+        alive = correct if alive is None else alive & correct
+        for key in alive:
+            streaks[key] = n + 1
+    return streaks
+
+
+def _rows_correct(rows, difficulty):
+    if difficulty == "Easy":
+        (row,) = rows.values()
+        return str(row["model_answer"]).upper().strip() == str(row["correct_answer"]).upper().strip()
+    for row in rows.values():
+        expected = "true" if str(row["correct_answer"]).lower().strip() in ["1", "true"] else "false"
+        if str(row["model_answer"]).lower().strip() != expected:
+            return False
+    return True
+
+
+async def _run_iteration(data, units, step, cur_iteration, db_path, difficulty, mode, writer, convergence=None, calls=0):
+    """Run one iteration with a barrier: step(i, cur_iteration) for every unit (Easy question index /
+    Hard set start) not already saved by an interrupted run.
+
+    step returns (rows, is_correct) or None. Each unit's rows are appended to the DB through writer
+    (off the event loop) as soon as it finishes, so a crash loses only the questions in flight; the
+    accuracy row is written once every unit is done. With a convergence policy, stable units are
+    carried forward instead of run (calls: LLM calls a unit makes). Returns the iteration's accuracy.
+    """
+    saved = _saved_units(db_path, cur_iteration, difficulty, mode)
+    streaks = _correct_streaks(db_path, cur_iteration, convergence.after, difficulty, mode) if convergence else {}
+    correct = total = resumed = 0
+    overdue = deferred = 0
+    carried = {}
+    todo = []
+    for i in units:
+        rows = _take_saved(saved, data, i)
+        if rows is not None:
+            resumed += 1
+        elif convergence and convergence.is_stable(streaks.get(_unit_key(data[i]), 0)):
+            rows = convergence.carry(_unit_rows(data, i, difficulty), cur_iteration, calls)
+            carried.update(rows)
+        else:
+            todo.append(i)
+            continue
+        correct += int(_rows_correct(rows, difficulty))
+        total += 1
+    if resumed:
+        print(f"Resume: {resumed} question(s) of iteration {cur_iteration} already saved")
+    if carried:
+        await asyncio.to_thread(writer.append, carried)
+        print(f"Convergence: {len(carried) // _unit_size(difficulty)} stable question(s) carried forward to iteration {cur_iteration}")
+
+    unit = "q" if difficulty == "Easy" else "set"
+    with deadlines.scope(llm_utils.ITERATION_BUDGET):
+        tasks = [deadlines.bounded(batch_jobs.deferrable(step(i, cur_iteration))) for i in todo]
+        for coro in tqdm(asyncio.as_completed(tasks), total=len(tasks), desc=f"Iter {cur_iteration} ({difficulty})", unit=unit):
+            r = await coro
+            if r is deadlines.OVERDUE:
+                overdue += 1
+                total += 1
+                continue
+            if r is batch_jobs.DEFERRED:
+                deferred += 1
+                continue
+            if r is None:
+                continue
+            rows, is_correct = r
+            await asyncio.to_thread(writer.append, rows)
+            if is_correct:
+                correct += 1
+            total += 1
+
+    batch_jobs.raise_if_deferred(deferred, f"iteration {cur_iteration}")
+    deadlines.report_overdue(overdue, f"iteration {cur_iteration}")
+    return _save_iteration_accuracy(db_path, correct, total, cur_iteration, difficulty, mode)
+
+
+async def _run_chains(data, units, step, start_iteration, num_iterations, db_path, difficulty, mode, writer, convergence=None, calls=0):
+    """Barrier-free iterations: each unit (Easy question index / Hard set start) runs iterations
+    start_iteration..num_iterations on its own.
+
+    Without long-term memory a question's next iteration depends only on its own previous row,
+    so a chain moves on as soon as its step is done: rows are appended to the DB as they finish
+    (steps an interrupted run already saved are reused), data[idx] is replaced by the new row for
+    the next step, and per-iteration accuracies are saved once every chain has ended.
+    step(i, iteration) returns (rows, is_correct) or None; a chain stops at its first failure,
+    as the question drops out of later iterations with barriers too. With a convergence policy
+    a chain carries its unit forward once it is stable. Returns the accuracies of the iterations
+    run.
+
+    With --iteration_budget each step gets the budget from when it starts, so a question stuck in
+    one iteration cannot use up the time of its later ones (with barriers the budget is the
+    iteration's wall-clock window, shared by all its questions).
+    """
+    iterations = list(range(start_iteration, num_iterations + 1))
+    counts = {it: [0, 0] for it in iterations}  # correct, total
+    overdue = {it: 0 for it in iterations}
+    saved = {it: _saved_units(db_path, it, difficulty, mode) for it in iterations}
+    streaks = _correct_streaks(db_path, start_iteration, convergence.after, difficulty, mode) if convergence else {}
+    deferred = 0
+    pb = tqdm(total=len(units) * len(iterations), desc=f"Iter {iterations[0]}-{iterations[-1]} chains ({difficulty})", unit="step")
+
+    async def chain(i):
+        nonlocal deferred
+        streak = streaks.get(_unit_key(data[i]), 0)
+        for n, it in enumerate(iterations):
+            rows = _take_saved(saved[it], data, i)
+            if rows is not None:
+                is_correct = _rows_correct(rows, difficulty)
+            elif convergence and convergence.is_stable(streak):
+                rows = convergence.carry(_unit_rows(data, i, difficulty), it, calls)
+                is_correct = _rows_correct(rows, difficulty)
+                await asyncio.to_thread(writer.append, rows)
+            else:
+                telemetry.set_iteration(it)
+                with deadlines.scope(llm_utils.ITERATION_BUDGET):
+                    r = await deadlines.bounded(batch_jobs.deferrable(step(i, it)))
+                if r is deadlines.OVERDUE:
+                    overdue[it] += 1
+                    counts[it][1] += 1
+                elif r is batch_jobs.DEFERRED:
+                    deferred += 1
+                if r is None or r is deadlines.OVERDUE or r is batch_jobs.DEFERRED:
+                    pb.update(len(iterations) - n)  # the rest of this chain is skipped
+                    return
+                rows, is_correct = r
+                await asyncio.to_thread(writer.append, rows)
+            pb.update(1)
+            for idx, row in rows.items():
+                data[idx] = row
+            counts[it][0] += int(is_correct)
+            counts[it][1] += 1
+            streak = streak + 1 if is_correct else 0
+
+    await asyncio.gather(*(chain(i) for i in units))
+    pb.close()
+
+    batch_jobs.raise_if_deferred(deferred, f"iterations {iterations[0]}-{iterations[-1]}")
+    accuracies = []
+    for it in iterations:
+        deadlines.report_overdue(overdue[it], f"iteration {it}")
+        correct, total = counts[it]
+        accuracies.append(_save_iteration_accuracy(db_path, correct, total, it, difficulty, mode))
+    return accuracies
+
+
+async def _process_easy_iter_one(i, item, mode, cur_iteration, is_translation_mode, external, pipeline, memory_store=None):
     """Process a single Easy-mode question in an iteration. Returns (index, base_data, is_correct) or None."""
-    async with sem:
+    async with pipeline.question():
         try:
             old_persona = (
                 item["persona_description"]
@@ -81,17 +288,19 @@ async def _process_easy_iter_one(i, item, mode, cur_iteration, is_translation_mo
                 else:
                     feedback_language = "English"
                     persona_for_feedback = old_persona
-                feedback = await get_external_feedback("Easy", item["question"], persona_for_feedback, prev_answers, feedback_language=feedback_language)
+                async with pipeline.stage("feedback"):
+                    feedback = await get_external_feedback("Easy", item["question"], persona_for_feedback, prev_answers, feedback_language=feedback_language)
 
             long_term_memories = None
             if memory_store and cur_iteration >= 2:
-                long_term_memories = await memory_store.retrieve(
-                    item["question"],
-                    item["country"],
-                    current_iteration=cur_iteration,
-                    options=item.get("options") or {},
-                    question_index=i,
-                )
+                async with pipeline.stage("memory"):
+                    long_term_memories = await memory_store.retrieve(
+                        item["question"],
+                        item["country"],
+                        current_iteration=cur_iteration,
+                        options=item.get("options") or {},
+                        question_index=i,
+                    )
 
             pretranslated, refine_response = await generate_new_persona(
                 "Easy",
@@ -101,6 +310,7 @@ async def _process_easy_iter_one(i, item, mode, cur_iteration, is_translation_mo
                 item["country"],
                 feedback,
                 long_term_memories=long_term_memories,
+                pipeline=pipeline,
             )
             if refine_response is None and is_translation_mode:
                 return None
@@ -152,19 +362,25 @@ async def _process_easy_iter_one(i, item, mode, cur_iteration, is_translation_mo
 
         add_input_tokens("Easy", mode, chat_input)
         llm_instance = get_llm()
-        thinking_content, response = await async_generate(llm_instance, chat_input, enable_thinking_bool=False)
+        async with pipeline.stage("answer"):
+            thinking_content, response = await async_generate(
+                llm_instance, chat_input, enable_thinking_bool=False,
+                stop_field="answer", stage="answer_easy", schema="answer_easy",
+            )
         out_text = (thinking_content or "") + "\n" + (response or "")
         add_output_tokens("Easy", mode, out_text)
 
         try:
             result = json_repair.loads(response)
+            response_answer = result["answer"].upper().strip()
+            reasoning = result["reasoning"].strip()
         except Exception:
             print(f"Error sanitizing JSON for response: {response}")
+            record_attempts("answer_easy", 1, False)
             return None
+        record_attempts("answer_easy", 1, True)
 
         try:
-            response_answer = result["answer"].upper().strip()
-            reasoning = result["reasoning"].strip()
             correct_answer = item["correct_answer"]
 
             options_dict = {"A": option_a, "B": option_b, "C": option_c, "D": option_d}
@@ -193,6 +409,13 @@ async def _process_easy_iter_one(i, item, mode, cur_iteration, is_translation_mo
             return None
 
 
+async def _easy_step(i, data, cur_iteration, mode, is_translation_mode, external, pipeline, memory_store):
+    r = await _process_easy_iter_one(
+        i, data[i], mode, cur_iteration, is_translation_mode, external, pipeline, memory_store
+    )
+    return None if r is None else ({r[0]: r[1]}, r[2])
+
+
 async def run_easy_iterations(
     mode,
     num_iterations,
@@ -201,56 +424,24 @@ async def run_easy_iterations(
     external=False,
     use_memory=True,
     debug_memory=False,
+    chains=False,
+    resume=False,
+    convergence=None,
 ):
-    """Run iterations for Easy difficulty."""
-    accuracies = []
-    is_translation_mode = "e2l" in mode or "l2e" in mode
-    memory_store = None
-    if use_memory and mode == "eng":
-        memory_store = get_memory_store(
-            db_path, "Easy", mode, enabled=True, debug_retrieval=debug_memory
-        )
-        if debug_memory:
-            print("Memory retrieval debug logging enabled (per-question)", flush=True)
-        await memory_store.sync_from_sqlite_async()
-
-    for cur_iteration in range(start_iteration, num_iterations + 1):
-        data = load_previous_iteration(db_path, cur_iteration, "Easy", mode)
-        print(f"Currently running iteration {cur_iteration}", flush=True)
-        sem = asyncio.Semaphore(llm_utils.MAX_CONCURRENT)
-
-        tasks = [
-            _process_easy_iter_one(
-                i, item, mode, cur_iteration, is_translation_mode, external, sem, memory_store
-            )
-            for i, item in enumerate(data)
-        ]
-        results = []
-        for coro in tqdm(asyncio.as_completed(tasks), total=len(tasks), desc=f"Iter {cur_iteration} (Easy)", unit="q"):
-            results.append(await coro)
+    """Run iterations for Easy difficulty (as per-question chains with chains=True and no memory).
 
-        new_data = {}
-        correct = total = 0
-        for r in results:
-            if r is None:
-                continue
-            idx, base_data, is_correct = r
-            new_data[idx] = base_data
-            if is_correct:
-                correct += 1
-            total += 1
+    With resume the questions an interrupted run already saved for an iteration are kept and
+    skipped; otherwise rows of iterations start_iteration..num_iterations are cleared first.
+    convergence: tools.convergence.ConvergencePolicy carrying stable questions forward, or None."""
+    return await _run_difficulty_iterations(
+        "Easy", mode, num_iterations, db_path, start_iteration, external, use_memory, debug_memory, chains, resume,
+        convergence,
+    )
 
-        accuracy = append_to_db(db_path, new_data, correct, total, cur_iteration, "Easy", mode)
-        if memory_store:
-            await memory_store.sync_from_sqlite_async()
-        accuracies.append(accuracy)
 
-    return accuracies
-
-
-async def _process_hard_iter_set(i, data, mode, cur_iteration, is_translation_mode, external, sem, memory_store=None):
+async def _process_hard_iter_set(i, data, mode, cur_iteration, is_translation_mode, external, pipeline, memory_store=None):
     """Process a single Hard-mode question set (4 sub-questions) in an iteration. Returns (set_data, is_correct) or None."""
-    async with sem:
+    async with pipeline.question():
         prompt_question = data[i]["question"]
 
         try:
@@ -276,18 +467,20 @@ async def _process_hard_iter_set(i, data, mode, cur_iteration, is_translation_mo
                 else:
                     feedback_language = "English"
                     persona_for_feedback = old_persona
-                feedback = await get_external_feedback("Hard", prompt_question, persona_for_feedback, None, feedback_language=feedback_language)
+                async with pipeline.stage("feedback"):
+                    feedback = await get_external_feedback("Hard", prompt_question, persona_for_feedback, None, feedback_language=feedback_language)
 
             long_term_memories = None
             if memory_store and cur_iteration >= 2:
                 prompt_options = [data[i + j]["prompt_option"] for j in range(4)]
-                long_term_memories = await memory_store.retrieve(
-                    prompt_question,
-                    data[i]["country"],
-                    current_iteration=cur_iteration,
-                    prompt_options=prompt_options,
-                    question_index=i // 4,
-                )
+                async with pipeline.stage("memory"):
+                    long_term_memories = await memory_store.retrieve(
+                        prompt_question,
+                        data[i]["country"],
+                        current_iteration=cur_iteration,
+                        prompt_options=prompt_options,
+                        question_index=i // 4,
+                    )
 
             pretranslated, refine_response = await generate_new_persona(
                 "Hard",
@@ -297,6 +490,7 @@ async def _process_hard_iter_set(i, data, mode, cur_iteration, is_translation_mo
                 data[i]["country"],
                 feedback,
                 long_term_memories=long_term_memories,
+                pipeline=pipeline,
             )
             if refine_response is None and is_translation_mode:
                 return None
@@ -320,12 +514,9 @@ async def _process_hard_iter_set(i, data, mode, cur_iteration, is_translation_mo
         else:
             language = country_to_language[cap(data[i]["country"])].capitalize()
 
-        isCorrect = True
-        cur_set_data = []
+        chat_inputs = []
         for j in range(4):
             prompt_option = data[i + j]["prompt_option"]
-            correct_answer = data[i + j]["correct_answer"]
-
             chat_input = [
                 {"role": "system", "content": new_persona},
                 {"role": "user", "content": (
@@ -342,12 +533,12 @@ async def _process_hard_iter_set(i, data, mode, cur_iteration, is_translation_mo
                     f"Answer: {prompt_option}"
                 )}
             ]
-
             add_input_tokens("Hard", mode, chat_input)
-            llm_instance = get_llm()
-            thinking_content, response = await async_generate(llm_instance, chat_input, enable_thinking_bool=False)
-            out_text = (thinking_content or "") + "\n" + (response or "")
-            add_output_tokens("Hard", mode, out_text)
+            chat_inputs.append(chat_input)
+
+        def _judge(j, output):
+            thinking_content, response = output
+            add_output_tokens("Hard", mode, (thinking_content or "") + "\n" + (response or ""))
             try:
                 result = json_repair.loads(response)
                 thinks_correct = (
@@ -358,7 +549,27 @@ async def _process_hard_iter_set(i, data, mode, cur_iteration, is_translation_mo
                 reasoning = result["reasoning"].strip()
             except Exception as e:
                 print(f"Error generating answer for option {j} in question set {i//4}: {type(e).__name__}: {str(e)}")
+                record_attempts("answer_hard", 1, False)
                 return None
+            record_attempts("answer_hard", 1, True)
+            return thinking_content, thinks_correct, reasoning
+
+        # the four options share the persona, so they go to the server as one batch; they are
+        # judged as they arrive and a parse failure cancels the ones still running
+        llm_instance = get_llm()
+        async with pipeline.stage("answer"):
+            judged = await generate_batch(
+                llm_instance, chat_inputs, check=_judge, enable_thinking_bool=False,
+                stop_field="correct", stage="answer_hard", schema="answer_hard",
+            )
+        if judged is None:
+            return None
+
+        isCorrect = True
+        cur_set_data = []
+        for j, (thinking_content, thinks_correct, reasoning) in enumerate(judged):
+            prompt_option = data[i + j]["prompt_option"]
+            correct_answer = data[i + j]["correct_answer"]
 
             item_data = {
                 "question": prompt_question,
@@ -399,50 +610,75 @@ async def run_hard_iterations(
     external=False,
     use_memory=True,
     debug_memory=False,
+    chains=False,
+    resume=False,
+    convergence=None,
+):
+    """Run iterations for Hard difficulty (as per-set chains with chains=True and no memory).
+
+    With resume the sets an interrupted run already saved for an iteration are kept and
+    skipped; otherwise rows of iterations start_iteration..num_iterations are cleared first.
+    convergence: tools.convergence.ConvergencePolicy carrying stable sets forward, or None."""
+    return await _run_difficulty_iterations(
+        "Hard", mode, num_iterations, db_path, start_iteration, external, use_memory, debug_memory, chains, resume,
+        convergence,
+    )
+
+
+async def _run_difficulty_iterations(
+    difficulty, mode, num_iterations, db_path, start_iteration, external, use_memory, debug_memory, chains, resume,
+    convergence,
 ):
-    """Run iterations for Hard difficulty."""
     accuracies = []
     is_translation_mode = "e2l" in mode or "l2e" in mode
+    if not resume:
+        clear_results(db_path, range(start_iteration, num_iterations + 1), difficulty, mode)
     memory_store = None
     if use_memory and mode == "eng":
         memory_store = get_memory_store(
-            db_path, "Hard", mode, enabled=True, debug_retrieval=debug_memory
+            db_path, difficulty, mode, enabled=True, debug_retrieval=debug_memory
         )
         if debug_memory:
             print("Memory retrieval debug logging enabled (per-question)", flush=True)
         await memory_store.sync_from_sqlite_async()
 
-    for cur_iteration in range(start_iteration, num_iterations + 1):
-        data = load_previous_iteration(db_path, cur_iteration, "Hard", mode)
-        print(f"Currently running iteration {cur_iteration} (Hard)", flush=True)
-        sem = asyncio.Semaphore(llm_utils.MAX_CONCURRENT)
-        set_indices = list(range(0, len(data), 4))
-
-        tasks = [
-            _process_hard_iter_set(
-                i, data, mode, cur_iteration, is_translation_mode, external, sem, memory_store
+    def make_step(data, pipeline, memory_store):
+        if difficulty == "Easy":
+            return lambda i, it: _easy_step(i, data, it, mode, is_translation_mode, external, pipeline, memory_store)
+        return lambda i, it: _process_hard_iter_set(i, data, mode, it, is_translation_mode, external, pipeline, memory_store)
+
+    size = _unit_size(difficulty)
+    calls = _llm_calls_per_unit(difficulty, external)
+    writer = ResultsWriter(db_path, difficulty, mode)
+    try:
+        if chains and start_iteration <= num_iterations:
+            if memory_store is None:
+                data = load_previous_iteration(db_path, start_iteration, difficulty, mode)
+                pipeline = stage_pipeline.for_iteration(
+                    _iteration_stages(mode, external, None, is_translation_mode), llm_utils.question_semaphore
+                )
+                return await _run_chains(
+                    data, range(0, len(data), size), make_step(data, pipeline, None),
+                    start_iteration, num_iterations, db_path, difficulty, mode, writer, convergence, calls,
+                )
+            print("Question chains need memory off (retrieval reads every question's previous iteration); running with barriers")
+
+        for cur_iteration in range(start_iteration, num_iterations + 1):
+            telemetry.set_iteration(cur_iteration)
+            data = load_previous_iteration(db_path, cur_iteration, difficulty, mode)
+            print(f"Currently running iteration {cur_iteration}" + ("" if difficulty == "Easy" else " (Hard)"), flush=True)
+            pipeline = stage_pipeline.for_iteration(
+                _iteration_stages(mode, external, memory_store, is_translation_mode), llm_utils.question_semaphore
             )
-            for i in set_indices
-        ]
-        results = []
-        for coro in tqdm(asyncio.as_completed(tasks), total=len(tasks), desc=f"Iter {cur_iteration} (Hard)", unit="set"):
-            results.append(await coro)
-
-        new_data = {}
-        correct = total = 0
-        for r in results:
-            if r is None:
-                continue
-            set_data, is_correct = r
-            new_data.update(set_data)
-            if is_correct:
-                correct += 1
-            total += 1
-
-        accuracy = append_to_db(db_path, new_data, correct, total, cur_iteration, "Hard", mode)
-        if memory_store:
-            await memory_store.sync_from_sqlite_async()
-        accuracies.append(accuracy)
+            accuracy = await _run_iteration(
+                data, range(0, len(data), size), make_step(data, pipeline, memory_store),
+                cur_iteration, db_path, difficulty, mode, writer, convergence, calls,
+            )
+            if memory_store:
+                await memory_store.sync_from_sqlite_async()
+            accuracies.append(accuracy)
+    finally:
+        writer.close()
 
     return accuracies
 
@@ -456,8 +692,12 @@ async def run_iterations(
     external=False,
     use_memory=True,
     debug_memory=False,
+    chains=False,
+    resume=False,
+    convergence=None,
 ):
     """Run iterations starting from iteration 2."""
+    telemetry.attach(db_path)
     if difficulty == "Easy":
         return await run_easy_iterations(
             mode,
@@ -467,6 +707,9 @@ async def run_iterations(
             external,
             use_memory,
             debug_memory,
+            chains,
+            resume,
+            convergence,
         )
     else:
         return await run_hard_iterations(
@@ -477,4 +720,7 @@ async def run_iterations(
             external,
             use_memory,
             debug_memory,
+            chains,
+            resume,
+            convergence,
         )
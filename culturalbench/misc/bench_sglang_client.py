@@ -0,0 +1,80 @@
+"""
+Compare per-request overhead of the old SGLang call path (fresh OpenAI client per call,
+run through asyncio.to_thread) against the pooled async client in tools/sglang_client.py.
+
+Sends N tiny chat requests (max_tokens=1) at the given concurrency so the measured time is
+dominated by client/connection overhead rather than decoding.
+
+Usage (from culturalbench/):
+  python misc/bench_sglang_client.py --model google/gemma-3-12b-it --port 30002 -n 256 -c 16
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from openai import OpenAI
+from tools.sglang_client import get_async_client, aclose_clients, sglang_base_url
+
+MESSAGES = [{"role": "user", "content": "Reply with the single letter A."}]
+
+
+def _fresh_client_call(base_url, model):
+    client = OpenAI(base_url=base_url, api_key="EMPTY")
+    client.chat.completions.create(model=model, messages=MESSAGES, max_tokens=1, temperature=0)
+
+
+async def run_legacy(base_url, model, n, concurrency):
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with sem:
+            await asyncio.to_thread(_fresh_client_call, base_url, model)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(n)))
+    return time.perf_counter() - t0
+
+
+async def run_pooled(base_url, model, n, concurrency):
+    sem = asyncio.Semaphore(concurrency)
+    client = get_async_client(base_url)
+
+    async def one():
+        async with sem:
+            await client.chat.completions.create(model=model, messages=MESSAGES, max_tokens=1, temperature=0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(n)))
+    elapsed = time.perf_counter() - t0
+    await aclose_clients()
+    return elapsed
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark SGLang client overhead")
+    parser.add_argument("--model", type=str, default="google/gemma-3-12b-it")
+    parser.add_argument("--host", type=str, default=os.environ.get("SGLANG_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=30002)
+    parser.add_argument("-n", "--num_requests", type=int, default=256)
+    parser.add_argument("-c", "--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    base_url = sglang_base_url(args.host, args.port)
+    # warm the server once so neither path pays its first-request cost
+    await asyncio.to_thread(_fresh_client_call, base_url, args.model)
+
+    legacy = await run_legacy(base_url, args.model, args.num_requests, args.concurrency)
+    pooled = await run_pooled(base_url, args.model, args.num_requests, args.concurrency)
+    n = args.num_requests
+    print(f"legacy (new client + to_thread): {legacy:.2f}s total, {1000 * legacy / n:.1f} ms/request")
+    print(f"pooled async client:             {pooled:.2f}s total, {1000 * pooled / n:.1f} ms/request")
+    if pooled > 0:
+        print(f"speedup: {legacy / pooled:.2f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
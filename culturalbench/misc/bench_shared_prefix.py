@@ -0,0 +1,101 @@
+"""
+Benchmark shared-prefix KV-cache reuse for the four Hard options (tools/steering_worker.py).
+
+Builds Hard-style question sets (one persona as system prompt, the same question,
+four different options) and measures prefill per set two ways:
+  full    - each of the 4 option prompts is prefilled from scratch
+  shared  - the common token prefix is prefilled once; each option prefills only
+            its suffix on a copy of the prefix cache
+and checks that both give the same next-token logits. Runs on CPU with a small model.
+
+Usage (from culturalbench/):
+  python misc/bench_shared_prefix.py --model HuggingFaceTB/SmolLM2-135M-Instruct --sets 8
+"""
+import argparse
+import copy
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer, DynamicCache
+
+from tools.steering_worker import common_prefix_len
+
+PERSONA = (
+    "You are a lifelong resident of Seoul who has organised dozens of family celebrations, "
+    "from doljanchi to chuseok gatherings, and you know how customs differ between generations "
+    "and regions across South Korea."
+)
+QUESTION = "In South Korea, what is traditionally served at a child's first birthday celebration?"
+OPTIONS = ["Seaweed soup", "Rice cakes", "Kimchi stew", "Bulgogi"]
+
+
+def option_chats(set_idx):
+    question = f"{QUESTION} (set {set_idx})"
+    return [
+        [
+            {"role": "system", "content": PERSONA},
+            {"role": "user", "content": (
+                "Is this answer true or false for this question?\n"
+                "Respond in valid JSON format with two keys: \n"
+                "\"correct\" (either \"true\" or \"false\") and \"reasoning\" (a short, brief explanation in English). \n"
+                f"Question: {question}\n"
+                f"Answer: {option}"
+            )},
+        ]
+        for option in OPTIONS
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="HuggingFaceTB/SmolLM2-135M-Instruct")
+    parser.add_argument("--sets", type=int, default=8)
+    args = parser.parse_args()
+
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    model = AutoModelForCausalLM.from_pretrained(args.model, torch_dtype=torch.float32).eval()
+
+    full_t = shared_t = 0.0
+    prefix_tokens = total_tokens = 0
+    max_diff = 0.0
+    with torch.inference_mode():
+        for s in range(args.sets):
+            rows = [
+                tokenizer(
+                    tokenizer.apply_chat_template(c, tokenize=False, add_generation_prompt=True),
+                    return_tensors="pt", add_special_tokens=False,
+                )["input_ids"]
+                for c in option_chats(s)
+            ]
+            n = min(common_prefix_len([r[0] for r in rows]), min(r.shape[1] for r in rows) - 1)
+            prefix_tokens += n
+            total_tokens += sum(r.shape[1] for r in rows)
+
+            t0 = time.perf_counter()
+            full_logits = [model(input_ids=r).logits[0, -1] for r in rows]
+            full_t += time.perf_counter() - t0
+
+            t0 = time.perf_counter()
+            cache = model(input_ids=rows[0][:, :n], past_key_values=DynamicCache(), use_cache=True).past_key_values
+            shared_logits = [
+                model(input_ids=r[:, n:], past_key_values=copy.deepcopy(cache), use_cache=True).logits[0, -1]
+                for r in rows
+            ]
+            shared_t += time.perf_counter() - t0
+
+            for a, b in zip(full_logits, shared_logits):
+                max_diff = max(max_diff, (a - b).abs().max().item())
+
+    print(f"sets={args.sets}  prompt tokens/set={total_tokens / args.sets:.0f}  shared prefix/set={prefix_tokens / args.sets:.0f}")
+    print(f"full prefill:   {full_t / args.sets * 1000:.1f} ms/set")
+    print(f"shared prefix:  {shared_t / args.sets * 1000:.1f} ms/set")
+    print(f"saved:          {(full_t - shared_t) / args.sets * 1000:.1f} ms/set ({1 - shared_t / full_t:.1%})")
+    print(f"max |logit diff| full vs shared: {max_diff:.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,344 @@
+"""
+Deterministic stand-in for an SGLang OpenAI-compatible server, for offline throughput tests.
+
+Implements GET /v1/models and POST /v1/chat/completions (plain and stream=True), plus
+GET /stats with counters and GET /get_server_info (KV capacity). Responses are canned but shaped like the real ones, so the
+parsers in tools/response_utils.py, persona_generator.py and BLEnD accept them:
+
+  Easy answer prompt      -> {"answer": "<A-D>", "reasoning": "..."}
+  Hard T/F prompt         -> {"correct": "true|false", "reasoning": "..."}
+  refine prompt           -> {"reasoning": "...", "revised_persona": "You are ..."}
+  eng initial persona     -> {"reasoning": "...", "persona": "You are ..."}
+  BLEnD short answer      -> {"answer": "...", "reasoning": "..."}
+  other persona prompts   -> "You are ..."
+  feedback / summaries    -> a few sentences of text
+
+Content and latency are derived from a hash of the request (and --seed), so the same
+request always gets the same answer after the same simulated delay. Error injection
+draws from a seeded RNG instead, so retries of a failed request can succeed.
+
+Timing model per request:
+  queue wait for one of --max_running slots
+  + TTFT: --ttft_ms drawn from --ttft_dist, plus uncached prompt tokens / --prefill_tps
+  + decode: completion tokens / (--tokens_per_sec / (1 + --batch_slowdown * (running - 1)))
+Prefix cache: prompts are hashed in --cache_block_chars chunks; leading chunks seen
+before (LRU, --prefix_cache_tokens capacity) count as cached, skip prefill time and are
+reported in usage.prompt_tokens_details.cached_tokens.
+
+Usage (from culturalbench/): serve the answer model on :30002 and the feedback model on :30000
+  python misc/fake_sglang_server.py --ports 30000,30002 \\
+      --models google/gemma-3-12b-it,meta-llama/Meta-Llama-3-8B-Instruct --tokens_per_sec 60
+  python iterate.py --mode eng --difficulty Easy --model google/gemma-3-12b-it --max_concurrent 32
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import random
+import re
+import time
+from collections import OrderedDict
+
+from aiohttp import web
+
+LETTERS = ["A", "B", "C", "D"]
+FILLER = (
+    "this reflects everyday practice in the country rather than a stereotype held by outsiders "
+    "and people who grew up there would recognise it from family gatherings and local customs"
+).split()
+
+
+def _hash(*parts):
+    h = hashlib.sha256()
+    for p in parts:
+        h.update(str(p).encode("utf-8"))
+        h.update(b"\x00")
+    return int.from_bytes(h.digest()[:8], "big")
+
+
+def count_tokens(text):
+    """Rough token count (words and punctuation)."""
+    return len(re.findall(r"\w+|[^\w\s]", text))
+
+
+def _content_text(content):
+    if isinstance(content, list):
+        return "".join(p.get("text", "") for p in content if isinstance(p, dict))
+    return content or ""
+
+
+class FakeServer:
+    def __init__(self, args):
+        self.args = args
+        self.models = args.models
+        self.running = 0
+        self.slots = asyncio.Semaphore(args.max_running)
+        self.error_rng = random.Random(args.seed)
+        self.prefix_cache = OrderedDict()  # chunk-chain hash -> None
+        self.cached_chunk_capacity = max(1, args.prefix_cache_tokens * 4 // args.cache_block_chars)
+        self.stats = {
+            "requests": 0, "streamed": 0, "injected_errors": 0, "injected_hangs": 0,
+            "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0,
+            "max_running": 0, "max_queued": 0,
+        }
+        self.queued = 0
+
+    # -- canned content ------------------------------------------------------
+
+    def _sentence(self, rng, words):
+        picked = [FILLER[rng.randrange(len(FILLER))] for _ in range(words)]
+        return " ".join(picked).capitalize() + "."
+
+    def _reasoning(self, rng):
+        return self._sentence(rng, self.args.reasoning_words)
+
+    def _persona(self, rng):
+        sentence = self._sentence(rng, self.args.persona_words)
+        return "You are " + sentence[0].lower() + sentence[1:]
+
+    def respond(self, messages, seed):
+        rng = random.Random(seed)
+        system = "\n".join(_content_text(m.get("content")) for m in messages if m.get("role") == "system")
+        user = "\n".join(_content_text(m.get("content")) for m in messages if m.get("role") != "system")
+        both = system + "\n" + user
+        if '"revised_persona"' in both:
+            return json.dumps({"reasoning": self._reasoning(rng), "revised_persona": self._persona(rng)}, ensure_ascii=False)
+        if '"persona"' in system:
+            return json.dumps({"reasoning": self._reasoning(rng), "persona": self._persona(rng)}, ensure_ascii=False)
+        if '"correct"' in user:
+            correct = "true" if rng.random() < 0.25 else "false"
+            return json.dumps({"correct": correct, "reasoning": self._reasoning(rng)}, ensure_ascii=False)
+        if re.search(r'"answer"\s*\(either "A"', user):
+            return json.dumps({"answer": rng.choice(LETTERS), "reasoning": self._reasoning(rng)}, ensure_ascii=False)
+        if '"answer"' in user:
+            return json.dumps({"answer": self._sentence(rng, 3).rstrip("."), "reasoning": self._reasoning(rng)}, ensure_ascii=False)
+        if "feedback" in system.lower():
+            return " ".join(self._sentence(rng, 14) for _ in range(3))
+        if "persona" in both.lower():
+            return self._persona(rng)
+        return " ".join(self._sentence(rng, 12) for _ in range(2))
+
+    # -- simulation ----------------------------------------------------------
+
+    def _prompt_chunks(self, messages):
+        text = "".join(f"<{m.get('role')}>{_content_text(m.get('content'))}" for m in messages)
+        size = self.args.cache_block_chars
+        chain, out = 0, []
+        for i in range(0, len(text), size):
+            chain = _hash(chain, text[i:i + size])
+            out.append(chain)
+        return out
+
+    def _lookup_and_insert_prefix(self, messages, prompt_tokens):
+        chunks = self._prompt_chunks(messages)
+        hit = 0
+        for c in chunks:
+            if c not in self.prefix_cache:
+                break
+            self.prefix_cache.move_to_end(c)
+            hit += 1
+        for c in chunks[hit:]:
+            self.prefix_cache[c] = None
+        while len(self.prefix_cache) > self.cached_chunk_capacity:
+            self.prefix_cache.popitem(last=False)
+        if not chunks:
+            return 0
+        return min(prompt_tokens, int(prompt_tokens * hit / len(chunks)))
+
+    def _ttft_base(self, rng):
+        mean = self.args.ttft_ms / 1000.0
+        dist = self.args.ttft_dist
+        if dist == "fixed":
+            return mean
+        if dist == "exp":
+            return rng.expovariate(1.0 / mean) if mean > 0 else 0.0
+        sigma = self.args.ttft_sigma
+        return rng.lognormvariate(math.log(max(mean, 1e-6)) - sigma * sigma / 2, sigma)
+
+    def _maybe_inject(self):
+        r = self.error_rng.random()
+        if r < self.args.error_rate:
+            self.stats["injected_errors"] += 1
+            return "error"
+        if r < self.args.error_rate + self.args.hang_rate:
+            self.stats["injected_hangs"] += 1
+            return "hang"
+        return None
+
+    # -- handlers --------------------------------------------------------------
+
+    async def models_handler(self, request):
+        return web.json_response({
+            "object": "list",
+            "data": [{"id": m, "object": "model", "created": 0, "owned_by": "fake-sglang"} for m in self.models],
+        })
+
+    async def server_info_handler(self, request):
+        return web.json_response({"max_total_num_tokens": self.args.kv_tokens, "max_running_requests": self.args.max_running})
+
+    async def stats_handler(self, request):
+        out = dict(self.stats)
+        out["cached_ratio"] = round(out["cached_tokens"] / out["prompt_tokens"], 4) if out["prompt_tokens"] else 0.0
+        return web.json_response(out)
+
+    async def chat_handler(self, request):
+        body = await request.json()
+        model = body.get("model")
+        if model not in self.models:
+            return web.json_response(
+                {"error": {"message": f"model {model!r} not served", "type": "invalid_request_error", "code": 404}},
+                status=404,
+            )
+        self.stats["requests"] += 1
+        injected = self._maybe_inject()
+        if injected == "error":
+            await asyncio.sleep(self.args.error_delay_ms / 1000.0)
+            status = self.error_rng.choice(self.args.error_codes)
+            return web.json_response(
+                {"error": {"message": "injected failure", "type": "server_error", "code": status}}, status=status
+            )
+        if injected == "hang":
+            await asyncio.sleep(self.args.hang_sec)
+
+        messages = body.get("messages") or []
+        req_seed = _hash(self.args.seed, model, json.dumps(messages, sort_keys=True, ensure_ascii=False))
+        rng = random.Random(req_seed ^ 0x5EED)
+        text = self.respond(messages, req_seed)
+        tokens = re.findall(r"\S+\s*", text)
+        finish_reason = "stop"
+        max_tokens = body.get("max_tokens")
+        if max_tokens is not None and len(tokens) > max_tokens:
+            tokens, finish_reason = tokens[:max_tokens], "length"
+        prompt_tokens = sum(count_tokens(_content_text(m.get("content"))) + 4 for m in messages)
+
+        self.queued += 1
+        self.stats["max_queued"] = max(self.stats["max_queued"], self.queued)
+        async with self.slots:
+            self.queued -= 1
+            self.running += 1
+            self.stats["max_running"] = max(self.stats["max_running"], self.running)
+            try:
+                cached = self._lookup_and_insert_prefix(messages, prompt_tokens)
+                ttft = self._ttft_base(rng) + (prompt_tokens - cached) / self.args.prefill_tps
+                tps = self.args.tokens_per_sec / (1 + self.args.batch_slowdown * (self.running - 1))
+                per_token = 1.0 / tps if tps > 0 else 0.0
+                usage = {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": len(tokens),
+                    "total_tokens": prompt_tokens + len(tokens),
+                    "prompt_tokens_details": {"cached_tokens": cached},
+                }
+                self.stats["prompt_tokens"] += prompt_tokens
+                self.stats["cached_tokens"] += cached
+                self.stats["completion_tokens"] += len(tokens)
+                if body.get("stream"):
+                    self.stats["streamed"] += 1
+                    return await self._stream(request, body, model, tokens, ttft, per_token, usage, finish_reason)
+                await asyncio.sleep(ttft + per_token * len(tokens))
+                return web.json_response({
+                    "id": f"chatcmpl-{req_seed:x}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": "".join(tokens)},
+                        "finish_reason": finish_reason,
+                    }],
+                    "usage": usage,
+                })
+            finally:
+                self.running -= 1
+
+    async def _stream(self, request, body, model, tokens, ttft, per_token, usage, finish_reason):
+        resp = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        await resp.prepare(request)
+
+        def chunk(delta, finish=None):
+            return {
+                "id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish}],
+            }
+
+        async def send(obj):
+            await resp.write(f"data: {json.dumps(obj, ensure_ascii=False)}\n\n".encode("utf-8"))
+
+        try:
+            await asyncio.sleep(ttft)
+            await send(chunk({"role": "assistant", "content": ""}))
+            step = max(1, self.args.stream_chunk_tokens)
+            for i in range(0, len(tokens), step):
+                await asyncio.sleep(per_token * step)
+                await send(chunk({"content": "".join(tokens[i:i + step])}))
+            await send(chunk({}, finish_reason))
+            if (body.get("stream_options") or {}).get("include_usage"):
+                await send({"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()),
+                            "model": model, "choices": [], "usage": usage})
+            await resp.write(b"data: [DONE]\n\n")
+        except (ConnectionResetError, asyncio.CancelledError):
+            pass  # client closed the stream early
+        return resp
+
+
+SERVER_KEY = web.AppKey("server", FakeServer)
+
+
+def build_app(args):
+    server = FakeServer(args)
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app.router.add_get("/v1/models", server.models_handler)
+    app.router.add_post("/v1/chat/completions", server.chat_handler)
+    app.router.add_get("/stats", server.stats_handler)
+    app.router.add_get("/get_server_info", server.server_info_handler)
+    app[SERVER_KEY] = server
+    return app
+
+
+async def serve(args):
+    runners = []
+    for port in args.ports:
+        runner = web.AppRunner(build_app(args), access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, args.host, port).start()
+        runners.append(runner)
+        print(f"fake SGLang serving {args.models} on http://{args.host}:{port}/v1", flush=True)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        for runner in runners:
+            await runner.cleanup()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--ports", type=lambda s: [int(p) for p in s.split(",")], default=[30002])
+    parser.add_argument("--models", type=lambda s: s.split(","), default=["google/gemma-3-12b-it"])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max_running", type=int, default=64, help="Concurrent requests decoded at once; more wait in queue")
+    parser.add_argument("--ttft_ms", type=float, default=80.0, help="Mean base time to first token")
+    parser.add_argument("--ttft_dist", choices=["fixed", "exp", "lognormal"], default="lognormal")
+    parser.add_argument("--ttft_sigma", type=float, default=0.5, help="Lognormal sigma for --ttft_dist lognormal")
+    parser.add_argument("--prefill_tps", type=float, default=8000.0, help="Prefill tokens/sec for uncached prompt tokens")
+    parser.add_argument("--tokens_per_sec", type=float, default=60.0, help="Decode tokens/sec for a request running alone")
+    parser.add_argument("--batch_slowdown", type=float, default=0.02, help="Per-request decode slowdown per extra running request")
+    parser.add_argument("--stream_chunk_tokens", type=int, default=1)
+    parser.add_argument("--reasoning_words", type=int, default=40)
+    parser.add_argument("--persona_words", type=int, default=45)
+    parser.add_argument("--prefix_cache_tokens", type=int, default=500_000, help="Simulated radix cache capacity")
+    parser.add_argument("--cache_block_chars", type=int, default=64)
+    parser.add_argument("--error_rate", type=float, default=0.0, help="Fraction of requests answered with an error status")
+    parser.add_argument("--error_codes", type=lambda s: [int(c) for c in s.split(",")], default=[503])
+    parser.add_argument("--error_delay_ms", type=float, default=20.0)
+    parser.add_argument("--hang_rate", type=float, default=0.0, help="Fraction of requests that stall for --hang_sec first")
+    parser.add_argument("--hang_sec", type=float, default=900.0)
+    parser.add_argument("--kv_tokens", type=int, default=200_000, help="KV capacity reported by /get_server_info")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(serve(parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,114 @@
+"""
+CPU smoke test / micro-benchmark for tools/steering_worker.py.
+
+Loads a small chat model, submits N prompts concurrently with two steering
+coefficients (0 and --coefficient, interleaved) and compares the batched worker
+(--batch_size) against one-at-a-time generation (batch size 1): wall time, batch
+stats and how many greedy outputs match. The steering vector is random (scaled to
+the hidden size); assistant_axis.ActivationSteering is used when installed,
+otherwise a minimal forward hook that adds the vector at the target layer.
+
+Usage (from culturalbench/):
+  python misc/steering_worker_smoke.py --model HuggingFaceTB/SmolLM2-135M-Instruct -n 16 --batch_size 8
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer
+
+from tools.steering_worker import SteeringBatchWorker
+
+QUESTIONS = [
+    "Which dish is most commonly eaten at a Korean first birthday celebration?",
+    "What is a common greeting gesture in Japan?",
+    "Which holiday in Mexico honours deceased relatives?",
+    "What do people in Germany usually say before a meal?",
+]
+
+
+class _AddVector:
+    """Minimal stand-in for ActivationSteering: adds coef * vector to one decoder layer's output."""
+
+    def __init__(self, model, steering_vectors, coefficients, layer_indices):
+        self.layer = model.model.layers[layer_indices[0]]
+        self.delta = steering_vectors[0] * coefficients[0]
+        self.handle = None
+
+    def _hook(self, module, inputs, output):
+        if isinstance(output, tuple):
+            return (output[0] + self.delta.to(output[0].dtype),) + output[1:]
+        return output + self.delta.to(output.dtype)
+
+    def __enter__(self):
+        self.handle = self.layer.register_forward_hook(self._hook)
+        return self
+
+    def __exit__(self, *exc):
+        self.handle.remove()
+
+
+def _steering_cls():
+    try:
+        from assistant_axis import ActivationSteering
+        return ActivationSteering
+    except ImportError:
+        return _AddVector
+
+
+def run(model, tokenizer, vector, layer, args, batch_size):
+    worker = SteeringBatchWorker(
+        model, tokenizer, steering_vector=vector, layer=layer,
+        max_batch_size=batch_size, max_wait_ms=args.max_wait_ms, steering_cls=_steering_cls(),
+    ).start()
+    t0 = time.perf_counter()
+    futures = []
+    for i in range(args.n):
+        messages = [
+            {"role": "system", "content": "You are a helpful cultural expert."},
+            {"role": "user", "content": QUESTIONS[i % len(QUESTIONS)]},
+        ]
+        coef = args.coefficient if i % 2 else 0.0
+        futures.append(worker.submit(messages, max_new_tokens=args.max_new_tokens, coefficient=coef))
+    outputs = [f.result() for f in futures]
+    elapsed = time.perf_counter() - t0
+    stats = worker.get_stats()
+    worker.stop()
+    return outputs, elapsed, stats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="HuggingFaceTB/SmolLM2-135M-Instruct")
+    parser.add_argument("-n", type=int, default=16)
+    parser.add_argument("--batch_size", type=int, default=8)
+    parser.add_argument("--max_wait_ms", type=float, default=20)
+    parser.add_argument("--max_new_tokens", type=int, default=32)
+    parser.add_argument("--coefficient", type=float, default=4.0)
+    parser.add_argument("--layer", type=int, default=None, help="Default: middle layer")
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    model = AutoModelForCausalLM.from_pretrained(args.model, torch_dtype=torch.float32).eval()
+    layer = args.layer if args.layer is not None else model.config.num_hidden_layers // 2
+    vector = torch.randn(model.config.hidden_size)
+    vector = vector / vector.norm()
+
+    serial_out, serial_t, _ = run(model, tokenizer, vector, layer, args, 1)
+    batched_out, batched_t, stats = run(model, tokenizer, vector, layer, args, args.batch_size)
+
+    same = sum(a == b for a, b in zip(serial_out, batched_out))
+    print(f"batch_size=1: {serial_t:.2f}s")
+    print(f"batch_size={args.batch_size}: {batched_t:.2f}s ({serial_t / batched_t:.2f}x)  stats={stats}")
+    print(f"identical greedy outputs: {same}/{args.n} (padding can shift low-order logits)")
+    print(f"sample (coef=0): {batched_out[0]!r}")
+    print(f"sample (coef={args.coefficient}): {batched_out[1]!r}")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,9 +9,11 @@ from tools.configs import (
     PERSONA_REFINE_MAX_TOKENS_QWEN35_HARD,
 )
 from tools.memory.memory_utils import format_long_term_memories
+from tools.memory.memory_summarizer import MEMORY_SUMMARIZE_SYSTEM
 from tools.llm_utils import get_llm, generate_text_funcs, async_generate
 from tools import llm_utils
 from token_counter import add_input_tokens, add_output_tokens
+from tools.structured_output import record_attempts
 try:
     import googletrans
 except ImportError:
@@ -20,6 +22,7 @@ from langdetect import detect
 from langdetect.lang_detect_exception import LangDetectException
 import json
 import json_repair
+import contextlib
 
 LONG_TERM_MEMORIES_PREAMBLE = (
     "The following are summarized examples from similar past questions (use as inspiration only). "
@@ -188,6 +191,61 @@ def _parse_initial_persona_response(response, mode):
     return response, None
 
 
+def initial_persona_system_prompt(mode, language):
+    """System prompt for initial persona generation: a lambda for ling modes; eng uses the
+    JSON persona+reasoning prompt."""
+    if mode == "eng":
+        return system_prompts["eng_json"]
+    elif "e2l" in mode:
+        return system_prompts[mode]
+    return system_prompts[mode](language)
+
+
+def self_refine_system_prompt(difficulty, language, with_feedback=False):
+    """Self-refine system prompt for difficulty in language (with or without external feedback)."""
+    if difficulty == "Easy":
+        iterations_description = "You will be provided with a question, its corresponding persona description, and the model's predicted answer among the 4 options."
+        template = self_refine_prompt_easy
+    else:
+        iterations_description = "You will be provided with a question and its corresponding persona description."
+        if llm_utils.MODEL_NAME == "Qwen/Qwen3.5-35B-A3B":
+            template = self_refine_prompt_hard_qwen35
+        else:
+            template = self_refine_prompt_hard
+    feedback_tip = ""
+    if with_feedback:
+        iterations_description = iterations_description [:len(iterations_description)-1] + " and the feedback on how it can be improved."
+        feedback_tip = "based on the feedback provided."
+    return template.format(
+        language=language,
+        second_person_pronoun=lang_to_spp[language],
+        iterations_description=iterations_description,
+        feedback_tip=feedback_tip,
+    )
+
+
+def shared_prefixes(mode, difficulty, external=False, use_memory=False):
+    """(model, messages) for the system prompts every question of a run shares, for the
+    warm-up prefill (tools/warmup.py).
+
+    Only English-language modes have one prompt per stage; ling/l2e prompts depend on
+    each question's language and warm up on first use.
+    """
+    if "eng" not in mode and "e2l" not in mode:
+        return []
+    model = llm_utils.MODEL_NAME
+    prompts = [initial_persona_system_prompt(mode, "English"), self_refine_system_prompt(difficulty, "English")]
+    if external:
+        prompts.append(self_refine_system_prompt(difficulty, "English", with_feedback=True))
+    prefixes = [(model, [{"role": "system", "content": p}, {"role": "user", "content": ""}]) for p in prompts]
+    if external:
+        messages = llm_utils.external_feedback_messages(difficulty, "", "", None, "English")
+        prefixes.append((llm_utils.EXTERNAL_FEEDBACK_MODEL, [messages[0], {"role": "user", "content": ""}]))
+    if use_memory and mode == "eng":
+        prefixes.append((model, [{"role": "system", "content": MEMORY_SUMMARIZE_SYSTEM}, {"role": "user", "content": ""}]))
+    return prefixes
+
+
 async def generate_persona_description(question, country, mode, difficulty="Easy"):
     llm_instance = get_llm()
     if "eng" in mode or "e2l" in mode:
@@ -195,14 +253,7 @@ async def generate_persona_description(question, country, mode, difficulty="Easy
     else:
         language = country_to_language[cap(country)].lower()
 
-    # Get system prompt - call lambda for ling mode; eng uses JSON persona+reasoning prompt
-    if mode == "eng":
-        system_prompt = system_prompts["eng_json"]
-    elif "e2l" in mode:
-        system_prompt = system_prompts[mode]
-    else:
-        system_prompt = system_prompts[mode](language)
-
+    system_prompt = initial_persona_system_prompt(mode, language)
     question_t = questions_translated[language.capitalize()]
     country_t = countries_translated[country.lower()]
     persona_description_t = persona_descriptions_translated[language.capitalize()]
@@ -218,7 +269,10 @@ async def generate_persona_description(question, country, mode, difficulty="Easy
     attempts = 3
     response = ""
     while attempts > 0:
-        _, response = await async_generate(llm_instance, chat_input, use_steering=False)
+        _, response = await async_generate(
+            llm_instance, chat_input, use_steering=False, stage="initial_persona",
+            schema="initial_persona" if mode == "eng" else None,
+        )
         if mode == "eng":
             persona_text, _ = _parse_initial_persona_response(response, mode)
             if persona_text and is_english(persona_text):
@@ -230,6 +284,7 @@ async def generate_persona_description(question, country, mode, difficulty="Easy
             attempts -= 1
         else:
             break
+    record_attempts("initial_persona", min(3, 4 - attempts), attempts > 0)  # attempts counts down from 3
 
     add_output_tokens(difficulty, mode, response)
     translated_response = None
@@ -248,6 +303,10 @@ async def generate_persona_description(question, country, mode, difficulty="Easy
     return response, translated_response, None
 
 
+def _stage(pipeline, name):
+    return pipeline.stage(name) if pipeline is not None else contextlib.nullcontext()
+
+
 async def generate_new_persona(
     difficulty,
     question,
@@ -256,6 +315,7 @@ async def generate_new_persona(
     country,
     feedback=None,
     long_term_memories=None,
+    pipeline=None,
 ):
     """Generate new persona description through self-refinement.
     
@@ -279,6 +339,8 @@ async def generate_new_persona(
         mode: The mode (eng, ling, l2e, or e2l)
         country: The country name
         feedback: Feedback from external model
+        pipeline: tools.stage_pipeline.StagePipeline whose "refine" and "translate" slots
+            the two steps hold (None: no per-stage gating)
     
     Returns:
         New persona description (no JSON)
@@ -295,21 +357,10 @@ async def generate_new_persona(
     predicted_answer_t = predicted_answers_translated[language]
     feedback_t = feedback_translated[language]
 
+    self_refine_prompt = self_refine_system_prompt(difficulty, language, bool(feedback))
+
     # Build content with all previous personas or just the previous one
     if difficulty == "Easy":
-        iterations_description = "You will be provided with a question, its corresponding persona description, and the model's predicted answer among the 4 options."
-        feedback_tip = ""
-        if feedback:
-            iterations_description = iterations_description [:len(iterations_description)-1] + " and the feedback on how it can be improved."
-            feedback_tip = "based on the feedback provided."
-        
-        self_refine_prompt = self_refine_prompt_easy.format(
-            language=language, 
-            second_person_pronoun=lang_to_spp[language],
-            iterations_description=iterations_description,
-            feedback_tip=feedback_tip
-        )
-        
         prev_data = previous_personas_data
         persona = prev_data.get('persona', '')
         model_answer = prev_data.get('model_answer', '')
@@ -333,30 +384,6 @@ async def generate_new_persona(
 
     # Hard mode
     else:
-        iterations_description = "You will be provided with a question and its corresponding persona description."
-
-        feedback_tip = ""
-        if feedback:
-            iterations_description = iterations_description [:len(iterations_description)-1] + " and the feedback on how it can be improved."
-            feedback_tip = "based on the feedback provided."
-
-        use_qwen35_hard_prompt = llm_utils.MODEL_NAME == "Qwen/Qwen3.5-35B-A3B"
-
-        if use_qwen35_hard_prompt:
-            self_refine_prompt = self_refine_prompt_hard_qwen35.format(
-                language=language,
-                second_person_pronoun=lang_to_spp[language],
-                iterations_description=iterations_description,
-                feedback_tip=feedback_tip,
-            )
-        else:
-            self_refine_prompt = self_refine_prompt_hard.format(
-                language=language,
-                second_person_pronoun=lang_to_spp[language],
-                iterations_description=iterations_description,
-                feedback_tip=feedback_tip,
-            )
-
         prev_data = previous_personas_data
         persona = prev_data.get('persona', '')
         user_content = (
@@ -387,9 +414,10 @@ async def generate_new_persona(
     attempts = 3
     while attempts > 0:
         # _ is thinking content (not relevant); max_tokens=None omits server-side cap (see llm_utils).
-        _, response = await async_generate(
-            llm_instance, chat_input, use_steering=False, max_tokens=None
-        )
+        async with _stage(pipeline, "refine"):
+            _, response = await async_generate(
+                llm_instance, chat_input, use_steering=False, max_tokens=None, stage="refine", schema="refine"
+            )
         # sanitize json response
         try:
             response_json = json_repair.loads(response)
@@ -402,16 +430,19 @@ async def generate_new_persona(
         except Exception as e:
             print("Error parsing response: " + response + " " + str(e))
             attempts -= 1
+    record_attempts("refine", min(3, 4 - attempts), attempts > 0)
 
     add_output_tokens(difficulty, mode, response)
     translated_response = None
     fixed_json_string = json.dumps(json_repair.loads(response), ensure_ascii=False)
     # translate english revised_persona to appropriate language if e2l mode
     if "e2l" in mode:
-        translated_response = await translate_text(fixed_json_string, language_to_code[country_to_language[cap(country)]], parse=True)
+        async with _stage(pipeline, "translate"):
+            translated_response = await translate_text(fixed_json_string, language_to_code[country_to_language[cap(country)]], parse=True)
     # translate ling mode revised_persona to english
     elif "l2e" in mode:
-        translated_response = await translate_text(fixed_json_string, language_to_code["English"], parse=True)
+        async with _stage(pipeline, "translate"):
+            translated_response = await translate_text(fixed_json_string, language_to_code["English"], parse=True)
         
     return response, translated_response
 
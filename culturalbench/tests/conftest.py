@@ -0,0 +1,83 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+# the scripts run from culturalbench/ and import tools.*, persona_generator, ... as top-level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def easy_row(i, iteration, correct):
+    return {
+        "question": f"q{i}", "options": {"A": "a", "B": "b", "C": "c", "D": "d"}, "persona_description": "p0",
+        "refine_reasoning": "", "correct_answer": "A", "model_answer": "A" if correct else "B",
+        "reasoning": "x", "country": "Japan", "iteration": iteration,
+    }
+
+
+@pytest.fixture
+def seed_easy_db(tmp_path):
+    """Iteration 1 of n Easy questions in a fresh DB; question i is correct iff correct(i)."""
+    from tools.db.db_utils import save_accuracy, save_results
+
+    def seed(n, correct):
+        db = str(tmp_path / "easy.db")
+        save_results(db, {i: easy_row(i, 1, correct(i)) for i in range(n)}, "Easy", "eng")
+        right = sum(1 for i in range(n) if correct(i))
+        save_accuracy(db, 1, "Easy", "eng", right / n, right, n)
+        return db
+
+    return seed
+
+
+class FakeLLM:
+    """Stands in for iteration_runner's refine and answer calls."""
+
+    def __init__(self):
+        self.refined = []  # question of every refine call, in call order
+        self.correct = lambda i: True
+        self.delay = lambda question: 0.0  # seconds the refine call of question takes
+        self.reply = None  # messages -> answer text, replacing the Easy answer below
+        self.answer_delay = lambda messages: 0.0
+        self.answered = []  # user prompt of every answer call that finished
+        self.cancelled = []  # ... and of every one cancelled while running
+
+    def answers(self, correct):
+        """Answer question i correctly iff correct(i)."""
+        self.correct = correct
+
+    async def refine(self, difficulty, question, prev, mode, country, feedback, long_term_memories=None, pipeline=None):
+        self.refined.append(question)
+        await asyncio.sleep(self.delay(question))
+        return '{"revised_persona": "p", "reasoning": "r"}', None
+
+    async def answer(self, llm, messages, **kwargs):
+        delay = self.answer_delay(messages)
+        if delay:
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                self.cancelled.append(messages[1]["content"])
+                raise
+        self.answered.append(messages[1]["content"])
+        if self.reply is not None:
+            return None, self.reply(messages)
+        question = messages[1]["content"].split("Question: ")[1].split("\n")[0]
+        answer = "A" if self.correct(int(question[1:])) else "B"
+        return None, '{"answer": "%s", "reasoning": "x"}' % answer
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    import iteration_runner as ir
+    from tools import llm_utils
+
+    fake = FakeLLM()
+    monkeypatch.setattr(ir, "generate_new_persona", fake.refine)
+    monkeypatch.setattr(ir, "async_generate", fake.answer)
+    monkeypatch.setattr(llm_utils, "async_generate", fake.answer)  # what generate_batch sends through
+    monkeypatch.setattr(ir, "get_llm", lambda: None)
+    monkeypatch.setattr(ir, "add_input_tokens", lambda *a, **k: None)
+    monkeypatch.setattr(ir, "add_output_tokens", lambda *a, **k: None)
+    return fake
@@ -0,0 +1,112 @@
+import asyncio
+
+import pytest
+
+from tools import adaptive_concurrency as ac
+from tools.adaptive_concurrency import AdaptiveSemaphore, AIMDController
+
+
+class BadRequest(Exception):
+    status_code = 400
+
+
+def _record(ctrl, latency, exc=None, n=1):
+    with ctrl._lock:
+        for _ in range(n):
+            ctrl._record_locked(latency, exc)
+
+
+def test_slots_are_capped_at_the_limit():
+    ctrl = AIMDController("e", initial=2)
+
+    async def main():
+        await ctrl.acquire_async()
+        await ctrl.acquire_async()
+        third = asyncio.create_task(ctrl.acquire_async())
+        await asyncio.sleep(0.01)
+        assert not third.done() and ctrl.in_flight == 2
+        ctrl._release(0.1, None)
+        await asyncio.wait_for(third, 1)
+        assert ctrl.in_flight == 2
+
+    asyncio.run(main())
+
+
+def test_cancelled_waiter_passes_its_wake_up_on():
+    ctrl = AIMDController("e", initial=1)
+
+    async def main():
+        await ctrl.acquire_async()
+        first = asyncio.create_task(ctrl.acquire_async())
+        second = asyncio.create_task(ctrl.acquire_async())
+        await asyncio.sleep(0.01)
+        ctrl._release(0.1, None)  # wakes first ...
+        first.cancel()  # ... which gives up before taking the slot
+        await asyncio.wait_for(second, 1)
+        assert ctrl.in_flight == 1
+
+    asyncio.run(main())
+
+
+def test_saturated_steady_window_increases_the_limit():
+    ctrl = AIMDController("e", initial=4)
+    _record(ctrl, 0.1, n=ac.WINDOW_MIN_SAMPLES)  # first window sets the best p50
+    ctrl._saturated = True
+    _record(ctrl, 0.12, n=ac.WINDOW_MIN_SAMPLES)
+    assert ctrl.current_limit() == 4 + ac.INCREASE_STEP
+    _record(ctrl, 0.1, n=ac.WINDOW_MIN_SAMPLES)  # not saturated: no change
+    assert ctrl.current_limit() == 4 + ac.INCREASE_STEP
+
+
+def test_congestion_error_decreases_once_per_cooldown():
+    ctrl = AIMDController("e", initial=10)
+    _record(ctrl, 0.1, ConnectionError("refused"))
+    assert ctrl.current_limit() == 7
+    _record(ctrl, 0.1, ConnectionError("refused"))
+    assert ctrl.current_limit() == 7
+    assert ctrl.stats["congestion_errors"] == 2 and ctrl.stats["decreases"] == 1
+
+
+def test_client_errors_and_cancellation_do_not_change_the_limit():
+    ctrl = AIMDController("e", initial=10)
+    _record(ctrl, 0.1, BadRequest("bad"))
+    _record(ctrl, 0.1, asyncio.CancelledError())
+    assert ctrl.current_limit() == 10 and ctrl.stats["congestion_errors"] == 0
+
+
+def test_latency_blowup_decreases_the_limit():
+    ctrl = AIMDController("e", initial=10)
+    _record(ctrl, 0.1, n=ac.WINDOW_MIN_SAMPLES)
+    _record(ctrl, 0.1 * ac.LATENCY_BLOWUP * 2, n=ac.WINDOW_MIN_SAMPLES)
+    assert ctrl.current_limit() == 7
+
+
+def test_limit_stays_within_bounds():
+    ctrl = AIMDController("e", initial=1, max_limit=1)
+    _record(ctrl, 0.1, ConnectionError("refused"))
+    assert ctrl.current_limit() == ac.MIN_LIMIT
+    ctrl._saturated = True
+    _record(ctrl, 0.1, n=ac.WINDOW_MIN_SAMPLES)
+    ctrl._saturated = True
+    _record(ctrl, 0.1, n=ac.WINDOW_MIN_SAMPLES)
+    assert ctrl.current_limit() == 1
+
+
+@pytest.mark.parametrize("grow", [False, True])
+def test_adaptive_semaphore_follows_its_capacity(grow):
+    capacity = {"n": 1}
+    sem = AdaptiveSemaphore(lambda: capacity["n"])
+
+    async def main():
+        await sem.acquire()
+        waiter = asyncio.create_task(sem.acquire())
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+        if grow:
+            capacity["n"] = 2
+            sem._wake()
+        else:
+            sem.release()
+        await asyncio.wait_for(waiter, 1)
+
+    asyncio.run(main())
@@ -0,0 +1,87 @@
+import asyncio
+import json
+
+import pytest
+
+from tools import batch_jobs
+from tools.llm_cache import LLMCache
+
+
+@pytest.fixture
+def batch_dir(tmp_path):
+    batch_jobs.configure(str(tmp_path / "batch"))
+    yield tmp_path / "batch"
+    batch_jobs.configure(None)
+
+
+def _request(content):
+    return {
+        "model": "m", "messages": [{"role": "user", "content": content}], "temperature": 0.6, "top_p": 1,
+        "max_tokens": 64, "extra_body": {"chat_template_kwargs": {"enable_thinking": False}}, "timeout": 5,
+    }
+
+
+def _lines(path):
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+def test_defer_exports_each_request_once_per_stage(batch_dir):
+    for content in ("a", "a", "b"):
+        with pytest.raises(batch_jobs.BatchDeferred):
+            batch_jobs.defer(_request(content), stage="answer_easy")
+    lines = _lines(batch_dir / "answer_easy.jsonl")
+    assert [line["body"]["messages"][0]["content"] for line in lines] == ["a", "b"]
+    assert lines[0]["custom_id"] == LLMCache.make_key(_request("a"))
+    assert lines[0]["url"] == batch_jobs.BATCH_ENDPOINT
+    # extra_body is merged into the body as the client would send it; the timeout is not part of it
+    assert lines[0]["body"]["chat_template_kwargs"] == {"enable_thinking": False}
+    assert "extra_body" not in lines[0]["body"] and "timeout" not in lines[0]["body"]
+
+
+def test_existing_batch_file_is_not_duplicated_across_runs(batch_dir):
+    with pytest.raises(batch_jobs.BatchDeferred):
+        batch_jobs.defer(_request("a"), stage="refine")
+    batch_jobs.configure(str(batch_dir))  # a re-run before the batch was ingested
+    with pytest.raises(batch_jobs.BatchDeferred):
+        batch_jobs.defer(_request("a"), stage="refine")
+    assert len(_lines(batch_dir / "refine.jsonl")) == 1
+
+
+def test_export_ingest_round_trip(batch_dir, tmp_path):
+    with pytest.raises(batch_jobs.BatchDeferred):
+        batch_jobs.defer(_request("a"), stage="answer_easy")
+    with pytest.raises(batch_jobs.BatchDeferred):
+        batch_jobs.defer(_request("b"), stage="answer_easy")
+    ids = [line["custom_id"] for line in _lines(batch_dir / "answer_easy.jsonl")]
+    out = tmp_path / "out.jsonl"
+    out.write_text("\n".join(json.dumps(line) for line in [
+        {"custom_id": ids[0], "response": {"status_code": 200, "body": {
+            "model": "m", "choices": [{"message": {"content": " {\"answer\": \"A\"} "}}]}}},
+        {"custom_id": ids[1], "error": {"message": "failed"}},
+    ]) + "\n", encoding="utf-8")
+    cache_path = str(tmp_path / "llm.db")
+    assert batch_jobs.ingest([str(out)], cache_path) == (1, 1)
+    cache = LLMCache(cache_path)
+    assert cache.get(_request("a")) == '{"answer": "A"}'
+    assert cache.get(_request("b")) is None
+    cache.close()
+
+
+def test_plain_text_output_lines_are_ingested(tmp_path):
+    out = tmp_path / "out.jsonl"
+    out.write_text(json.dumps({"custom_id": "k", "text": "hello"}) + "\n", encoding="utf-8")
+    cache_path = str(tmp_path / "llm.db")
+    assert batch_jobs.ingest([str(out)], cache_path) == (1, 0)
+    cache = LLMCache(cache_path)
+    assert cache._conn.execute("SELECT response FROM responses WHERE key = 'k'").fetchone() == ("hello",)
+    cache.close()
+
+
+def test_deferrable_turns_a_deferred_question_into_a_marker(batch_dir):
+    async def question():
+        batch_jobs.defer(_request("a"), stage="refine")
+
+    assert asyncio.run(batch_jobs.deferrable(question())) is batch_jobs.DEFERRED
+    with pytest.raises(batch_jobs.BatchDeferred):
+        batch_jobs.raise_if_deferred(1, "iteration 2")
+    batch_jobs.raise_if_deferred(0, "iteration 2")
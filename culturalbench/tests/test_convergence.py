@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+
+import iteration_runner as ir
+from conftest import easy_row
+from tools.convergence import ConvergencePolicy
+from tools.db.db_utils import append_results, load_results
+
+
+def test_carry_flags_rows_and_counts_saved_calls():
+    policy = ConvergencePolicy(after=2)
+    assert not policy.is_stable(1) and policy.is_stable(2)
+    rows = policy.carry({3: easy_row(3, 2, True)}, 3, calls=2)
+    assert rows[3]["iteration"] == 3 and rows[3]["carried_forward"] == 1
+    policy.carry({4: easy_row(4, 2, True)}, 4, calls=2)
+    assert policy.get_stats() == {
+        "3": {"carried": 1, "calls_saved": 2},
+        "4": {"carried": 1, "calls_saved": 2},
+        "total": {"carried": 2, "calls_saved": 4},
+    }
+
+
+def test_correct_streaks(seed_easy_db):
+    db = seed_easy_db(3, lambda i: i != 2)
+    append_results(db, {0: easy_row(0, 2, True), 1: easy_row(1, 2, False), 2: easy_row(2, 2, True)}, "Easy", "eng")
+    append_results(db, {0: easy_row(0, 3, True), 1: easy_row(1, 3, True), 2: easy_row(2, 3, True)}, "Easy", "eng")
+    # streaks of correct iterations just before iteration 4, capped at k
+    assert ir._correct_streaks(db, 4, 3, "Easy", "eng") == {
+        ("q0", "Japan"): 3, ("q1", "Japan"): 1, ("q2", "Japan"): 2,
+    }
+    assert ir._correct_streaks(db, 4, 1, "Easy", "eng") == {
+        ("q0", "Japan"): 1, ("q1", "Japan"): 1, ("q2", "Japan"): 1,
+    }
+    assert ir._correct_streaks(db, 2, 3, "Easy", "eng") == {("q0", "Japan"): 1, ("q1", "Japan"): 1}
+
+
+@pytest.mark.parametrize("chains", [False, True])
+def test_stable_questions_are_carried_forward(seed_easy_db, fake_llm, chains):
+    # q0-q2 are always answered correctly, q3-q5 never
+    fake_llm.answers(lambda i: i < 3)
+    db = seed_easy_db(6, lambda i: i < 3)
+    policy = ConvergencePolicy(after=2)
+    accuracies = asyncio.run(ir.run_iterations(
+        "eng", 5, "Easy", db, start_iteration=2, use_memory=False, chains=chains, convergence=policy,
+    ))
+    assert accuracies == [0.5] * 4
+    # iteration 2 runs everything (one correct iteration so far); from 3 on q0-q2 are carried
+    assert len(fake_llm.refined) == 6 + 3 * 3
+    for it in (3, 4, 5):
+        rows = load_results(db, iteration=it, difficulty="Easy", mode="eng")
+        assert sorted(r["question"] for r in rows if r["carried_forward"]) == ["q0", "q1", "q2"]
+    assert policy.get_stats()["total"] == {"carried": 9, "calls_saved": 9 * 2}
+
+
+def test_a_wrong_answer_resets_the_streak(seed_easy_db, fake_llm):
+    # q0 is wrong in iteration 2 only, so it needs two more correct iterations before it is carried
+    fake_llm.answers(lambda i: len(fake_llm.refined) > 1)
+    db = seed_easy_db(1, lambda i: True)
+    asyncio.run(ir.run_iterations(
+        "eng", 5, "Easy", db, start_iteration=2, use_memory=False, convergence=ConvergencePolicy(after=2),
+    ))
+    flags = [load_results(db, iteration=it, difficulty="Easy", mode="eng")[0]["carried_forward"] for it in (2, 3, 4, 5)]
+    assert flags == [0, 0, 0, 1]
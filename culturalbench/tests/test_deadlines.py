@@ -0,0 +1,54 @@
+import asyncio
+
+from tools import deadlines
+
+
+def test_no_deadline_by_default():
+    assert deadlines.current() is None and deadlines.remaining() is None and not deadlines.expired()
+    with deadlines.scope(None) as deadline:
+        assert deadline is None
+
+
+def test_nested_scopes_only_tighten():
+    with deadlines.scope(10) as outer:
+        with deadlines.scope(100) as inner:
+            assert inner == outer
+        with deadlines.scope(1) as inner:
+            assert inner < outer
+            assert 0 < deadlines.remaining() <= 1
+        assert deadlines.current() == outer
+    assert deadlines.current() is None
+
+
+def test_deadline_follows_tasks_and_threads():
+    async def main():
+        with deadlines.scope(5) as deadline:
+            seen_in_task = await asyncio.create_task(asyncio.sleep(0, deadlines.current()))
+            seen_in_thread = await asyncio.to_thread(deadlines.current)
+        return deadline, seen_in_task, seen_in_thread
+
+    deadline, seen_in_task, seen_in_thread = asyncio.run(main())
+    assert seen_in_task == seen_in_thread == deadline
+
+
+def test_bounded_cancels_overdue_work():
+    cancelled = []
+
+    async def slow():
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def main():
+        with deadlines.scope(0.05):
+            late = await deadlines.bounded(slow())
+            assert deadlines.expired()
+        with deadlines.scope(1):
+            on_time = await deadlines.bounded(asyncio.sleep(0, "done"))
+        unbounded = await deadlines.bounded(asyncio.sleep(0, "free"))
+        return late, on_time, unbounded
+
+    assert asyncio.run(main()) == (deadlines.OVERDUE, "done", "free")
+    assert cancelled == [True]
@@ -0,0 +1,81 @@
+import json
+import time
+
+import pytest
+
+from tools import endpoints
+from tools.endpoints import EndpointPool, get_pool, load_endpoints_config
+from tools.rate_limiter import get_limiter
+
+
+@pytest.fixture(autouse=True)
+def registry(monkeypatch):
+    monkeypatch.setattr(endpoints, "_configured", {})
+    monkeypatch.setattr(endpoints, "_pools", {})
+    monkeypatch.setattr(endpoints, "HEALTH_CHECK_INTERVAL_SEC", 0)  # no probe thread
+
+
+def test_least_outstanding_replica_wins_and_ties_rotate():
+    pool = EndpointPool("m", ["http://a/v1", "http://b/v1/"])
+    first = pool.acquire()
+    second = pool.acquire()
+    assert {first.base_url, second.base_url} == {"http://a/v1", "http://b/v1"}
+    pool.release(first)
+    assert pool.acquire() is first  # the other one is still busy
+    assert (first.requests, second.requests) == (2, 1)
+
+
+def test_unhealthy_and_open_circuit_replicas_are_skipped():
+    pool = EndpointPool("m", ["http://sick/v1", "http://tripped/v1", "http://ok/v1"])
+    pool.replicas[0].healthy = False
+    limiter = get_limiter("http://tripped/v1")
+    limiter.open_until = time.monotonic() + 60
+    try:
+        assert {pool.acquire().base_url for _ in range(3)} == {"http://ok/v1"}
+    finally:
+        limiter.open_until = 0
+
+
+def test_lease_excludes_tried_replicas_and_falls_back_when_none_is_available():
+    pool = EndpointPool("m", ["http://a/v1", "http://b/v1"])
+    with pool.lease(exclude=["http://a/v1"]) as url:
+        assert url == "http://b/v1"
+    assert all(r.outstanding == 0 for r in pool.replicas)
+    for r in pool.replicas:
+        r.healthy = False
+    with pool.lease(exclude=["http://a/v1"]) as url:
+        assert url == "http://b/v1"  # still routed, so retries and backoff can take over
+
+
+def test_probe_marks_replicas_not_serving_the_model(monkeypatch):
+    served = {"http://a/v1/models": ["m"], "http://b/v1/models": ["other"]}
+
+    class Response:
+        def __init__(self, url):
+            self.url = url
+
+        def raise_for_status(self):
+            if self.url not in served:
+                raise ConnectionError("refused")
+
+        def json(self):
+            return {"data": [{"id": m} for m in served[self.url]]}
+
+    monkeypatch.setattr(endpoints.httpx, "get", lambda url, timeout: Response(url))
+    pool = EndpointPool("m", ["http://a/v1", "http://b/v1", "http://c/v1"])
+    pool.probe()
+    assert [r.healthy for r in pool.replicas] == [True, False, False]
+    assert pool.replicas[1].last_error == "serves ['other']"
+    assert pool.replicas[2].last_error.startswith("ConnectionError")
+
+
+def test_config_replicas_override_the_fallback(tmp_path):
+    path = tmp_path / "endpoints.json"
+    path.write_text(json.dumps({"models": {"m": ["http://a/v1", "http://b/v1"], "n": "http://c/v1"}}))
+    load_endpoints_config(str(path))
+    assert [r.base_url for r in get_pool("m", fallback_urls=["http://default/v1"]).replicas] == ["http://a/v1", "http://b/v1"]
+    assert [r.base_url for r in get_pool("n").replicas] == ["http://c/v1"]
+    assert [r.base_url for r in get_pool("x", fallback_urls=["http://default/v1"]).replicas] == ["http://default/v1"]
+    assert get_pool("m") is get_pool("m")
+    with pytest.raises(ValueError):
+        get_pool("unknown")
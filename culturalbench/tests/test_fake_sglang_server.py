@@ -0,0 +1,109 @@
+import asyncio
+import importlib.util
+import json
+import os
+
+import pytest
+
+from persona_generator import _parse_initial_persona_response
+from tools.response_utils import parse_easy_answer, parse_hard_answer
+
+aiohttp = pytest.importorskip("aiohttp")
+
+_spec = importlib.util.spec_from_file_location(
+    "fake_sglang_server", os.path.join(os.path.dirname(__file__), "..", "misc", "fake_sglang_server.py")
+)
+fake = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(fake)
+
+MODEL = "google/gemma-3-12b-it"
+EASY = [{"role": "system", "content": "You are from Japan."}, {"role": "user", "content": (
+    'Respond in valid JSON format with two keys: \n"answer" (either "A", "B", "C", or "D") and "reasoning".\nQuestion: q'
+)}]
+HARD = [{"role": "system", "content": "You are from Japan."}, {"role": "user", "content": (
+    'Respond in valid JSON format with two keys: \n"correct" (either "true" or "false") and "reasoning".'
+)}]
+
+
+def _serve(*requests, **overrides):
+    """Run the fake server on a free port and send requests: (method, path, json body) -> (status, body)."""
+    args = fake.parse_args(["--ttft_ms", "0", "--ttft_dist", "fixed", "--tokens_per_sec", "1e9", "--models", MODEL])
+    for k, v in overrides.items():
+        setattr(args, k, v)
+
+    async def main():
+        runner = aiohttp.web.AppRunner(fake.build_app(args), access_log=None)
+        await runner.setup()
+        site = aiohttp.web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = runner.addresses[0][1]
+        out = []
+        try:
+            async with aiohttp.ClientSession() as session:
+                for method, path, body in requests:
+                    async with session.request(method, f"http://127.0.0.1:{port}{path}", json=body) as resp:
+                        text = await resp.text()
+                        out.append((resp.status, text if (body or {}).get("stream") else json.loads(text)))
+        finally:
+            await runner.cleanup()
+        return out
+
+    return asyncio.run(main())
+
+
+def _chat(messages, **extra):
+    return "POST", "/v1/chat/completions", {"model": MODEL, "messages": messages, **extra}
+
+
+def _content(body):
+    return body["choices"][0]["message"]["content"]
+
+
+def test_canned_answers_parse_and_are_deterministic():
+    (_, easy), (_, easy_again), (_, hard) = _serve(_chat(EASY), _chat(EASY), _chat(HARD))
+    assert parse_easy_answer(_content(easy))[0] in fake.LETTERS
+    assert _content(easy) == _content(easy_again)
+    assert parse_hard_answer(_content(hard))[0] in ("true", "false")
+
+
+def test_initial_persona_prompt_gets_a_json_persona():
+    messages = [{"role": "system", "content": 'Reply with {"reasoning": "...", "persona": "..."}'},
+                {"role": "user", "content": "Question: q"}]
+    (_, body), = _serve(_chat(messages))
+    persona, reasoning = _parse_initial_persona_response(_content(body), "eng")
+    assert persona.startswith("You are") and reasoning
+
+
+def test_repeated_prefix_is_reported_as_cached():
+    (_, first), (_, second), (_, stats) = _serve(_chat(EASY), _chat(EASY), ("GET", "/stats", None))
+    assert first["usage"]["prompt_tokens_details"]["cached_tokens"] == 0
+    assert second["usage"]["prompt_tokens_details"]["cached_tokens"] > 0
+    assert stats["requests"] == 2 and stats["cached_tokens"] == second["usage"]["prompt_tokens_details"]["cached_tokens"]
+
+
+def test_max_tokens_truncates_and_unknown_models_are_rejected():
+    (_, cut), (status, _), (_, models), (_, info) = _serve(
+        _chat(EASY, max_tokens=2),
+        ("POST", "/v1/chat/completions", {"model": "other", "messages": EASY}),
+        ("GET", "/v1/models", None),
+        ("GET", "/get_server_info", None),
+        kv_tokens=1234,
+    )
+    assert cut["choices"][0]["finish_reason"] == "length" and cut["usage"]["completion_tokens"] == 2
+    assert status == 404
+    assert [m["id"] for m in models["data"]] == [MODEL]
+    assert info["max_total_num_tokens"] == 1234
+
+
+def test_stream_reassembles_to_the_plain_response():
+    (_, plain), (_, stream) = _serve(_chat(HARD), _chat(HARD, stream=True, stream_options={"include_usage": True}))
+    events = [json.loads(line[6:]) for line in stream.splitlines() if line.startswith("data: {")]
+    text = "".join(e["choices"][0]["delta"].get("content", "") for e in events if e["choices"])
+    assert text == _content(plain)
+    assert events[-1]["usage"]["completion_tokens"] == plain["usage"]["completion_tokens"]
+    assert stream.rstrip().endswith("data: [DONE]")
+
+
+def test_injected_errors_use_the_configured_status():
+    (status, body), = _serve(_chat(EASY), error_rate=1.0, error_codes=[429], error_delay_ms=0)
+    assert status == 429 and body["error"]["message"] == "injected failure"
@@ -0,0 +1,99 @@
+import asyncio
+
+import iteration_runner as ir
+from tools import llm_utils, stage_pipeline
+
+
+class Burst:
+    """async_generate that records how many requests were in flight together."""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.peak = 0
+
+    async def __call__(self, llm, messages, **kwargs):
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        await asyncio.sleep(0.01 * (4 - int(messages[1]["content"][-1])))  # later prompts finish first
+        self.in_flight -= 1
+        return None, messages[1]["content"]
+
+
+def _prompts(n):
+    return [[{"role": "system", "content": "p"}, {"role": "user", "content": f"option {j}"}] for j in range(n)]
+
+
+def test_group_is_sent_as_one_burst_in_prompt_order(monkeypatch):
+    burst = Burst()
+    monkeypatch.setattr(llm_utils, "async_generate", burst)
+    outputs = asyncio.run(llm_utils.generate_batch(None, _prompts(4)))
+    assert outputs == [(None, f"option {j}") for j in range(4)]
+    assert burst.peak == 4
+
+
+def test_hard_iteration_set_judges_its_options_in_one_batch(fake_llm, monkeypatch):
+    batches = []
+
+    async def generate_batch(llm, list_of_messages, check=None, **kwargs):
+        batches.append(len(list_of_messages))
+        return [check(j, (None, '{"correct": "%s", "reasoning": "r"}' % ("true" if j == 0 else "false")))
+                for j in range(len(list_of_messages))]
+
+    monkeypatch.setattr(ir, "generate_batch", generate_batch)
+    data = {
+        j: {
+            "question": "q0", "prompt_option": f"o{j}", "persona_description": "p0", "reasoning": "x",
+            "country": "Japan", "correct_answer": "1" if j == 0 else "0",
+        }
+        for j in range(4)
+    }
+    set_data, is_correct = asyncio.run(
+        ir._process_hard_iter_set(0, data, "eng", 2, False, False, stage_pipeline.for_iteration({}, llm_utils.question_semaphore))
+    )
+    assert batches == [4] and len(fake_llm.refined) == 1  # one persona, one batch of four options
+    assert [set_data[j]["model_answer"] for j in range(4)] == ["true", "false", "false", "false"]
+    assert is_correct and all(row["persona_description"] == "p" for row in set_data.values())
+
+
+def _shared_prefix_steering(monkeypatch, groups):
+    """Steering model with --steering_shared_prefix; groups records each group generation."""
+
+    async def generate_group(llm, list_of_messages, **kwargs):
+        groups.append(len(list_of_messages))
+        return [(None, m[1]["content"]) for m in list_of_messages]
+
+    async def single(llm, messages, **kwargs):
+        return None, "single " + messages[1]["content"]
+
+    monkeypatch.setattr(llm_utils, "STEERING_SHARED_PREFIX", True)
+    monkeypatch.setitem(llm_utils.generate_text_funcs, llm_utils.MODEL_NAME, llm_utils._steering_generate)
+    monkeypatch.setattr(llm_utils, "_steering_generate_group_async", generate_group)
+    monkeypatch.setattr(llm_utils, "async_generate", single)
+
+
+def test_shared_prefix_group_goes_to_the_steering_worker_as_one_request(monkeypatch):
+    groups = []
+    _shared_prefix_steering(monkeypatch, groups)
+    assert asyncio.run(llm_utils.generate_batch(None, _prompts(4))) == [(None, f"option {j}") for j in range(4)]
+    assert asyncio.run(llm_utils.generate_batch(None, _prompts(1))) == [(None, "single option 0")]
+    assert groups == [4]
+
+
+def test_shared_prefix_group_stops_checking_at_the_first_failure(monkeypatch):
+    _shared_prefix_steering(monkeypatch, [])
+    checked = []
+
+    def check(j, output):
+        checked.append(j)
+        return None if j == 1 else output
+
+    assert asyncio.run(llm_utils.generate_batch(None, _prompts(4), check=check)) is None
+    assert checked == [0, 1]
+
+
+def test_shared_prefix_routes_every_steering_call_through_the_worker(monkeypatch):
+    monkeypatch.setattr(llm_utils, "STEERING_BATCH_SIZE", 1)
+    monkeypatch.setattr(llm_utils, "STEERING_SHARED_PREFIX", False)
+    assert not llm_utils._steering_uses_worker()
+    monkeypatch.setattr(llm_utils, "STEERING_SHARED_PREFIX", True)
+    assert llm_utils._steering_uses_worker()
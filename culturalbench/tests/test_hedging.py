@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+
+from tools.hedging import MIN_DELAY_SEC, HedgePolicy
+
+
+def _policy(latency=0.05, samples=20, max_extra=1.0):
+    policy = HedgePolicy(percentile=95, max_extra=max_extra, min_samples=samples)
+    for _ in range(samples):
+        policy._observe("answer", latency)
+    return policy
+
+
+def _respond(value, after, started=None):
+    async def fn():
+        if started is not None:
+            started.append(value)
+        try:
+            await asyncio.sleep(after)
+        except asyncio.CancelledError:
+            if started is not None:
+                started.append(f"{value} cancelled")
+            raise
+        return value
+    return fn
+
+
+def test_no_hedge_before_enough_samples():
+    policy = HedgePolicy(min_samples=20)
+    started = []
+    assert asyncio.run(policy.run("answer", _respond("p", 0.1, started), _respond("h", 0, started))) == "p"
+    assert started == ["p"]
+    assert policy.threshold("answer") is None
+
+
+def test_straggler_is_hedged_and_the_hedge_wins():
+    policy = _policy()
+    started = []
+    result = asyncio.run(policy.run("answer", _respond("p", 1.0, started), _respond("h", 0, started)))
+    assert result == "h"
+    assert started == ["p", "h", "p cancelled"]
+    assert policy.stats["answer"] == {"requests": 1, "hedged": 1, "hedge_wins": 1, "over_budget": 0}
+
+
+def test_fast_primary_is_not_hedged():
+    policy = _policy(latency=0.5)
+    started = []
+    assert asyncio.run(policy.run("answer", _respond("p", 0.01, started), _respond("h", 0, started))) == "p"
+    assert started == ["p"]
+
+
+def test_failed_response_waits_for_the_other_request():
+    policy = _policy()
+    assert asyncio.run(policy.run("answer", _respond("p", 0.2), _respond(None, 0))) == "p"
+
+
+def test_hedges_stay_within_the_extra_load_budget():
+    policy = _policy(max_extra=0.0)
+    started = []
+    assert asyncio.run(policy.run("answer", _respond("p", 0.2, started), _respond("h", 0, started))) == "p"
+    assert started == ["p"]
+    assert policy.stats["answer"]["over_budget"] == 1
+
+
+def test_threshold_has_a_floor():
+    assert _policy(latency=0.001).threshold("answer") == MIN_DELAY_SEC
+
+
+def test_exception_is_raised_when_no_request_succeeds():
+    async def boom():
+        raise ConnectionError("refused")
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(HedgePolicy().run("answer", boom, boom))
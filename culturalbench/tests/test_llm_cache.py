@@ -0,0 +1,90 @@
+import time
+
+import pytest
+
+from tools.llm_cache import LLMCache
+
+
+def _request(content, **overrides):
+    return {
+        "model": "m", "messages": [{"role": "user", "content": content}],
+        "temperature": 0.6, "top_p": 1, "max_tokens": 1024, **overrides,
+    }
+
+
+@pytest.fixture
+def cache(tmp_path):
+    c = LLMCache(str(tmp_path / "llm.db"))
+    yield c
+    c.close()
+
+
+def _age(cache, request, seconds_ago):
+    with cache._lock:
+        cache._conn.execute(
+            "UPDATE responses SET last_access = ?, created_at = ? WHERE key = ?",
+            (time.time() - seconds_ago, time.time() - seconds_ago, LLMCache.make_key(request)),
+        )
+        cache._conn.commit()
+
+
+def test_hit_after_put_and_miss_otherwise(cache):
+    cache.put(_request("a"), "answer")
+    assert cache.get(_request("a")) == "answer"
+    assert cache.get(_request("b")) is None
+    assert cache.get_stats()["hit_rate"] == 0.5
+
+
+@pytest.mark.parametrize("field, value", [
+    ("model", "other"), ("temperature", 0), ("max_tokens", 64),
+    ("extra_body", {"chat_template_kwargs": {"enable_thinking": True}}),
+    ("response_format", {"type": "json_schema"}),
+])
+def test_key_covers_fields_that_change_the_completion(field, value):
+    assert LLMCache.make_key(_request("a")) != LLMCache.make_key(_request("a", **{field: value}))
+
+
+def test_key_ignores_unrelated_fields():
+    assert LLMCache.make_key(_request("a")) == LLMCache.make_key(_request("a", timeout=5, stream=True))
+
+
+def test_lru_eviction_keeps_recently_used_entries(tmp_path):
+    cache = LLMCache(str(tmp_path / "llm.db"), max_mb=25 / (1024 * 1024))  # 25 bytes
+    for i, seconds_ago in enumerate((30, 20, 10)):
+        cache.put(_request(str(i)), "x" * 10)
+        _age(cache, _request(str(i)), seconds_ago)
+    cache.get(_request("0"))  # most recently used now
+    cache.evict()
+    assert cache.get(_request("1")) is None
+    assert cache.get(_request("0")) == "x" * 10
+    assert cache.get(_request("2")) == "x" * 10
+    assert cache.stats["evicted"] == 1
+    cache.close()
+
+
+def test_max_age_eviction(tmp_path):
+    cache = LLMCache(str(tmp_path / "llm.db"), max_age_days=1)
+    cache.put(_request("old"), "x")
+    cache.put(_request("new"), "y")
+    _age(cache, _request("old"), 2 * 86400)
+    cache.evict()
+    assert cache.get(_request("old")) is None and cache.get(_request("new")) == "y"
+    cache.close()
+
+
+def test_replay_mode_never_stores(tmp_path):
+    path = str(tmp_path / "llm.db")
+    writer = LLMCache(path)
+    writer.put(_request("a"), "answer")
+    writer.close()
+    replay = LLMCache(path, mode="replay")
+    replay.put(_request("b"), "other")
+    assert replay.get(_request("a")) == "answer"
+    assert replay.get(_request("b")) is None
+    assert replay.stats["replay_misses"] == 1
+    replay.close()
+
+
+def test_unknown_mode_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        LLMCache(str(tmp_path / "llm.db"), mode="bogus")
@@ -0,0 +1,57 @@
+import pytest
+
+from tools import llm_utils
+from tools.max_tokens import MIN_CAP, MaxTokensPolicy
+
+
+def _policy(lengths, stage="refine"):
+    policy = MaxTokensPolicy(percentile=99, margin=1.25, min_samples=10)
+    for n in lengths:
+        policy.observe("m", stage, n)
+    return policy
+
+
+def test_no_cap_before_enough_samples():
+    policy = _policy([100] * 9)
+    assert policy.cap("m", "refine", 1024) == 1024
+    assert policy.cap("m", "refine", None) is None
+
+
+def test_cap_is_percentile_times_margin_below_the_callers_cap():
+    policy = _policy([100] * 20)
+    assert policy.cap("m", "refine", 1024) == 125
+    assert policy.cap("m", "refine", 100) == 100
+    assert policy.stats[("m", "refine")] == {"requests": 2, "capped": 1, "truncated": 0, "tokens_saved": 899}
+    assert _policy([1] * 20).cap("m", "refine", 1024) == MIN_CAP
+
+
+def test_uncapped_requests_get_the_learned_cap_without_a_ceiling():
+    policy = _policy([2000] * 20)
+    assert policy.cap("m", "refine", None) == 2500
+    assert policy.stats[("m", "refine")]["tokens_saved"] == 0
+
+
+@pytest.fixture
+def adaptive(monkeypatch):
+    def use(policy):
+        monkeypatch.setattr(llm_utils, "MAX_TOKENS_POLICY", policy)
+    return use
+
+
+def test_adaptive_kwargs_keeps_uncapped_refine_uncapped(adaptive):
+    adaptive(_policy([]))
+    kwargs = {"model": "m", "messages": [], "max_tokens": None}
+    assert llm_utils._adaptive_kwargs(kwargs, "refine") is kwargs
+
+
+def test_adaptive_kwargs_caps_uncapped_refine_above_1024(adaptive):
+    adaptive(_policy([1600] * 20))
+    kwargs = {"model": "m", "messages": [], "max_tokens": None}
+    assert llm_utils._adaptive_kwargs(kwargs, "refine")["max_tokens"] == 2000
+
+
+def test_adaptive_kwargs_lowers_explicit_cap(adaptive):
+    adaptive(_policy([40] * 20, stage="answer_easy"))
+    kwargs = {"model": "m", "messages": [], "max_tokens": 1024}
+    assert llm_utils._adaptive_kwargs(kwargs, "answer_easy")["max_tokens"] == 50
+    assert llm_utils._adaptive_kwargs({**kwargs, "max_tokens": 30}, "answer_easy")["max_tokens"] == 30
@@ -0,0 +1,90 @@
+import asyncio
+from types import SimpleNamespace
+
+from tools import prefix_scheduler
+from tools.prefix_scheduler import PrefixScheduler, prefix_key
+
+
+def _order(scheduler, keys, hold=0.01):
+    """Dispatch order of requests queued (in keys order) behind one holding a slot of group "a"."""
+    order = []
+
+    async def request(key, n):
+        async def call():
+            order.append(f"{key}{n}")
+            await asyncio.sleep(hold)
+        await scheduler.run(key, call)
+
+    async def main():
+        first = asyncio.create_task(request("a", 0))
+        await asyncio.sleep(0)
+        rest = [asyncio.create_task(request(k, n)) for n, k in enumerate(keys, 1)]
+        await asyncio.gather(first, *rest)
+
+    asyncio.run(main())
+    return order
+
+
+def test_waiters_of_the_running_group_go_first():
+    scheduler = PrefixScheduler(1)
+    assert _order(scheduler, ["b", "a", "b", "a"]) == ["a0", "a2", "a4", "b1", "b3"]
+    assert scheduler.stats["group_switches"] == 1 and scheduler.stats["same_prefix_dispatches"] == 3
+
+
+def test_group_burst_cap_lets_other_groups_in():
+    assert _order(PrefixScheduler(1, max_group_burst=2), ["a", "a", "b"]) == ["a0", "a1", "b3", "a2"]
+
+
+def test_in_flight_cap_follows_a_callable():
+    limit = {"n": 2}
+    scheduler = PrefixScheduler(lambda: limit["n"])
+    peak = {"now": 0, "max": 0}
+
+    async def call():
+        peak["now"] += 1
+        peak["max"] = max(peak["max"], peak["now"])
+        await asyncio.sleep(0.01)
+        peak["now"] -= 1
+
+    async def main():
+        await asyncio.gather(*(scheduler.run(str(i % 3), call) for i in range(6)))
+        limit["n"] = 4
+        await asyncio.gather(*(scheduler.run(str(i % 3), call) for i in range(8)))
+
+    asyncio.run(main())
+    assert peak["max"] == 4 and scheduler._in_flight == 0
+
+
+def test_cancelled_waiter_does_not_leak_a_slot():
+    scheduler = PrefixScheduler(1)
+
+    async def main():
+        hold = asyncio.Event()
+        first = asyncio.create_task(scheduler.run("a", hold.wait))
+        await asyncio.sleep(0)
+        queued = asyncio.create_task(scheduler.run("b", hold.wait))
+        await asyncio.sleep(0)
+        queued.cancel()
+        hold.set()
+        await first
+        assert await asyncio.wait_for(scheduler.run("c", lambda: asyncio.sleep(0, "ran")), 1) == "ran"
+
+    asyncio.run(main())
+    assert scheduler._in_flight == 0 and not scheduler._waiting
+
+
+def test_prefix_key_uses_the_system_message():
+    persona = {"role": "system", "content": "You are from Osaka."}
+    assert prefix_key([persona, {"role": "user", "content": "q1"}]) == prefix_key([persona, {"role": "user", "content": "q2"}])
+    assert prefix_key([{"role": "user", "content": "x" * 512 + "1"}]) == prefix_key([{"role": "user", "content": "x" * 512 + "2"}])
+    assert prefix_key([]) == ""
+
+
+def test_cached_token_ratio(monkeypatch):
+    monkeypatch.setattr(prefix_scheduler, "_usage", {"requests": 0, "reported": 0, "prompt_tokens": 0, "cached_tokens": 0})
+    prefix_scheduler.record_usage(SimpleNamespace(prompt_tokens=100, prompt_tokens_details=SimpleNamespace(cached_tokens=75)))
+    prefix_scheduler.record_usage(SimpleNamespace(prompt_tokens=100, prompt_tokens_details=None))
+    prefix_scheduler.record_usage(None)
+    assert prefix_scheduler.get_prefix_cache_stats() == {
+        "requests": 3, "reported": 1, "prompt_tokens": 200, "cached_tokens": 75, "cached_ratio": 0.375,
+    }
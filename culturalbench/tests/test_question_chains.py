@@ -0,0 +1,43 @@
+import asyncio
+
+import iteration_runner as ir
+from tools import llm_utils
+from tools.db.db_utils import load_results
+
+
+def _run(db, chains, num_iterations=3):
+    return asyncio.run(ir.run_iterations(
+        "eng", num_iterations, "Easy", db, start_iteration=2, use_memory=False, chains=chains,
+    ))
+
+
+def test_chains_match_barrier_iterations(tmp_path, seed_easy_db, fake_llm):
+    fake_llm.answers(lambda i: i % 2 == 0)
+    results = {}
+    for chains in (False, True):
+        db = seed_easy_db(4, lambda i: True)
+        results[chains] = (_run(db, chains), [
+            sorted((r["question"], r["model_answer"]) for r in load_results(db, iteration=it, difficulty="Easy", mode="eng"))
+            for it in (2, 3)
+        ])
+        (tmp_path / "easy.db").unlink()
+    assert results[False] == results[True]
+    assert results[True][0] == [0.5, 0.5]
+
+
+def test_chain_step_budget_is_per_iteration(seed_easy_db, fake_llm, monkeypatch):
+    # each step gets the budget on its own: q0's slow first step is cut off even though the
+    # chain as a whole is well within iterations * budget, and the other chains are unaffected
+    monkeypatch.setattr(llm_utils, "ITERATION_BUDGET", 0.2)
+    monkeypatch.setattr(llm_utils, "MAX_CONCURRENT", 8)
+    calls = {}
+
+    def delay(question):
+        calls[question] = calls.get(question, 0) + 1
+        return 0.4 if question == "q0" and calls[question] == 1 else 0.05
+
+    fake_llm.delay = delay
+    db = seed_easy_db(3, lambda i: True)
+    assert _run(db, chains=True, num_iterations=4) == [2 / 3, 1.0, 1.0]
+    assert [r["question"] for r in load_results(db, iteration=2, difficulty="Easy", mode="eng")].count("q0") == 0
+    assert len(load_results(db, iteration=3, difficulty="Easy", mode="eng")) == 2
@@ -0,0 +1,116 @@
+import asyncio
+import time
+
+import pytest
+
+from tools import rate_limiter
+from tools.rate_limiter import EndpointLimiter, TokenBucket, acall_with_retries, call_with_retries
+
+
+@pytest.fixture
+def limiter(monkeypatch):
+    monkeypatch.setattr(rate_limiter, "_limiters", {})
+    monkeypatch.setattr(rate_limiter, "backoff_delay", lambda error_class, attempt: 0.0)
+    return rate_limiter.get_limiter("http://test/v1")
+
+
+def _open_then_cool_down(limiter):
+    limiter.open_until = time.monotonic() - 1  # cooldown already elapsed: next request is the probe
+
+
+def test_token_bucket_delays_past_burst_and_recovers_rate():
+    bucket = TokenBucket(rate=10, burst=2)
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == pytest.approx(0.1, abs=0.01)
+    bucket.throttle()
+    assert bucket.rate == 5
+    bucket.recover()
+    assert bucket.rate == 5 + rate_limiter.RATE_RECOVERY_STEP
+
+
+def test_connection_failures_open_circuit_and_fail_fast(limiter):
+    calls = []
+
+    def refused():
+        calls.append(1)
+        raise ConnectionError("refused")
+
+    assert call_with_retries(limiter.endpoint, refused) is None
+    assert len(calls) == rate_limiter.CIRCUIT_FAILURE_THRESHOLD
+    assert limiter.stats["circuit_opens"] == 1
+    assert call_with_retries(limiter.endpoint, refused) is None
+    assert len(calls) == rate_limiter.CIRCUIT_FAILURE_THRESHOLD
+    assert limiter.stats["circuit_rejections"] == 1
+
+
+def test_successful_probe_closes_circuit(limiter):
+    _open_then_cool_down(limiter)
+    assert call_with_retries(limiter.endpoint, lambda: "ok") == "ok"
+    assert limiter.open_until == 0.0 and not limiter.half_open_probe
+
+
+def test_only_one_probe_while_half_open(limiter):
+    _open_then_cool_down(limiter)
+    assert limiter.acquire() is True
+    with pytest.raises(rate_limiter.CircuitOpenError):
+        limiter.acquire()
+
+
+def test_cancelled_probe_releases_half_open(limiter):
+    async def main():
+        started = asyncio.Event()
+
+        async def hang():
+            started.set()
+            await asyncio.sleep(60)
+
+        _open_then_cool_down(limiter)
+        task = asyncio.create_task(acall_with_retries(limiter.endpoint, hang))
+        await started.wait()
+        assert limiter.half_open_probe
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert not limiter.half_open_probe
+
+        async def ok():
+            return "ok"
+
+        # the next request probes instead of failing fast, and closes the circuit
+        assert await acall_with_retries(limiter.endpoint, ok) == "ok"
+        assert limiter.open_until == 0.0
+
+    asyncio.run(main())
+
+
+def test_probe_cancelled_while_throttled_releases_half_open(limiter):
+    limiter.bucket = TokenBucket(rate=1, burst=1)
+    limiter.bucket.tokens = 0
+
+    async def main():
+        _open_then_cool_down(limiter)
+        task = asyncio.create_task(limiter.acquire_async())
+        await asyncio.sleep(0.01)
+        assert limiter.half_open_probe
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert not limiter.half_open_probe
+
+    asyncio.run(main())
+
+
+def test_client_errors_are_not_retried(limiter):
+    class BadRequest(Exception):
+        status_code = 400
+
+    calls = []
+
+    def bad():
+        calls.append(1)
+        raise BadRequest("bad")
+
+    assert call_with_retries(limiter.endpoint, bad) is None
+    assert len(calls) == 1
+    assert limiter.errors_by_class["client"] == 1
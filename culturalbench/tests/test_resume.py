@@ -0,0 +1,111 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+import iteration_runner as ir
+from conftest import easy_row
+from tools.db.db_utils import (
+    ResultsWriter, append_results, clear_results, get_all_iterations, get_completed_iterations, init_db,
+    load_results, save_accuracy,
+)
+
+
+def test_append_results_keeps_existing_rows(tmp_path):
+    db = str(tmp_path / "r.db")
+    append_results(db, {0: easy_row(0, 2, True)}, "Easy", "eng")
+    append_results(db, {1: easy_row(1, 2, False)}, "Easy", "eng")
+    rows = load_results(db, iteration=2, difficulty="Easy", mode="eng")
+    assert [r["question"] for r in rows] == ["q0", "q1"]
+    assert rows[0]["options"] == {"A": "a", "B": "b", "C": "c", "D": "d"}
+    assert rows[0]["carried_forward"] == 0
+
+
+def test_results_writer_appends_from_worker_threads(tmp_path):
+    db = str(tmp_path / "r.db")
+    writer = ResultsWriter(db, "Easy", "eng")
+
+    async def main():
+        await asyncio.gather(*(asyncio.to_thread(writer.append, {i: easy_row(i, 2, True)}) for i in range(8)))
+
+    asyncio.run(main())
+    writer.close()
+    rows = load_results(db, iteration=2, difficulty="Easy", mode="eng")
+    assert sorted(r["question"] for r in rows) == [f"q{i}" for i in range(8)]
+
+
+def test_clear_results_removes_rows_and_accuracy(tmp_path):
+    db = str(tmp_path / "r.db")
+    for it in (2, 3):
+        append_results(db, {0: easy_row(0, it, True)}, "Easy", "eng")
+        save_accuracy(db, it, "Easy", "eng", 1.0, 1, 1)
+    append_results(db, {0: easy_row(0, 3, True)}, "Hard", "eng")
+    clear_results(db, [3], "Easy", "eng")
+    assert get_all_iterations(db, difficulty="Easy", mode="eng") == [2]
+    assert get_completed_iterations(db, difficulty="Easy", mode="eng") == [2]
+    assert len(load_results(db, iteration=3, difficulty="Hard", mode="eng")) == 1
+
+
+def test_init_db_migrates_old_results_table(tmp_path):
+    db = str(tmp_path / "old.db")
+    conn = sqlite3.connect(db)
+    conn.execute(
+        "CREATE TABLE results (id INTEGER PRIMARY KEY AUTOINCREMENT, iteration INTEGER NOT NULL, "
+        "question TEXT NOT NULL, persona_description TEXT, pretranslated_persona TEXT, correct_answer TEXT NOT NULL, "
+        "model_answer TEXT NOT NULL, reasoning TEXT, country TEXT, refine_reasoning TEXT, options TEXT, "
+        "prompt_option TEXT, difficulty TEXT, mode TEXT, created_at DATETIME DEFAULT CURRENT_TIMESTAMP)"
+    )
+    conn.execute(
+        "INSERT INTO results (iteration, question, correct_answer, model_answer, difficulty, mode) "
+        "VALUES (1, 'q0', 'A', 'A', 'Easy', 'eng')"
+    )
+    conn.commit()
+    conn.close()
+    init_db(db)
+    append_results(db, {0: dict(easy_row(1, 1, True), carried_forward=1)}, "Easy", "eng")
+    rows = load_results(db, iteration=1, difficulty="Easy", mode="eng")
+    assert [r["carried_forward"] for r in rows] == [0, 1]
+    assert rows[0]["thinking_content"] is None
+
+
+def test_completed_iterations_need_an_accuracy_row(tmp_path):
+    db = str(tmp_path / "r.db")
+    append_results(db, {0: easy_row(0, 2, True)}, "Easy", "eng")
+    assert get_completed_iterations(db, difficulty="Easy", mode="eng") == []
+    save_accuracy(db, 2, "Easy", "eng", 1.0, 1, 1)
+    assert get_completed_iterations(db, difficulty="Easy", mode="eng") == [2]
+
+
+def test_saved_units_and_take_saved(tmp_path):
+    db = str(tmp_path / "r.db")
+    data = [easy_row(i, 1, True) for i in range(3)]
+    append_results(db, {2: easy_row(2, 2, False), 0: easy_row(0, 2, True)}, "Easy", "eng")
+    saved = ir._saved_units(db, 2, "Easy", "eng")
+    assert set(saved) == {("q0", "Japan"), ("q2", "Japan")}
+    rows = ir._take_saved(saved, data, 2)
+    assert list(rows) == [2] and not ir._rows_correct(rows, "Easy")
+    assert ir._take_saved(saved, data, 2) is None  # taken once
+    assert ir._take_saved(saved, data, 1) is None
+
+
+@pytest.mark.parametrize("chains", [False, True])
+def test_resume_runs_only_unsaved_questions(seed_easy_db, fake_llm, chains):
+    db = seed_easy_db(4, lambda i: True)
+    # an interrupted iteration 2: q0 and q2 were saved, no accuracy row yet
+    append_results(db, {0: easy_row(0, 2, True), 2: easy_row(2, 2, False)}, "Easy", "eng")
+    accuracies = asyncio.run(ir.run_iterations(
+        "eng", 2, "Easy", db, start_iteration=2, use_memory=False, chains=chains, resume=True,
+    ))
+    assert sorted(fake_llm.refined) == ["q1", "q3"]
+    assert accuracies == [0.75]
+    assert get_completed_iterations(db, difficulty="Easy", mode="eng") == [1, 2]
+    assert len(load_results(db, iteration=2, difficulty="Easy", mode="eng")) == 4
+
+
+def test_without_resume_stale_rows_are_cleared(seed_easy_db, fake_llm):
+    db = seed_easy_db(3, lambda i: True)
+    append_results(db, {0: easy_row(0, 2, False)}, "Easy", "eng")
+    accuracies = asyncio.run(ir.run_iterations("eng", 2, "Easy", db, start_iteration=2, use_memory=False))
+    assert sorted(fake_llm.refined) == ["q0", "q1", "q2"]
+    assert accuracies == [1.0]
+    assert len(load_results(db, iteration=2, difficulty="Easy", mode="eng")) == 3
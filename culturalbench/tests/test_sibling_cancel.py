@@ -0,0 +1,123 @@
+import asyncio
+
+import pytest
+
+import iteration_runner as ir
+from tools import llm_utils, stage_pipeline
+
+
+def _option(messages):
+    return messages[1]["content"].rsplit("Answer: ", 1)[1]
+
+
+def _prompts(*options):
+    return [
+        [{"role": "system", "content": "p"}, {"role": "user", "content": f"Question: q0\nAnswer: {o}"}]
+        for o in options
+    ]
+
+
+def _verdict(messages):
+    option = _option(messages)
+    return "not json" if option.startswith("bad") else '{"correct": "true", "reasoning": "%s"}' % option
+
+
+def test_failed_check_cancels_the_siblings_still_running(fake_llm):
+    fake_llm.answer_delay = lambda m: 0.01 if _option(m) == "bad" else 1.0
+    fake_llm.reply = _option
+    checked = []
+
+    def check(j, output):
+        checked.append(j)
+        return None if output[1] == "bad" else output[1]
+
+    async def main():
+        # returns as soon as "bad" is checked, long before the siblings would finish
+        return await asyncio.wait_for(llm_utils.generate_batch(None, _prompts("a", "bad", "c", "d"), check=check), 0.5)
+
+    assert asyncio.run(main()) is None
+    assert checked == [1]
+    assert sorted(c.rsplit(" ", 1)[1] for c in fake_llm.cancelled) == ["a", "c", "d"]
+    assert [a.rsplit(" ", 1)[1] for a in fake_llm.answered] == ["bad"]
+
+
+def test_checked_results_keep_the_prompt_order(fake_llm):
+    delays = {"a": 0.03, "b": 0.02, "c": 0.01, "d": 0.0}
+    fake_llm.answer_delay = lambda m: delays[_option(m)]
+    fake_llm.reply = _option
+    checked = []
+
+    def check(j, output):
+        checked.append(j)
+        return output[1].upper()
+
+    results = asyncio.run(llm_utils.generate_batch(None, _prompts("a", "b", "c", "d"), check=check))
+    assert results == ["A", "B", "C", "D"]
+    assert checked == [3, 2, 1, 0]  # judged as they arrived
+    assert not fake_llm.cancelled
+
+
+def test_iteration_hard_set_fails_on_the_first_bad_option(fake_llm):
+    fake_llm.answer_delay = lambda m: 0.01 if _option(m) == "bad" else 1.0
+    fake_llm.reply = _verdict
+    data = {
+        j: {
+            "question": "q0", "prompt_option": option, "persona_description": "p0", "reasoning": "x",
+            "country": "Japan", "correct_answer": "1",
+        }
+        for j, option in enumerate(["a", "bad", "c", "d"])
+    }
+
+    async def main():
+        pipeline = stage_pipeline.for_iteration({}, llm_utils.question_semaphore)
+        return await asyncio.wait_for(ir._process_hard_iter_set(0, data, "eng", 2, False, False, pipeline), 0.5)
+
+    assert asyncio.run(main()) is None
+    assert len(fake_llm.cancelled) == 3
+
+
+@pytest.fixture
+def hard_set(fake_llm, monkeypatch):
+    """evaluators._process_hard_set(0, ...) on one set of four options, with the persona stubbed."""
+    evaluators = pytest.importorskip("evaluators", exc_type=ImportError)  # needs the datasets package
+
+    async def persona(*args, **kwargs):
+        return "p", None, "r"
+
+    monkeypatch.setattr(evaluators, "generate_persona_description", persona)
+    monkeypatch.setattr(evaluators, "get_llm", lambda: None)
+    monkeypatch.setattr(evaluators, "add_input_tokens", lambda *a, **k: None)
+    monkeypatch.setattr(evaluators, "add_output_tokens", lambda *a, **k: None)
+
+    def run(options):
+        ds = [
+            {"prompt_question": "q0", "prompt_option": o, "answer": "1", "country": "Japan"}
+            for o in options
+        ]
+        return asyncio.run(evaluators._process_hard_set(0, ds, "eng", "Hard", asyncio.Semaphore(1)))
+
+    return run
+
+
+def test_hard_set_resends_only_the_option_that_failed_to_parse(hard_set, fake_llm):
+    sent = []
+
+    def reply(messages):
+        sent.append(_option(messages))
+        return "not json" if sent == ["a", "b", "c"] else _verdict(messages)  # c fails once
+
+    fake_llm.reply = reply
+    set_data, is_correct = hard_set(["a", "b", "c", "d"])
+    assert sorted(sent) == ["a", "b", "c", "c", "d"]
+    assert [set_data[j]["prompt_option"] for j in range(4)] == ["a", "b", "c", "d"]
+    assert is_correct
+
+
+def test_hard_set_gives_up_after_the_third_failure(hard_set, fake_llm):
+    # "bad" never parses; "bad-slow" does not either and is still running when "bad" fails a third time
+    fake_llm.answer_delay = lambda m: 0.05 if _option(m) == "bad-slow" else 0.0
+    fake_llm.reply = _verdict
+    assert hard_set(["a", "bad", "c", "bad-slow"]) is None
+    sent = [a.rsplit(" ", 1)[1] for a in fake_llm.answered]
+    assert sent.count("bad") == 3 and sent.count("a") == 1
+    assert sent.count("bad-slow") == 2 and len(fake_llm.cancelled) == 1
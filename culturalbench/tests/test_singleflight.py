@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+from tools import llm_cache, singleflight
+from tools.singleflight import SingleFlight
+
+
+@pytest.fixture(autouse=True)
+def _stats(monkeypatch):
+    monkeypatch.setattr(singleflight, "_stats", {"leaders": 0, "coalesced": 0})
+
+
+def test_identical_requests_share_one_call():
+    calls = []
+
+    async def upstream():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "answer"
+
+    async def main():
+        flights = SingleFlight()
+        return await asyncio.gather(*(flights.do("k", upstream) for _ in range(3)))
+
+    results = asyncio.run(main())
+    assert results == [("answer", False), ("answer", True), ("answer", True)]
+    assert len(calls) == 1
+    assert singleflight.get_stats() == {"leaders": 1, "coalesced": 2, "coalesced_rate": 0.6667}
+
+
+def test_finished_flight_is_not_reused():
+    calls = []
+
+    async def upstream():
+        calls.append(1)
+        return len(calls)
+
+    async def main():
+        flights = SingleFlight()
+        return [await flights.do("k", upstream), await flights.do("k", upstream)]
+
+    assert asyncio.run(main()) == [(1, False), (2, False)]
+
+
+def test_upstream_survives_until_every_waiter_is_cancelled():
+    async def main():
+        flights = SingleFlight()
+        release = asyncio.Event()
+        cancelled = asyncio.Event()
+
+        async def upstream():
+            try:
+                await release.wait()
+                return "answer"
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        first = asyncio.create_task(flights.do("k", upstream))
+        second = asyncio.create_task(flights.do("k", upstream))
+        await asyncio.sleep(0)
+        first.cancel()  # the leader gives up; the follower still gets the answer
+        await asyncio.sleep(0.01)
+        assert not cancelled.is_set()
+        release.set()
+        assert await second == ("answer", True)
+
+        release.clear()
+        third = asyncio.create_task(flights.do("k2", upstream))
+        await asyncio.sleep(0)
+        third.cancel()
+        await asyncio.wait_for(cancelled.wait(), 1)
+
+    asyncio.run(main())
+
+
+def test_only_reproducible_requests_are_coalesced(monkeypatch):
+    monkeypatch.setattr(llm_cache, "get_cache", lambda: None)
+    assert singleflight.is_deterministic({"temperature": 0})
+    assert not singleflight.is_deterministic({"temperature": 0.6})
+    monkeypatch.setattr(llm_cache, "get_cache", lambda: object())
+    assert singleflight.is_deterministic({"temperature": 0.6})
+
+
+def test_request_key_includes_stop_field():
+    kwargs = {"model": "m", "messages": [{"role": "user", "content": "hi"}], "temperature": 0}
+    assert singleflight.request_key(kwargs) == singleflight.request_key(dict(kwargs))
+    assert singleflight.request_key(kwargs, "answer") != singleflight.request_key(kwargs)
@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+
+from tools import llm_utils, stage_pipeline
+
+
+@pytest.fixture
+def pipeline_on(monkeypatch):
+    """Enable the pipeline with explicit limits; stages without one get a limit of 8."""
+    monkeypatch.setattr(stage_pipeline, "_stats", {})
+
+    def on(limits):
+        stage_pipeline.configure(limits, lambda model: lambda: 8)
+
+    yield on
+    monkeypatch.setattr(stage_pipeline, "_limits", None)
+
+
+@pytest.mark.parametrize("spec, limits", [
+    ("", {}), ("feedback=16, answer=64", {"feedback": 16, "answer": 64}),
+])
+def test_parse_limits(spec, limits):
+    assert stage_pipeline.parse_limits(spec) == limits
+
+
+@pytest.mark.parametrize("spec", ["judge=4", "answer=0", "answer", "answer=x"])
+def test_parse_limits_rejects_bad_entries(spec):
+    with pytest.raises(ValueError):
+        stage_pipeline.parse_limits(spec)
+
+
+def test_disabled_pipeline_is_the_question_gate():
+    gate = asyncio.Semaphore(3)
+    pipeline = stage_pipeline.for_iteration({"refine": "m", "answer": "m"}, lambda: gate)
+    assert pipeline.question() is gate
+
+    async def main():
+        async with pipeline.stage("refine"):
+            return "ran"
+
+    assert asyncio.run(main()) == "ran"
+
+
+def test_stage_limits_and_admission(pipeline_on):
+    pipeline_on({"refine": 2, "answer": 1})
+    pipeline = stage_pipeline.for_iteration({"refine": "m", "answer": "m", "memory": None}, None)
+    assert pipeline.question()._capacity() == 2 + 1 + 8  # admission is bounded by the sum of the stage limits
+    in_stage = {"refine": 0, "answer": 0}
+    peak = dict(in_stage)
+
+    async def question():
+        for name in ("refine", "answer"):
+            async with pipeline.stage(name):
+                in_stage[name] += 1
+                peak[name] = max(peak[name], in_stage[name])
+                await asyncio.sleep(0.01)
+                in_stage[name] -= 1
+
+    async def main():
+        await asyncio.gather(*(question() for _ in range(6)))
+
+    asyncio.run(main())
+    assert peak == {"refine": 2, "answer": 1}
+    stats = stage_pipeline.get_stats()
+    assert stats["refine:m"]["entered"] == stats["answer:m"]["entered"] == 6
+    assert stats["answer:m"]["peak"] == 1 and stats["answer:m"]["waited"] > 0
+    assert stats["memory"]["entered"] == 0
+
+
+def test_default_capacity_is_asked_per_model(pipeline_on):
+    asked = []
+    stage_pipeline.configure({"answer": 4}, lambda model: asked.append(model) or (lambda: 2))
+    pipeline = stage_pipeline.for_iteration({"feedback": "judge-model", "refine": "m", "answer": "m"}, None)
+    assert asked == ["judge-model", "m"]
+    assert pipeline.question()._capacity() == 2 + 2 + 4
+
+
+def test_stage_capacity_without_adaptive_concurrency(monkeypatch):
+    monkeypatch.setattr(llm_utils, "MAX_CONCURRENT", 5)
+    assert llm_utils.stage_capacity("Qwen/Qwen3-4B")() == llm_utils.stage_capacity(None)() == 5
@@ -0,0 +1,114 @@
+import threading
+import time
+
+import pytest
+
+from tools.steering_worker import SteeringBatchWorker, common_prefix_len
+
+
+class _Tokenizer:
+    pad_token = None
+    eos_token = "</s>"
+
+
+class _Worker(SteeringBatchWorker):
+    """Worker with the model call replaced: records each batch's (coefficient, prompts).
+
+    While `gate` is cleared the worker blocks inside its current batch, so requests can be
+    queued (and cancelled) behind it deterministically."""
+
+    def __init__(self, **kwargs):
+        super().__init__(model=None, tokenizer=_Tokenizer(), **kwargs)
+        self.batches = []
+        self.gate = threading.Event()
+        self.gate.set()
+        self.busy = threading.Event()
+
+    def _run_batch(self, batch):
+        self.batches.append((batch[0].coefficient, [r.messages for r in batch]))
+        self.busy.set()
+        self.gate.wait()
+        return [f"out:{r.messages}" for r in batch]
+
+
+def _block(worker):
+    """Occupy the worker with one request; returns its future once the worker is inside it."""
+    worker.gate.clear()
+    future = worker.submit("blocker")
+    assert worker.busy.wait(2)
+    return future
+
+
+def test_batches_only_mix_requests_with_the_same_coefficient():
+    worker = _Worker(max_batch_size=8, max_wait_ms=50).start()
+    blocker = _block(worker)
+    futures = [worker.submit(f"m{i}", coefficient=0.5 if i % 2 else 0.0) for i in range(5)]
+    worker.gate.set()
+    assert [f.result(2) for f in futures] == [f"out:m{i}" for i in range(5)]
+    assert blocker.result(2) == "out:blocker"
+    worker.stop()
+    assert worker.batches[1:] == [(0.0, ["m0", "m2", "m4"]), (0.5, ["m1", "m3"])]
+    assert worker.get_stats()["max_batch"] == 3
+
+
+def test_max_batch_size_splits_batches():
+    worker = _Worker(max_batch_size=2, max_wait_ms=50).start()
+    _block(worker)
+    futures = [worker.submit(f"m{i}") for i in range(5)]
+    worker.gate.set()
+    for f in futures:
+        f.result(2)
+    worker.stop()
+    assert [len(prompts) for _, prompts in worker.batches[1:]] == [2, 2, 1]
+
+
+def test_cancelled_requests_are_dropped_before_compute():
+    worker = _Worker(max_batch_size=8, max_wait_ms=50).start()
+    _block(worker)
+    keep = worker.submit("keep")
+    dropped = worker.submit("dropped")
+    assert dropped.cancel()
+    worker.gate.set()
+    assert keep.result(2) == "out:keep"
+    worker.stop()
+    assert all("dropped" not in prompts for _, prompts in worker.batches)
+
+
+def test_stop_finishes_queued_requests():
+    worker = _Worker(max_batch_size=2, max_wait_ms=50).start()
+    _block(worker)
+    futures = [worker.submit(f"m{i}", coefficient=float(i % 2)) for i in range(4)]
+    stopper = threading.Thread(target=worker.stop, daemon=True)
+    stopper.start()
+    worker.gate.set()
+    stopper.join(2)
+    assert not stopper.is_alive()
+    assert [f.result(0) for f in futures] == [f"out:m{i}" for i in range(4)]
+
+
+def test_stop_while_collecting_a_batch_does_not_hang():
+    # the worker is waiting for stragglers of a one-request batch when stop() arrives
+    worker = _Worker(max_batch_size=8, max_wait_ms=500).start()
+    future = worker.submit("m0")
+    time.sleep(0.05)
+    stopper = threading.Thread(target=worker.stop, daemon=True)
+    stopper.start()
+    stopper.join(2)
+    assert not stopper.is_alive()
+    assert future.result(0) == "out:m0"
+
+
+def test_stop_without_requests():
+    worker = _Worker().start()
+    worker.stop()
+    assert worker._thread is None
+
+
+@pytest.mark.parametrize("rows, expected", [
+    ([[1, 2, 3], [1, 2, 4], [1, 2]], 2),
+    ([[1, 2], [1, 2]], 2),
+    ([[5], [6]], 0),
+    ([], 0),
+])
+def test_common_prefix_len(rows, expected):
+    assert common_prefix_len(rows) == expected
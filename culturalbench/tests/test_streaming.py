@@ -0,0 +1,76 @@
+import pytest
+
+from tools import streaming
+from tools.response_utils import parse_easy_answer, parse_hard_answer
+from tools.streaming import decisive_field_end, finalize_partial
+
+
+def _cut(text, field):
+    """What the stream would have produced when it was closed, or None if it runs on."""
+    for n in range(1, len(text) + 1):
+        end = decisive_field_end(text[:n], field)
+        if end is not None:
+            return text[:end]
+    return None
+
+
+def test_stops_right_after_the_answer():
+    text = '{"answer": "B", "reasoning": "long explanation"}'
+    assert _cut(text, "answer") == '{"answer": "B"'
+    assert parse_easy_answer(finalize_partial(_cut(text, "answer"), "answer")) == ("B", "")
+
+
+def test_escaped_quotes_in_an_earlier_field_are_not_the_field():
+    text = r'{"reasoning": "the key \"answer\": \"A\" is a trap", "answer": "C"}'
+    cut = _cut(text, "answer")
+    assert cut == text[:-1]
+    assert parse_easy_answer(finalize_partial(cut, "answer")) == ("C", 'the key "answer": "A" is a trap')
+
+
+def test_escaped_quote_inside_the_decisive_value():
+    cut = _cut(r'{"answer": "B \"final\"", "reasoning": "x"}', "answer")
+    assert cut == r'{"answer": "B \"final\""'
+
+
+@pytest.mark.parametrize("value", ["true", "false"])
+def test_unquoted_booleans_end_the_correct_field(value):
+    text = '{"correct": %s, "reasoning": "x"}' % value
+    cut = _cut(text, "correct")
+    assert cut == '{"correct": %s' % value
+    assert finalize_partial(cut, "correct") == '{"correct": "%s", "reasoning": ""}' % value
+    assert parse_hard_answer(finalize_partial(cut, "correct")) == (value, "")
+
+
+def test_partial_boolean_does_not_stop():
+    assert decisive_field_end('{"correct": tr', "correct") is None
+    assert decisive_field_end('{"correct": "tr', "correct") is None
+
+
+def test_reasoning_before_the_answer_is_kept():
+    text = '{"reasoning": "ramen is slurped", "answer": "D"}'
+    cut = _cut(text, "answer")
+    assert cut == text[:-1]
+    assert parse_easy_answer(finalize_partial(cut, "answer")) == ("D", "ramen is slurped")
+
+
+def test_answer_inside_a_think_block_is_ignored():
+    text = '<think>maybe {"answer": "A"}</think>{"answer": "B"}'
+    assert decisive_field_end(text[:text.index("</think>")], "answer") is None
+    cut = _cut(text, "answer")
+    assert cut == text[:-1]
+    assert finalize_partial(cut, "answer").startswith('<think>maybe {"answer": "A"}</think>')
+
+
+def test_finalize_leaves_text_without_the_field_alone():
+    assert finalize_partial('{"reasoning": "x"', "answer") == '{"reasoning": "x"'
+
+
+def test_baseline_and_savings_estimate(monkeypatch):
+    monkeypatch.setattr(streaming, "_stats", {})
+    runs = [streaming.should_run_baseline("answer_easy") for _ in range(2 * streaming.BASELINE_EVERY)]
+    assert [i for i, full in enumerate(runs) if full] == [0, streaming.BASELINE_EVERY]
+    streaming.record("answer_easy", 100, 2.0, stopped=False)
+    streaming.record("answer_easy", 10, 0.5, stopped=True)
+    streaming.record("answer_easy", 10, 0.5, stopped=True)
+    stats = streaming.get_stream_stats()["answer_easy"]
+    assert stats["est_tokens_saved"] == 180 and stats["est_sec_saved"] == 3.0
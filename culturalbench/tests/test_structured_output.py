@@ -0,0 +1,95 @@
+import asyncio
+import json
+
+import json_repair
+import pytest
+
+from iteration_runner import _extract_revised_persona_text
+from persona_generator import _parse_initial_persona_response
+from tools import structured_output
+from tools.response_utils import parse_easy_answer, parse_hard_answer
+from tools.structured_output import SCHEMAS, record_attempts, response_format
+
+# text the grammar backend may emit inside a string: quotes, braces, newlines, non-ASCII
+TRICKY = 'She said "no" {twice}\nらーめん'
+
+
+def _conforming(schema, **values):
+    """A JSON document the schema allows, keys in the schema's property order."""
+    return json.dumps(
+        {name: values.get(name, TRICKY) for name in schema["properties"]}, ensure_ascii=False
+    )
+
+
+@pytest.mark.parametrize("answer", SCHEMAS["answer_easy"]["properties"]["answer"]["enum"])
+def test_easy_answer_schema_parses(answer):
+    assert parse_easy_answer(_conforming(SCHEMAS["answer_easy"], answer=answer)) == (answer, TRICKY.strip())
+
+
+@pytest.mark.parametrize("correct", SCHEMAS["answer_hard"]["properties"]["correct"]["enum"])
+def test_hard_answer_schema_parses(correct):
+    assert parse_hard_answer(_conforming(SCHEMAS["answer_hard"], correct=correct)) == (correct, TRICKY.strip())
+
+
+def test_refine_schema_parses():
+    response = _conforming(SCHEMAS["refine"], revised_persona="You are a ramen chef in Tokyo.")
+    assert json_repair.loads(response)["revised_persona"] == "You are a ramen chef in Tokyo."
+    assert _extract_revised_persona_text(response) == "You are a ramen chef in Tokyo."
+
+
+def test_initial_persona_schema_parses():
+    response = _conforming(SCHEMAS["initial_persona"], persona=" You are from Osaka. ", reasoning="r")
+    assert _parse_initial_persona_response(response, "eng") == ("You are from Osaka.", "r")
+
+
+@pytest.mark.parametrize("name, field", [("answer_easy", "answer"), ("answer_hard", "correct")])
+def test_decisive_field_comes_first(name, field):
+    # the streaming early stop ends a response once this field is complete
+    assert next(iter(SCHEMAS[name]["properties"])) == field
+    assert set(SCHEMAS[name]["required"]) == set(SCHEMAS[name]["properties"])
+
+
+def test_response_format_is_strict_json_schema():
+    fmt = response_format("refine")
+    assert fmt["type"] == "json_schema"
+    assert fmt["json_schema"] == {"name": "refine", "schema": SCHEMAS["refine"], "strict": True}
+
+
+def test_retry_stats(monkeypatch):
+    monkeypatch.setattr(structured_output, "_retry_stats", {})
+    record_attempts("refine", 1, True)
+    record_attempts("refine", 3, False)
+    assert structured_output.get_retry_stats() == {"refine": {
+        "calls": 2, "attempts": 4, "retries": 2, "failures": 1, "retry_rate": 1.0, "failure_rate": 0.5,
+    }}
+
+
+@pytest.mark.parametrize("mode, model, schema", [
+    ("eng", "Qwen/Qwen3-4B", "answer_hard"),
+    ("ling", "Qwen/Qwen3-14B", "answer_hard"),
+    ("ling", "Qwen/Qwen3-4B", None),  # reasons inside <think>, which a schema would forbid
+])
+def test_hard_initial_eval_schema(monkeypatch, mode, model, schema):
+    evaluators = pytest.importorskip("evaluators", exc_type=ImportError)  # needs the datasets package
+    from tools import llm_utils
+
+    sent = []
+
+    async def generate_batch(llm, list_of_messages, check=None, **kwargs):
+        sent.append((list_of_messages, kwargs["schema"]))
+        return [check(j, (None, '{"correct": "true", "reasoning": "r"}')) for j in range(len(list_of_messages))]
+
+    async def persona(*args, **kwargs):
+        return "p", "p", "r"
+
+    monkeypatch.setattr(llm_utils, "MODEL_NAME", model)
+    monkeypatch.setattr(evaluators, "generate_batch", generate_batch)
+    monkeypatch.setattr(evaluators, "generate_persona_description", persona)
+    monkeypatch.setattr(evaluators, "get_llm", lambda: None)
+    monkeypatch.setattr(evaluators, "add_input_tokens", lambda *a, **k: None)
+    monkeypatch.setattr(evaluators, "add_output_tokens", lambda *a, **k: None)
+    ds = [{"prompt_question": "q", "prompt_option": str(j), "answer": "1", "country": "Japan"} for j in range(4)]
+    assert asyncio.run(evaluators._process_hard_set(0, ds, mode, "Hard", asyncio.Semaphore(1))) is not None
+    (messages, used), = sent
+    assert used == schema
+    assert ("<think>" in messages[0][1]["content"]) == (schema is None)
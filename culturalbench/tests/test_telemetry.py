@@ -0,0 +1,114 @@
+import asyncio
+import sqlite3
+from types import SimpleNamespace
+
+import pytest
+
+from tools import telemetry
+
+
+@pytest.fixture
+def recording(tmp_path, monkeypatch):
+    """Telemetry on for this test; returns the results DB path its rows are attached to."""
+    monkeypatch.setattr(telemetry, "_buffer", [])
+    telemetry.configure(enabled=True)
+    yield str(tmp_path / "easy.db")
+    telemetry.close()
+    telemetry.configure(enabled=False)
+    telemetry.set_iteration(None)
+
+
+def _rows(db, *columns):
+    conn = sqlite3.connect(telemetry.telemetry_path(db))
+    rows = conn.execute(f"SELECT {', '.join(columns)} FROM llm_requests ORDER BY id").fetchall()
+    conn.close()
+    return rows
+
+
+@pytest.mark.parametrize("p, n, expected", [(50, 10, 5), (95, 10, 10), (50, 100, 50), (99, 100, 99), (50, 1, 1)])
+def test_percentile_is_nearest_rank(p, n, expected):
+    assert telemetry._percentile(list(range(1, n + 1)), p) == expected
+
+
+def test_telemetry_path():
+    assert telemetry.telemetry_path("r/easy.db") == "r/easy.telemetry.db"
+    assert telemetry.telemetry_path("r/easy.telemetry.db") == "r/easy.telemetry.db"
+
+
+def test_calls_before_attach_are_kept(recording):
+    telemetry.set_iteration(1)
+    with telemetry.track("initial_persona", "m"):
+        telemetry.on_send("http://a/v1")
+    telemetry.attach(recording)
+    telemetry.set_iteration(2)
+    with telemetry.track("refine", "m") as rec:
+        telemetry.on_send("http://a/v1")
+        telemetry.on_send("http://b/v1")  # fail-over
+        telemetry.on_usage(SimpleNamespace(
+            prompt_tokens=10, completion_tokens=5, prompt_tokens_details=SimpleNamespace(cached_tokens=8),
+        ))
+        telemetry.on_finish("length", max_tokens=5)
+        assert telemetry.current() is rec
+    telemetry.flush()
+    assert _rows(recording, "stage", "iteration", "endpoint", "retries", "cached_tokens", "finish_reason", "status") == [
+        ("initial_persona", 1, "http://a/v1", 0, None, None, "ok"),
+        ("refine", 2, "http://b/v1", 1, 8, "length", "ok"),
+    ]
+
+
+def test_status_of_failed_and_cancelled_calls(recording):
+    telemetry.attach(recording)
+
+    async def cancelled():
+        with telemetry.track("answer_easy", "m"):
+            await asyncio.sleep(1)
+
+    async def main():
+        task = asyncio.create_task(cancelled())
+        await asyncio.sleep(0)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(main())
+    with pytest.raises(ValueError):
+        with telemetry.track("answer_hard", "m"):
+            raise ValueError
+    with telemetry.track("summary", "m"):
+        telemetry.set_status("cache_hit")
+    telemetry.flush()
+    assert _rows(recording, "stage", "status") == [
+        ("answer_easy", "cancelled"), ("answer_hard", "error"), ("summary", "cache_hit"),
+    ]
+
+
+def test_disabled_telemetry_records_nothing(tmp_path, monkeypatch):
+    monkeypatch.setattr(telemetry, "_enabled", False)
+    with telemetry.track("refine", "m") as rec:
+        telemetry.on_send("http://a/v1")
+    assert rec is None and telemetry.attach(str(tmp_path / "easy.db")) is None
+
+
+def test_summary_percentiles_and_throughput(recording):
+    conn = telemetry._connect(telemetry.telemetry_path(recording))
+    rows = [
+        ("r", float(i), "answer_easy", 2, "m", "e", 0.0, None, float(i + 1), 0, 10, 20, 0, 0, 0, "ok", None, None)
+        for i in range(10)
+    ] + [("r", 0.0, "answer_easy", 2, "m", "e", 0.0, None, 99.0, 2, None, None, None, 0, 0, "failed", None, None)]
+    conn.executemany(f"INSERT INTO llm_requests ({', '.join(telemetry._COLUMNS)}) VALUES ({', '.join('?' * 18)})", rows)
+    conn.commit()
+    conn.close()
+    (s,) = telemetry.summarize(recording, by=("stage",))
+    assert s["n"] == 11 and s["status"] == {"ok": 10, "failed": 1}
+    assert (s["latency_p50"], s["latency_p95"], s["latency_p99"]) == (5.0, 10.0, 10.0)  # failed calls excluded
+    assert s["retries"] == 2 and s["completion_tokens"] == 200
+    assert s["wall_sec"] == 99.0 and s["req_per_sec"] == pytest.approx(10 / 99)
+
+
+def test_output_lengths_leave_out_early_stops(recording):
+    telemetry.attach(recording)
+    for tokens, early_stop, finish in ((40, False, "stop"), (64, False, "length"), (3, True, "stop")):
+        with telemetry.track("answer_easy", "m"):
+            telemetry.on_usage(SimpleNamespace(prompt_tokens=1, completion_tokens=tokens), early_stop=early_stop)
+            telemetry.on_finish(finish)
+    telemetry.flush()
+    assert telemetry.output_lengths(recording) == ({("m", "answer_easy"): [40, 64]}, {("m", "answer_easy"): 1})
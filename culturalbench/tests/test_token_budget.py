@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+
+from tools import token_budget
+from tools.token_budget import TokenGate
+
+
+@pytest.fixture(autouse=True)
+def _disabled():
+    yield
+    token_budget.configure(None)
+
+
+def test_oversized_request_is_charged_the_whole_budget():
+    gate = TokenGate("e", 100)
+
+    async def main():
+        async with gate.reserve(500):
+            assert gate.in_flight == 100
+            small = asyncio.create_task(gate.acquire_async(1))
+            await asyncio.sleep(0.01)
+            assert not small.done()  # the oversized request runs alone
+        await asyncio.wait_for(small, 1)
+
+    asyncio.run(main())
+    assert gate.stats["oversized"] == 1 and gate.in_flight == 1
+
+
+def test_large_request_is_not_overtaken_after_the_bypass_window(monkeypatch):
+    monkeypatch.setattr(token_budget, "MAX_BYPASS_SEC", 0.05)
+    gate = TokenGate("e", 100)
+
+    async def main():
+        await gate.acquire_async(60)
+        large = asyncio.create_task(gate.acquire_async(80))
+        await asyncio.sleep(0)
+        await gate.acquire_async(30)  # fits while the large request is young: backfills
+        await asyncio.sleep(0.06)
+        late = asyncio.create_task(gate.acquire_async(10))  # would fit, but the head has waited too long
+        await asyncio.sleep(0.01)
+        assert not large.done() and not late.done()
+        gate._release(60)
+        gate._release(30)
+        await asyncio.wait_for(asyncio.gather(large, late), 1)
+
+    asyncio.run(main())
+    assert gate.stats["bypasses"] == 1 and gate.in_flight == 90
+
+
+def test_waiter_cancelled_as_it_is_granted_refunds_its_tokens():
+    gate = TokenGate("e", 100)
+
+    async def main():
+        await gate.acquire_async(100)
+        waiter = asyncio.create_task(gate.acquire_async(50))
+        await asyncio.sleep(0)
+        gate._release(100)  # grants the waiter; it has not resumed yet
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        await gate.acquire_async(100)  # nothing is leaked
+
+    asyncio.run(main())
+    assert gate.in_flight == 100
+
+
+def test_waiter_cancelled_in_the_queue_lets_the_next_one_in(monkeypatch):
+    monkeypatch.setattr(token_budget, "MAX_BYPASS_SEC", 0)  # nothing overtakes the head
+    gate = TokenGate("e", 100)
+
+    async def main():
+        await gate.acquire_async(50)
+        blocked = asyncio.create_task(gate.acquire_async(80))
+        await asyncio.sleep(0)
+        nxt = asyncio.create_task(gate.acquire_async(40))
+        await asyncio.sleep(0.01)
+        assert not nxt.done()
+        blocked.cancel()
+        await asyncio.wait_for(nxt, 1)
+
+    asyncio.run(main())
+    assert gate.in_flight == 90 and not gate._queue
+
+
+def test_auto_budget_is_resolved_in_configure(monkeypatch):
+    monkeypatch.setattr(token_budget, "server_kv_tokens", lambda url: {"http://a/v1": 1000}.get(url))
+    token_budget.configure("auto", endpoints=["http://a/v1"])
+    assert token_budget.get_gate("http://a/v1").capacity == 900
+    with pytest.raises(RuntimeError):
+        token_budget.get_gate("http://b/v1")
+    with pytest.raises(RuntimeError):
+        token_budget.configure("auto", endpoints=["http://b/v1"])
+
+
+def test_fixed_budget_creates_gates_lazily():
+    token_budget.configure(500)
+    assert token_budget.get_gate("http://a/v1") is token_budget.get_gate("http://a/v1")
+    assert token_budget.get_gate("http://a/v1").capacity == 500
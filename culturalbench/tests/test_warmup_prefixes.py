@@ -0,0 +1,9 @@
+from tools import llm_utils
+from persona_generator import shared_prefixes
+
+
+def test_feedback_prefix_follows_the_feedback_model(monkeypatch):
+    monkeypatch.setattr(llm_utils, "EXTERNAL_FEEDBACK_MODEL", "feedback/model")
+    models = [model for model, _ in shared_prefixes("eng", "Easy", external=True, use_memory=False)]
+    assert models.count("feedback/model") == 1
+    assert "feedback/model" not in [model for model, _ in shared_prefixes("eng", "Easy", external=False, use_memory=False)]
@@ -0,0 +1,301 @@
+"""AIMD in-flight limit per SGLang endpoint, logged as ``[aimd] <endpoint>: limit a -> b (reason)``;
+``AdaptiveSemaphore`` gates questions in progress on the current limits."""
+
+import asyncio
+import contextlib
+import statistics
+import threading
+import time
+from collections import deque
+
+from .rate_limiter import classify_error
+
+MIN_LIMIT = 1
+DEFAULT_MAX_LIMIT = 256
+# +INCREASE_STEP after a saturated, error-free window whose p50 is within LATENCY_TOLERANCE x the best;
+# xDECREASE_FACTOR (once per cooldown) on a congestion error or a p50 above LATENCY_BLOWUP x the best.
+INCREASE_STEP = 1
+DECREASE_FACTOR = 0.7
+LATENCY_TOLERANCE = 1.5
+LATENCY_BLOWUP = 2.5
+WINDOW_MIN_SAMPLES = 16
+DECREASE_COOLDOWN_SEC = 5.0
+CONGESTION_ERRORS = ("throttled", "timeout", "server", "connection")
+MAX_DECISION_LOG = 1000
+
+_enabled = False
+_initial_limit = 1
+_max_limit = DEFAULT_MAX_LIMIT
+_controllers = {}
+_controllers_lock = threading.Lock()
+
+
+class AIMDController:
+    """Adaptive in-flight cap for one endpoint; usable from threads and coroutines."""
+
+    def __init__(self, name, initial, min_limit=MIN_LIMIT, max_limit=DEFAULT_MAX_LIMIT):
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max(min_limit, max_limit)
+        self.limit = float(min(max(initial, min_limit), self.max_limit))
+        self.in_flight = 0
+        self.best_p50 = None
+        self.decisions = []
+        self.stats = {"requests": 0, "congestion_errors": 0, "increases": 0, "decreases": 0, "peak_limit": self.limit}
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._async_waiters = deque()  # (loop, future)
+        self._window = []
+        self._saturated = False
+        self._sync_waiting = 0
+        self._last_decrease = 0.0
+
+    def current_limit(self):
+        return int(self.limit)
+
+    # -- slots -------------------------------------------------------------
+
+    def _try_take_locked(self):
+        if self.in_flight < int(self.limit):
+            self.in_flight += 1
+            return True
+        self._saturated = True  # demand exceeded the cap during this window
+        return False
+
+    def _wake_locked(self):
+        free = int(self.limit) - self.in_flight
+        if free <= 0:
+            return
+        self._cond.notify(free)
+        while free > 0 and self._async_waiters:
+            loop, fut = self._async_waiters.popleft()
+            if fut.done():
+                continue
+            loop.call_soon_threadsafe(_resolve, fut)
+            free -= 1
+
+    def _release(self, latency, exc):
+        with self._lock:
+            self.in_flight -= 1
+            self._record_locked(latency, exc)
+            self._wake_locked()
+
+    async def acquire_async(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._lock:
+                if self._try_take_locked():
+                    return
+                fut = loop.create_future()
+                self._async_waiters.append((loop, fut))
+            try:
+                await fut
+            except asyncio.CancelledError:
+                with self._lock:
+                    try:
+                        self._async_waiters.remove((loop, fut))
+                    except ValueError:
+                        self._wake_locked()  # already woken; pass the wake-up on
+                raise
+
+    def acquire(self):
+        with self._cond:
+            while not self._try_take_locked():
+                self._sync_waiting += 1
+                try:
+                    self._cond.wait()
+                finally:
+                    self._sync_waiting -= 1
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        """Hold one in-flight slot around an async request and feed its outcome back."""
+        await self.acquire_async()
+        start = time.monotonic()
+        exc = None
+        try:
+            yield
+        except BaseException as e:
+            exc = e
+            raise
+        finally:
+            self._release(time.monotonic() - start, exc)
+
+    @contextlib.contextmanager
+    def slot_sync(self):
+        """Blocking counterpart of slot()."""
+        self.acquire()
+        start = time.monotonic()
+        exc = None
+        try:
+            yield
+        except BaseException as e:
+            exc = e
+            raise
+        finally:
+            self._release(time.monotonic() - start, exc)
+
+    # -- AIMD ----------------------------------------------------------------
+
+    def _set_limit_locked(self, new, reason):
+        new = min(max(new, self.min_limit), self.max_limit)
+        old = self.limit
+        if int(new) == int(old):
+            self.limit = new
+            return
+        self.limit = new
+        key = "increases" if new > old else "decreases"
+        self.stats[key] += 1
+        self.stats["peak_limit"] = max(self.stats["peak_limit"], new)
+        self.decisions.append((time.time(), int(old), int(new), reason))
+        del self.decisions[:-MAX_DECISION_LOG]
+        print(f"[aimd] {self.name}: limit {int(old)} -> {int(new)} ({reason})", flush=True)
+
+    def _record_locked(self, latency, exc):
+        self.stats["requests"] += 1
+        if isinstance(exc, (asyncio.CancelledError, KeyboardInterrupt, GeneratorExit)):
+            return
+        if exc is not None:
+            error_class = classify_error(exc)
+            if error_class not in CONGESTION_ERRORS:
+                return
+            self.stats["congestion_errors"] += 1
+            now = time.monotonic()
+            if now - self._last_decrease >= DECREASE_COOLDOWN_SEC:
+                self._last_decrease = now
+                self._set_limit_locked(self.limit * DECREASE_FACTOR, f"{error_class} error")
+            self._window, self._saturated = [], False
+            return
+
+        self._window.append(latency)
+        if len(self._window) < max(WINDOW_MIN_SAMPLES, int(self.limit)):
+            return
+        p50 = statistics.median(self._window)
+        saturated = self._saturated or bool(self._async_waiters) or self._sync_waiting > 0
+        self._window, self._saturated = [], False
+        if self.best_p50 is None or p50 < self.best_p50:
+            self.best_p50 = p50
+        if p50 > self.best_p50 * LATENCY_BLOWUP:
+            now = time.monotonic()
+            if now - self._last_decrease >= DECREASE_COOLDOWN_SEC:
+                self._last_decrease = now
+                self._set_limit_locked(
+                    self.limit * DECREASE_FACTOR, f"p50 {p50:.2f}s > {LATENCY_BLOWUP}x best {self.best_p50:.2f}s"
+                )
+        elif saturated and p50 <= self.best_p50 * LATENCY_TOLERANCE:
+            self._set_limit_locked(
+                self.limit + INCREASE_STEP, f"saturated, p50 {p50:.2f}s vs best {self.best_p50:.2f}s"
+            )
+
+
+def _resolve(fut):
+    if not fut.done():
+        fut.set_result(None)
+
+
+class AdaptiveSemaphore:
+    """asyncio.Semaphore replacement whose capacity is re-read from capacity_fn()."""
+
+    def __init__(self, capacity_fn):
+        self._capacity_fn = capacity_fn
+        self._held = 0
+        self._waiters = deque()
+
+    def _capacity(self):
+        return max(1, int(self._capacity_fn()))
+
+    async def acquire(self):
+        while self._held >= self._capacity():
+            fut = asyncio.get_running_loop().create_future()
+            self._waiters.append(fut)
+            try:
+                await fut
+            except asyncio.CancelledError:
+                if fut in self._waiters:
+                    self._waiters.remove(fut)
+                else:
+                    self._wake()
+                raise
+        self._held += 1
+
+    def release(self):
+        self._held -= 1
+        self._wake()
+
+    def _wake(self):
+        free = self._capacity() - self._held
+        while free > 0 and self._waiters:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)
+                free -= 1
+
+    async def __aenter__(self):
+        await self.acquire()
+
+    async def __aexit__(self, *exc):
+        self.release()
+
+
+def configure(initial, max_limit=DEFAULT_MAX_LIMIT):
+    """Enable adaptive concurrency; new controllers start at initial in-flight requests."""
+    global _enabled, _initial_limit, _max_limit
+    _enabled = True
+    _initial_limit = max(MIN_LIMIT, initial)
+    _max_limit = max(_initial_limit, max_limit)
+    print(f"Adaptive concurrency (AIMD): start={_initial_limit} per endpoint, cap={_max_limit}")
+
+
+def is_enabled():
+    return _enabled
+
+
+def get_controller(endpoint):
+    ctrl = _controllers.get(endpoint)
+    if ctrl is None:
+        with _controllers_lock:
+            ctrl = _controllers.setdefault(
+                endpoint, AIMDController(endpoint, _initial_limit, max_limit=_max_limit)
+            )
+    return ctrl
+
+
+def endpoint_slot(endpoint):
+    """Async context manager holding an in-flight slot on endpoint (no-op when disabled)."""
+    return get_controller(endpoint).slot() if _enabled else contextlib.nullcontext()
+
+
+def endpoint_slot_sync(endpoint):
+    """Blocking endpoint_slot()."""
+    return get_controller(endpoint).slot_sync() if _enabled else contextlib.nullcontext()
+
+
+def total_limit(endpoints):
+    """Sum of the current caps of endpoints (their controllers are created if needed)."""
+    return sum(get_controller(e).current_limit() for e in endpoints)
+
+
+def get_concurrency_stats():
+    out = {}
+    for name, ctrl in list(_controllers.items()):
+        with ctrl._lock:
+            entry = dict(ctrl.stats)
+            entry["limit"] = ctrl.current_limit()
+            entry["best_p50_sec"] = round(ctrl.best_p50, 3) if ctrl.best_p50 is not None else None
+            entry["decisions"] = [
+                {"time": t, "from": a, "to": b, "reason": r} for t, a, b, r in ctrl.decisions
+            ]
+        entry["peak_limit"] = int(entry["peak_limit"])
+        out[name] = entry
+    return out
+
+
+def print_concurrency_stats():
+    if not _enabled or not _controllers:
+        return
+    print("\n=== Adaptive concurrency (AIMD) ===")
+    for name, s in get_concurrency_stats().items():
+        print(
+            f"  {name}: final_limit={s['limit']} peak={s['peak_limit']} increases={s['increases']} "
+            f"decreases={s['decreases']} congestion_errors={s['congestion_errors']} requests={s['requests']}"
+        )
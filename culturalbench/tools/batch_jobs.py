@@ -0,0 +1,191 @@
+"""Offline batch-job mode: LLM-cache misses are exported per stage as OpenAI batch JSONL, keyed by cache
+key, and the completions ingested into the LLM cache so the re-run replays finished stages.
+
+    python -m tools.batch_jobs submit batch/answer_easy.jsonl --base_url http://host:30000/v1 --out batch/answer_easy.out.jsonl
+    python -m tools.batch_jobs ingest batch/answer_easy.out.jsonl --llm_cache cache/llm.db
+"""
+
+import json
+import os
+import threading
+import time
+
+from . import llm_cache
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+POLL_SEC = 10.0
+
+_batch_dir = None
+_lock = threading.Lock()
+_exported = {}  # stage -> {"path": ..., "ids": set of custom_ids in the file, "new": count this run}
+
+
+class BatchDeferred(BaseException):
+    """Raised in place of an LLM response whose request was exported for a batch job.
+
+    A BaseException, like CancelledError, so question-level ``except Exception``
+    handlers do not mistake it for a bad response."""
+
+
+DEFERRED = object()  # returned by deferrable() for a question waiting on the batch
+
+
+def configure(batch_dir):
+    """Export cache misses to batch_dir instead of calling the server (None disables)."""
+    global _batch_dir
+    _batch_dir = batch_dir
+    with _lock:
+        _exported.clear()
+    if batch_dir:
+        os.makedirs(batch_dir, exist_ok=True)
+        print(f"Batch mode: cache misses are exported to {batch_dir}/<stage>.jsonl")
+
+
+def is_enabled():
+    return _batch_dir is not None
+
+
+def batch_body(create_kwargs):
+    """Request body for the batch file: extra_body fields are merged into the JSON as the
+    OpenAI client would send them."""
+    body = {k: v for k, v in create_kwargs.items() if k not in ("extra_body", "timeout")}
+    body.update(create_kwargs.get("extra_body") or {})
+    return body
+
+
+def _stage_file_locked(stage):
+    entry = _exported.get(stage)
+    if entry is None:
+        path = os.path.join(_batch_dir, f"{stage or 'default'}.jsonl")
+        ids = set()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                ids = {json.loads(line)["custom_id"] for line in f if line.strip()}
+        entry = _exported[stage] = {"path": path, "ids": ids, "new": 0}
+    return entry
+
+
+def defer(create_kwargs, stage=None):
+    """Append the request to its stage's batch file (once per custom_id) and raise BatchDeferred."""
+    custom_id = llm_cache.LLMCache.make_key(create_kwargs)
+    with _lock:
+        entry = _stage_file_locked(stage)
+        if custom_id not in entry["ids"]:
+            line = {"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": batch_body(create_kwargs)}
+            with open(entry["path"], "a", encoding="utf-8") as f:
+                f.write(json.dumps(line, ensure_ascii=False) + "\n")
+            entry["ids"].add(custom_id)
+            entry["new"] += 1
+    raise BatchDeferred(custom_id)
+
+
+async def deferrable(coro):
+    """Await coro; a question stopped by a deferred request yields DEFERRED instead of raising."""
+    try:
+        return await coro
+    except BatchDeferred:
+        return DEFERRED
+
+
+def raise_if_deferred(n, label):
+    """Stop the run after a stage in which n questions are waiting on the batch."""
+    if n:
+        raise BatchDeferred(f"{n} question(s) in {label} wait on batch requests")
+
+
+def print_pending(reason=None, rerun_hint="re-run the same command"):
+    """Explain which batch files to run and how to continue."""
+    with _lock:
+        files = [(stage, e["path"], e["new"], len(e["ids"])) for stage, e in _exported.items() if e["new"]]
+    print(f"\n=== Batch mode: stopped{f' ({reason})' if reason else ''} ===")
+    for stage, path, new, total in files:
+        print(f"  {stage or 'default'}: {new} new request(s) exported -> {path} ({total} in file)")
+    print(
+        "  Run them (python -m tools.batch_jobs submit <file> --base_url ... --out <out>), ingest the output "
+        f"(python -m tools.batch_jobs ingest <out> --llm_cache <cache>), then {rerun_hint}."
+    )
+
+
+def _completion_content(line):
+    """Content of one batch output line (OpenAI batch output, or {"custom_id", "text"})."""
+    if line.get("error"):
+        return None
+    response = line.get("response")
+    if response is not None:
+        if response.get("status_code", 200) != 200:
+            return None
+        choices = (response.get("body") or {}).get("choices") or []
+        content = choices[0].get("message", {}).get("content") if choices else None
+    else:
+        content = line.get("text", line.get("content"))
+    return content.strip() if content else None
+
+
+def ingest(paths, cache_path):
+    """Store the completions in batch output files under their custom_id in the LLM cache.
+    Returns (stored, failed)."""
+    cache = llm_cache.LLMCache(cache_path)
+    stored = failed = 0
+    try:
+        for path in paths:
+            with open(path, encoding="utf-8") as f:
+                for raw in f:
+                    if not raw.strip():
+                        continue
+                    line = json.loads(raw)
+                    content = _completion_content(line)
+                    if content is None:
+                        failed += 1
+                        print(f"Batch ingest: no completion for {line.get('custom_id')} in {path}: {line.get('error')}")
+                        continue
+                    model = ((line.get("response") or {}).get("body") or {}).get("model")
+                    cache.put_key(line["custom_id"], model, content)
+                    stored += 1
+    finally:
+        cache.close()
+    print(f"Batch ingest: stored {stored} completion(s) in {cache_path}" + (f", {failed} failed" if failed else ""))
+    return stored, failed
+
+
+def submit(path, base_url, out_path):
+    """Run a batch file through the server's OpenAI-compatible batch API and write its output file."""
+    from .sglang_client import get_sync_client
+
+    client = get_sync_client(base_url)
+    with open(path, "rb") as f:
+        uploaded = client.files.create(file=f, purpose="batch")
+    batch = client.batches.create(input_file_id=uploaded.id, endpoint=BATCH_ENDPOINT, completion_window="24h")
+    print(f"Batch {batch.id}: submitted {path} to {base_url}")
+    while batch.status not in ("completed", "failed", "expired", "cancelled"):
+        time.sleep(POLL_SEC)
+        batch = client.batches.retrieve(batch.id)
+        counts = batch.request_counts
+        if counts is not None:
+            print(f"Batch {batch.id}: {batch.status} {counts.completed}/{counts.total} (failed {counts.failed})")
+    if batch.status != "completed" or not batch.output_file_id:
+        print(f"Batch {batch.id} ended with status {batch.status}")
+        return None
+    with open(out_path, "w", encoding="utf-8") as f:
+        f.write(client.files.content(batch.output_file_id).text)
+    print(f"Batch {batch.id}: output written to {out_path}")
+    return out_path
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run and ingest batch files exported by --batch_dir")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_submit = sub.add_parser("submit", help="Run a batch file through an OpenAI-compatible /v1/batches endpoint")
+    p_submit.add_argument("path", help="Exported <stage>.jsonl")
+    p_submit.add_argument("--base_url", required=True, help="Server base URL ending in /v1")
+    p_submit.add_argument("--out", required=True, help="Where to write the batch output JSONL")
+    p_ingest = sub.add_parser("ingest", help="Store batch output completions in the LLM cache")
+    p_ingest.add_argument("paths", nargs="+", help="Batch output JSONL file(s)")
+    p_ingest.add_argument("--llm_cache", required=True, help="LLM cache the batch runs read (--llm_cache of the run)")
+    args = parser.parse_args()
+
+    if args.command == "submit":
+        submit(args.path, args.base_url, args.out)
+    else:
+        ingest(args.paths, args.llm_cache)
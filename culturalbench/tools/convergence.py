@@ -0,0 +1,40 @@
+"""Convergence-aware iterations: a question (or Hard set) correct in each of the last ``after`` iterations
+is carried forward with ``carried_forward`` = 1 instead of being run again."""
+
+DEFAULT_AFTER = 2
+
+
+class ConvergencePolicy:
+    """Stability rule (correct for `after` consecutive iterations) and carried-forward counts."""
+
+    def __init__(self, after=DEFAULT_AFTER):
+        self.after = max(1, int(after))
+        self.stats = {}  # iteration -> {"carried": units, "calls_saved": LLM calls}
+
+    def is_stable(self, streak):
+        """Whether a unit correct in its last `streak` iterations is carried forward."""
+        return streak >= self.after
+
+    def carry(self, rows, iteration, calls):
+        """Rows ({index: row} of the previous iteration) for iteration, flagged carried_forward;
+        calls is the number of LLM calls the unit would have made."""
+        s = self.stats.setdefault(iteration, {"carried": 0, "calls_saved": 0})
+        s["carried"] += 1
+        s["calls_saved"] += calls
+        return {idx: dict(row, iteration=iteration, carried_forward=1) for idx, row in rows.items()}
+
+    def get_stats(self):
+        out = {str(it): dict(s) for it, s in sorted(self.stats.items())}
+        out["total"] = {
+            "carried": sum(s["carried"] for s in self.stats.values()),
+            "calls_saved": sum(s["calls_saved"] for s in self.stats.values()),
+        }
+        return out
+
+    def print_stats(self):
+        stats = self.get_stats()
+        total = stats.pop("total")
+        print(f"\n=== Convergence (carry forward after {self.after} correct iterations) ===")
+        for it, s in stats.items():
+            print(f"  iteration {it}: carried_forward={s['carried']} llm_calls_saved={s['calls_saved']}")
+        print(f"  total: carried_forward={total['carried']} llm_calls_saved={total['calls_saved']}")
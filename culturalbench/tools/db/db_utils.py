@@ -3,6 +3,7 @@
 import sqlite3
 import json
 import os
+import threading
 from typing import Dict, Optional
 
 
@@ -35,6 +36,7 @@ def init_db(db_path: str):
             prompt_option TEXT,
             difficulty TEXT,
             mode TEXT,
+            carried_forward INTEGER DEFAULT 0,
             created_at DATETIME DEFAULT CURRENT_TIMESTAMP
         )
     ''')
@@ -46,6 +48,9 @@ def init_db(db_path: str):
     if 'thinking_content' not in columns:
         cursor.execute('ALTER TABLE results ADD COLUMN thinking_content TEXT')
         print("Added missing 'thinking_content' column to results table")
+    if 'carried_forward' not in columns:
+        cursor.execute('ALTER TABLE results ADD COLUMN carried_forward INTEGER DEFAULT 0')
+        print("Added missing 'carried_forward' column to results table")
     
     # Create indexes for faster queries
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_iteration ON results(iteration)')
@@ -98,6 +103,83 @@ def save_results(db_path: str, data: Dict, difficulty: str, mode: str):
             )
             print(f"Cleared existing data for iteration {iteration}")
     
+    _insert_results(cursor, data, difficulty, mode)
+    
+    conn.commit()
+    conn.close()
+
+
+def append_results(db_path: str, data: Dict, difficulty: str, mode: str):
+    """Insert results without clearing their iteration first.
+    
+    For one-off writes; the runners append through a ResultsWriter (see
+    clear_results for removing stale rows before such a run).
+    
+    Args:
+        db_path: Path to the SQLite database file
+        data: Dictionary of results to save (a Hard set's 4 rows stay contiguous)
+        difficulty: "Easy" or "Hard"
+        mode: Mode string (e.g., "eng", "ling", "l2e", "e2l")
+    """
+    init_db(db_path)
+    
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    _insert_results(cursor, data, difficulty, mode)
+    conn.commit()
+    conn.close()
+
+
+class ResultsWriter:
+    """One connection (schema checked once) for appending a run's rows as its questions finish.
+
+    append() is called through asyncio.to_thread by the runners, so writes are serialised by a lock.
+    """
+
+    def __init__(self, db_path: str, difficulty: str, mode: str):
+        init_db(db_path)
+        self.difficulty = difficulty
+        self.mode = mode
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+
+    def append(self, data: Dict):
+        with self._lock:
+            _insert_results(self._conn.cursor(), data, self.difficulty, self.mode)
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def clear_results(db_path: str, iterations, difficulty: str, mode: str):
+    """Delete the results and accuracy rows of the given iterations.
+    
+    Args:
+        db_path: Path to the SQLite database file
+        iterations: Iteration numbers to clear
+        difficulty: "Easy" or "Hard"
+        mode: Mode string (e.g., "eng", "ling", "l2e", "e2l")
+    """
+    init_db(db_path)
+    
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    for iteration in iterations:
+        cursor.execute(
+            'DELETE FROM results WHERE iteration = ? AND difficulty = ? AND mode = ?',
+            (iteration, difficulty, mode)
+        )
+        cursor.execute(
+            'DELETE FROM metadata WHERE iteration = ? AND difficulty = ? AND mode = ?',
+            (iteration, difficulty, mode)
+        )
+    conn.commit()
+    conn.close()
+
+
+def _insert_results(cursor, data: Dict, difficulty: str, mode: str):
     for entry in data.values():
         # Convert options dict to JSON string if present
         options_str = json.dumps(entry.get('options', {})) if 'options' in entry else None
@@ -113,8 +195,8 @@ def save_results(db_path: str, data: Dict, difficulty: str, mode: str):
             INSERT INTO results 
             (iteration, question, persona_description, pretranslated_persona, 
              correct_answer, model_answer, reasoning, thinking_content, country, refine_reasoning, 
-             options, prompt_option, difficulty, mode)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+             options, prompt_option, difficulty, mode, carried_forward)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         ''', (
             entry.get('iteration'),
             entry.get('question'),
@@ -129,11 +211,9 @@ def save_results(db_path: str, data: Dict, difficulty: str, mode: str):
             options_str,
             entry.get('prompt_option'),
             difficulty,
-            mode
+            mode,
+            int(bool(entry.get('carried_forward')))
         ))
-    
-    conn.commit()
-    conn.close()
 
 
 def save_accuracy(db_path: str, iteration: int, difficulty: str, mode: str, 
@@ -332,6 +412,47 @@ def get_all_iterations(
     return iterations
 
 
+def get_completed_iterations(
+    db_path: str,
+    difficulty: Optional[str] = None,
+    mode: Optional[str] = None,
+) -> list:
+    """Get the iterations that finished, i.e. have an accuracy row in metadata.
+    
+    Results rows are written as questions finish, so an iteration with results but
+    no accuracy row was interrupted part-way.
+    
+    Args:
+        db_path: Path to the SQLite database file
+        difficulty: Optional difficulty filter
+        mode: Optional mode filter
+    
+    Returns:
+        Sorted list of iteration numbers
+    """
+    if not os.path.exists(db_path):
+        return []
+    
+    init_db(db_path)
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    
+    query = "SELECT DISTINCT iteration FROM metadata WHERE 1=1"
+    params = []
+    if difficulty is not None:
+        query += " AND difficulty = ?"
+        params.append(difficulty)
+    if mode is not None:
+        query += " AND mode = ?"
+        params.append(mode)
+    query += " ORDER BY iteration"
+    cursor.execute(query, params)
+    iterations = [row[0] for row in cursor.fetchall()]
+    
+    conn.close()
+    return iterations
+
+
 def get_accuracies(db_path: str) -> list:
     """Get accuracy history from metadata table.
     
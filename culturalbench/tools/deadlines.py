@@ -0,0 +1,63 @@
+"""Deadlines for LLM calls: an absolute ``time.monotonic()`` value in a context variable that nested
+scopes can only tighten; ``bounded()`` cancels a question still running at it and returns ``OVERDUE``."""
+
+import asyncio
+import contextlib
+import contextvars
+import time
+
+OVERDUE = object()  # result of bounded() for a question cancelled at the deadline
+
+_deadline = contextvars.ContextVar("llm_deadline", default=None)
+
+
+@contextlib.contextmanager
+def scope(seconds):
+    """Run the block with a deadline seconds from now (or the enclosing one, if sooner).
+    seconds=None leaves the current deadline unchanged."""
+    if seconds is None:
+        yield _deadline.get()
+        return
+    deadline = time.monotonic() + seconds
+    current = _deadline.get()
+    if current is not None:
+        deadline = min(deadline, current)
+    token = _deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _deadline.reset(token)
+
+
+def current():
+    """The current absolute deadline (time.monotonic() based) or None."""
+    return _deadline.get()
+
+
+def remaining():
+    """Seconds left before the current deadline (>= 0), or None without one."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
+
+
+def expired():
+    deadline = _deadline.get()
+    return deadline is not None and time.monotonic() >= deadline
+
+
+async def bounded(coro):
+    """Await coro, cancelling it at the current deadline; returns OVERDUE if it was cut off."""
+    timeout = remaining()
+    if timeout is None:
+        return await coro
+    try:
+        return await asyncio.wait_for(coro, timeout)
+    except asyncio.TimeoutError:
+        return OVERDUE
+
+
+def report_overdue(n, label):
+    if n:
+        print(f"{n} question(s) hit the {label} deadline; marked failed (counted as incorrect, not saved)")
@@ -0,0 +1,166 @@
+"""Config-driven SGLang endpoint registry: each model's replicas (JSON from --endpoints_config or
+SGLANG_ENDPOINTS_CONFIG), least-outstanding routing and a background /v1/models health probe::
+
+    {"models": {"google/gemma-3-12b-it": ["http://10.0.0.1:30002/v1", "http://10.0.0.2:30002/v1"]},
+     "health_check_interval": 15}
+
+Models missing from the config use the caller's default URL.
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import httpx
+
+from .rate_limiter import get_limiter
+
+SGLANG_ENDPOINTS_CONFIG = os.environ.get("SGLANG_ENDPOINTS_CONFIG")
+HEALTH_CHECK_INTERVAL_SEC = 15.0
+HEALTH_CHECK_TIMEOUT_SEC = 5.0
+
+_configured = {}  # model -> [base_url, ...] from the config file
+_pools = {}
+_pools_lock = threading.Lock()
+_health_thread = None
+
+
+class Replica:
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+        self.outstanding = 0
+        self.healthy = True
+        self.served_models = None
+        self.last_error = None
+        self.requests = 0
+
+    def available(self):
+        if not self.healthy:
+            return False
+        limiter = get_limiter(self.base_url)
+        return not (limiter.open_until and time.monotonic() < limiter.open_until)
+
+
+class EndpointPool:
+    """Replicas serving one model."""
+
+    def __init__(self, model, base_urls):
+        self.model = model
+        self.replicas = [Replica(u) for u in base_urls]
+        self._lock = threading.Lock()
+        self._rr = 0
+
+    def acquire(self, exclude=()):
+        """Pick the least-loaded available replica (not in exclude) and count it as in flight."""
+        with self._lock:
+            candidates = [r for r in self.replicas if r.available() and r.base_url not in exclude]
+            if not candidates:
+                # nothing healthy: still route somewhere so retries/backoff can take over
+                candidates = [r for r in self.replicas if r.base_url not in exclude] or self.replicas
+            least = min(r.outstanding for r in candidates)
+            tied = [r for r in candidates if r.outstanding == least]
+            replica = tied[self._rr % len(tied)]
+            self._rr += 1
+            replica.outstanding += 1
+            replica.requests += 1
+            return replica
+
+    def release(self, replica):
+        with self._lock:
+            replica.outstanding -= 1
+
+    @contextmanager
+    def lease(self, exclude=()):
+        """Context manager yielding the chosen replica's base URL for one request."""
+        replica = self.acquire(exclude)
+        try:
+            yield replica.base_url
+        finally:
+            self.release(replica)
+
+    def probe(self):
+        """Refresh replica health from /v1/models."""
+        for replica in self.replicas:
+            try:
+                resp = httpx.get(f"{replica.base_url}/models", timeout=HEALTH_CHECK_TIMEOUT_SEC)
+                resp.raise_for_status()
+                served = [m.get("id") for m in resp.json().get("data", [])]
+                replica.served_models = served
+                replica.healthy = self.model in served
+                replica.last_error = None if replica.healthy else f"serves {served}"
+            except Exception as e:
+                replica.healthy = False
+                replica.last_error = f"{type(e).__name__}: {e}"
+
+
+def load_endpoints_config(path):
+    """Load model -> replica URLs from a JSON config file; resets existing pools."""
+    global HEALTH_CHECK_INTERVAL_SEC
+    with open(path, encoding="utf-8") as f:
+        cfg = json.load(f)
+    models = cfg.get("models", cfg)
+    _configured.clear()
+    for model, urls in models.items():
+        if isinstance(urls, str):
+            urls = [urls]
+        _configured[model] = list(urls)
+    if "health_check_interval" in cfg:
+        HEALTH_CHECK_INTERVAL_SEC = float(cfg["health_check_interval"])
+    with _pools_lock:
+        _pools.clear()
+    print(f"Loaded SGLang endpoints from {path}: " + ", ".join(f"{m} x{len(u)}" for m, u in _configured.items()))
+
+
+def get_pool(model, fallback_urls=None):
+    """Return the replica pool for model (configured replicas, else fallback_urls)."""
+    pool = _pools.get(model)
+    if pool is not None:
+        return pool
+    with _pools_lock:
+        pool = _pools.get(model)
+        if pool is None:
+            urls = _configured.get(model) or list(fallback_urls or [])
+            if not urls:
+                raise ValueError(f"No SGLang endpoint configured for model {model!r}")
+            pool = EndpointPool(model, urls)
+            _pools[model] = pool
+    _ensure_health_thread()
+    return pool
+
+
+def _health_loop():
+    while True:
+        time.sleep(HEALTH_CHECK_INTERVAL_SEC)
+        for pool in list(_pools.values()):
+            was = {r.base_url: r.healthy for r in pool.replicas}
+            pool.probe()
+            for r in pool.replicas:
+                if was.get(r.base_url) != r.healthy:
+                    state = "healthy" if r.healthy else f"UNHEALTHY ({r.last_error})"
+                    print(f"[endpoints] {pool.model} @ {r.base_url}: {state}", flush=True)
+
+
+def _ensure_health_thread():
+    global _health_thread
+    if _health_thread is not None or HEALTH_CHECK_INTERVAL_SEC <= 0:
+        return
+    with _pools_lock:
+        if _health_thread is None:
+            _health_thread = threading.Thread(target=_health_loop, name="sglang-health", daemon=True)
+            _health_thread.start()
+
+
+def print_endpoint_stats():
+    if not _pools:
+        return
+    print("\n=== SGLang replicas ===")
+    for model, pool in _pools.items():
+        for r in pool.replicas:
+            state = "healthy" if r.healthy else f"unhealthy ({r.last_error})"
+            print(f"  {model} @ {r.base_url}: requests={r.requests} {state}")
+
+
+if SGLANG_ENDPOINTS_CONFIG:
+    load_endpoints_config(SGLANG_ENDPOINTS_CONFIG)
@@ -0,0 +1,111 @@
+"""Hedged requests: one still running past its stage's latency percentile gets a duplicate (on another
+replica when there is one); the first usable response wins and the other request is cancelled."""
+
+import asyncio
+import threading
+import time
+from collections import deque
+
+DEFAULT_PERCENTILE = 95
+DEFAULT_MAX_EXTRA = 0.05
+MIN_SAMPLES = 20
+WINDOW = 500
+MIN_DELAY_SEC = 0.05
+
+
+class HedgePolicy:
+    """Per-stage latency percentiles and a budget for duplicate requests."""
+
+    def __init__(self, percentile=DEFAULT_PERCENTILE, max_extra=DEFAULT_MAX_EXTRA, min_samples=MIN_SAMPLES):
+        self.percentile = percentile
+        self.max_extra = max_extra
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._latencies = {}  # stage -> deque of recent successful latencies
+        self.stats = {}
+
+    def _stage_stats(self, stage):
+        return self.stats.setdefault(stage, {"requests": 0, "hedged": 0, "hedge_wins": 0, "over_budget": 0})
+
+    def threshold(self, stage):
+        """Current hedge delay for stage in seconds, or None while there are too few samples."""
+        with self._lock:
+            window = self._latencies.get(stage)
+            if window is None or len(window) < self.min_samples:
+                return None
+            values = sorted(window)
+        k = min(len(values) - 1, int(len(values) * self.percentile / 100))
+        return max(MIN_DELAY_SEC, values[k])
+
+    def _observe(self, stage, latency):
+        with self._lock:
+            self._latencies.setdefault(stage, deque(maxlen=WINDOW)).append(latency)
+
+    def _take_budget(self, stage):
+        with self._lock:
+            total = sum(s["requests"] for s in self.stats.values())
+            hedged = sum(s["hedged"] for s in self.stats.values())
+            s = self._stage_stats(stage)
+            if hedged + 1 > self.max_extra * total:
+                s["over_budget"] += 1
+                return False
+            s["hedged"] += 1
+            return True
+
+    async def run(self, stage, primary_fn, hedge_fn):
+        """Await primary_fn(); past the stage threshold also start hedge_fn() and take the first
+        non-None result. Both are coroutine functions returning None on failure."""
+        with self._lock:
+            self._stage_stats(stage)["requests"] += 1
+        start = time.monotonic()
+        delay = self.threshold(stage)
+        primary = asyncio.ensure_future(primary_fn())
+        pending = {primary}
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait(pending, timeout=delay)
+                if not done and self._take_budget(stage):
+                    pending.add(asyncio.ensure_future(hedge_fn()))
+            result = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and task.result() is not None:
+                        result = task.result()
+                        if task is not primary:
+                            with self._lock:
+                                self._stage_stats(stage)["hedge_wins"] += 1
+                        break
+                if result is not None:
+                    break
+                for task in done:
+                    if task.exception() is not None and not pending:
+                        raise task.exception()
+            if result is not None:
+                self._observe(stage, time.monotonic() - start)
+            return result
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def get_stats(self):
+        out = {}
+        with self._lock:
+            items = {k: dict(v) for k, v in self.stats.items()}
+        for stage, s in items.items():
+            threshold = self.threshold(stage)
+            s["threshold_sec"] = round(threshold, 3) if threshold is not None else None
+            s["extra_load"] = round(s["hedged"] / s["requests"], 4) if s["requests"] else 0.0
+            out[stage] = s
+        return out
+
+    def print_stats(self):
+        stats = self.get_stats()
+        if not stats:
+            return
+        print(f"\n=== Hedged requests (p{self.percentile}, max extra {self.max_extra:.0%}) ===")
+        for stage, s in stats.items():
+            print(
+                f"  {stage}: requests={s['requests']} hedged={s['hedged']} ({s['extra_load']:.2%}) "
+                f"hedge_wins={s['hedge_wins']} over_budget={s['over_budget']} threshold={s['threshold_sec']}s"
+            )
@@ -0,0 +1,189 @@
+"""Opt-in persistent LLM response cache: SQLite, keyed on a hash of the exact request, LRU eviction.
+Modes: off (default), readwrite (serve hits, store misses), replay (serve hits only; misses fail)."""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+CACHE_MODES = ("off", "readwrite", "replay")
+DEFAULT_MAX_MB = 2048
+EVICT_EVERY_N_PUTS = 500
+
+_cache = None
+
+
+class LLMCache:
+    """SQLite-backed response cache; safe to share between threads and coroutines."""
+
+    def __init__(self, path, mode="readwrite", max_mb=DEFAULT_MAX_MB, max_age_days=None):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown cache mode {mode!r}; choose from {CACHE_MODES}")
+        self.path = path
+        self.mode = mode
+        self.max_bytes = int(max_mb * 1024 * 1024) if max_mb else None
+        self.max_age_sec = max_age_days * 86400 if max_age_days else None
+        self._lock = threading.Lock()
+        self._puts = 0
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "replay_misses": 0, "evicted": 0}
+
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        ''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_last_access ON responses(last_access)')
+        self._conn.commit()
+        self.evict()
+
+    @staticmethod
+    def make_key(request):
+        """Hash of the request fields that determine the completion."""
+        keyed = {
+            "model": request.get("model"),
+            "messages": request.get("messages"),
+            "temperature": request.get("temperature"),
+            "top_p": request.get("top_p"),
+            "max_tokens": request.get("max_tokens"),
+            "extra_body": request.get("extra_body"),
+        }
+        if request.get("response_format") is not None:
+            keyed["response_format"] = request["response_format"]
+        payload = json.dumps(keyed, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, request):
+        key = self.make_key(request)
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT response FROM responses WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                self.stats["misses"] += 1
+                if self.mode == "replay":
+                    self.stats["replay_misses"] += 1
+                return None
+            self._conn.execute(
+                'UPDATE responses SET last_access = ? WHERE key = ?', (time.time(), key)
+            )
+            self._conn.commit()
+            self.stats["hits"] += 1
+            return row[0]
+
+    def put(self, request, response):
+        self.put_key(self.make_key(request), request.get("model"), response)
+
+    def put_key(self, key, model, response):
+        """Store response under a precomputed key (batch ingest: the key is the custom_id)."""
+        if self.mode != "readwrite" or not response:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute('''
+                INSERT OR REPLACE INTO responses (key, model, response, size, created_at, last_access)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (key, model, response, len(response.encode("utf-8")), now, now))
+            self._conn.commit()
+            self.stats["stores"] += 1
+            self._puts += 1
+            due = self._puts % EVICT_EVERY_N_PUTS == 0
+        if due:
+            self.evict()
+
+    def evict(self):
+        """Drop entries past max age, then least recently used entries over the size budget."""
+        with self._lock:
+            evicted = 0
+            if self.max_age_sec:
+                cur = self._conn.execute(
+                    'DELETE FROM responses WHERE created_at < ?', (time.time() - self.max_age_sec,)
+                )
+                evicted += cur.rowcount
+            if self.max_bytes:
+                total = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+                if total > self.max_bytes:
+                    rows = self._conn.execute(
+                        'SELECT key, size FROM responses ORDER BY last_access'
+                    ).fetchall()
+                    stale = []
+                    for key, size in rows:
+                        if total <= self.max_bytes:
+                            break
+                        stale.append((key,))
+                        total -= size
+                    self._conn.executemany('DELETE FROM responses WHERE key = ?', stale)
+                    evicted += len(stale)
+            self._conn.commit()
+            self.stats["evicted"] += evicted
+
+    def get_stats(self):
+        with self._lock:
+            out = dict(self.stats)
+            entries = self._conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+        lookups = out["hits"] + out["misses"]
+        out["hit_rate"] = round(out["hits"] / lookups, 4) if lookups else 0.0
+        out["entries"] = entries
+        out["mode"] = self.mode
+        return out
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def configure(path, mode="readwrite", max_mb=DEFAULT_MAX_MB, max_age_days=None):
+    """Enable the process-wide cache (mode="off" or no path disables it)."""
+    global _cache
+    if _cache is not None:
+        _cache.close()
+        _cache = None
+    if path and mode != "off":
+        _cache = LLMCache(path, mode=mode, max_mb=max_mb, max_age_days=max_age_days)
+        print(f"LLM response cache: {path} (mode={mode})")
+    return _cache
+
+
+def get_cache():
+    return _cache
+
+
+def lookup(request):
+    """Cached response for request, or None (also None when the cache is disabled)."""
+    return _cache.get(request) if _cache is not None else None
+
+
+def store(request, response):
+    if _cache is not None:
+        _cache.put(request, response)
+
+
+def is_replay_only():
+    return _cache is not None and _cache.mode == "replay"
+
+
+def get_stats():
+    return _cache.get_stats() if _cache is not None else None
+
+
+def print_stats():
+    stats = get_stats()
+    if not stats:
+        return
+    print(
+        f"  llm_cache ({stats['mode']}): hits={stats['hits']} misses={stats['misses']} "
+        f"hit_rate={stats['hit_rate']:.2%} stores={stats['stores']} evicted={stats['evicted']} "
+        f"entries={stats['entries']}"
+        + (f" replay_misses={stats['replay_misses']}" if stats["mode"] == "replay" else "")
+    )
@@ -3,10 +3,27 @@
 import asyncio
 import os
 import gc
-from functools import partial
-from openai import OpenAI
+import threading
 import time
+from functools import partial
 from .configs import EXTERNAL_FEEDBACK_PROMPT_EASY, EXTERNAL_FEEDBACK_PROMPT_HARD
+from .sglang_client import get_async_client, get_sync_client, sglang_base_url, close_clients
+from .rate_limiter import call_with_retries, acall_with_retries
+from . import llm_cache
+from .prefix_scheduler import prefix_key, record_usage
+from .endpoints import get_pool
+from . import streaming
+from .structured_output import response_format
+from . import adaptive_concurrency
+from . import telemetry
+from . import singleflight
+from . import deadlines
+from . import token_budget
+from . import batch_jobs
+from .token_budget import token_slot, token_slot_sync
+from .adaptive_concurrency import endpoint_slot, endpoint_slot_sync
+from .steering_worker import SteeringBatchWorker
+from token_counter import count_tokens_chat
 
 # Configuration
 os.environ["CUDA_VISIBLE_DEVICES"] = "4,5,6,7"
@@ -17,10 +34,22 @@ TEMPERATURE = 0.0
 SGLANG_CHAT_MAX_TOKENS = 1024
 
 MAX_CONCURRENT = 1  # 1 = serial; >1 for API/SGLang models
+PREFIX_SCHEDULER = None  # tools.prefix_scheduler.PrefixScheduler when prefix-grouped dispatch is enabled
+STREAM_EARLY_STOP = False  # stream answer prompts and stop once the decisive JSON field is complete
+CONSTRAINED_DECODING = False  # send a JSON-schema response_format for prompts that pass schema=
+LLM_CALL_TIMEOUT = None  # seconds per LLM call (all retries and replicas); None = no per-call deadline
+ITERATION_BUDGET = None  # seconds per iteration; questions still running then are cancelled and marked failed
+HEDGE_POLICY = None  # tools.hedging.HedgePolicy: duplicate requests slower than the stage's latency percentile
+MAX_TOKENS_POLICY = None  # tools.max_tokens.MaxTokensPolicy: per-stage max_tokens from observed output lengths
+SINGLEFLIGHT = False  # coalesce identical deterministic requests that are in flight at the same time
+QUESTION_HEADROOM = 2  # with adaptive concurrency: questions in progress per endpoint request slot
 LOCAL_MODELS = set()  # HF models loaded in-process (GPU-bound); SGLang models are not local
+EXTERNAL_FEEDBACK_MODEL = "meta-llama/Meta-Llama-3-8B-Instruct"
 
 STEERING_COEFFICIENT = None
 STEERING_MODEL = "Qwen/Qwen3-32B"  
+STEERING_BATCH_SIZE = 1  # >1: micro-batch steering requests through tools/steering_worker.py
+STEERING_SHARED_PREFIX = False  # generate_batch groups (Hard options) reuse one prefix KV cache; implies the worker
 
 STEERING_AXIS_FILENAMES = {
     "Qwen/Qwen3-32B": "qwen-3-32b/assistant_axis.pt",
@@ -37,8 +66,11 @@ _steering_tokenizer = None
 _steering_axis = None
 _steering_config = None
 _steering_model_name = None  # which model is loaded (to detect change)
+_steering_lock = threading.Lock()  # serializes model loading and unbatched generate calls
+_steering_worker = None
+_singleflight = singleflight.SingleFlight()
 
-def _get_external_feedback_sync(difficulty, question, persona, model_answer, feedback_language=None, model="meta-llama/Meta-Llama-3-8B-Instruct"):
+def external_feedback_messages(difficulty, question, persona, model_answer, feedback_language=None):
     user_content = f"Question: {question}\nPersona: {persona}"
     if model_answer is not None:
         user_content += f"\nModel Answer: {model_answer}"
@@ -49,20 +81,318 @@ def _get_external_feedback_sync(difficulty, question, persona, model_answer, fee
         system_prompt = EXTERNAL_FEEDBACK_PROMPT_HARD
     if feedback_language:
         system_prompt = system_prompt.rstrip() + f"\n\nYou must provide your feedback entirely in {feedback_language}."
-    messages = [
+    return [
         {"role": "system", "content": system_prompt},
         {"role": "user", "content": user_content}
     ]
-    _, response = generate_text_funcs[model](None, messages, max_tokens=1024, enable_thinking_bool=False)
+
+
+async def get_external_feedback(difficulty, question, persona, model_answer, feedback_language=None, model=None):
+    messages = external_feedback_messages(difficulty, question, persona, model_answer, feedback_language)
+    _, response = await async_generate_text_funcs[model or EXTERNAL_FEEDBACK_MODEL](
+        None, messages, max_tokens=1024, enable_thinking_bool=False, stage="feedback"
+    )
     return response.strip()
 
 
-async def get_external_feedback(difficulty, question, persona, model_answer, feedback_language=None):
-    return await asyncio.to_thread(_get_external_feedback_sync, difficulty, question, persona, model_answer, feedback_language)
+# Default SGLang port per model on SGLANG_HOST (most models -> 30002). Used when the
+# model has no replicas in the endpoints config (see tools/endpoints.py).
+_MODEL_PORTS = {
+    "meta-llama/Meta-Llama-3-8B-Instruct": 30000,
+    "Qwen/Qwen3-14B": 30001,
+    "zai-org/GLM-4-9B-0414": 30003,
+}
+DEFAULT_SGLANG_PORT = 30002
+
+
+def _sglang_pool(model):
+    return get_pool(model, fallback_urls=[sglang_base_url(SGLANG_HOST, _MODEL_PORTS.get(model, DEFAULT_SGLANG_PORT))])
+
+
+def _request_tokens(create_kwargs):
+    """Estimated KV footprint of a request for token-budget admission: prompt tokens
+    (token_counter's estimate) plus max_tokens."""
+    if not token_budget.is_enabled():
+        return 0
+    messages = [
+        {**m, "content": "".join(p.get("text", "") for p in m["content"])}
+        if isinstance(m, dict) and isinstance(m.get("content"), list) else m
+        for m in create_kwargs["messages"]
+    ]
+    return count_tokens_chat(messages) + (create_kwargs.get("max_tokens") or SGLANG_CHAT_MAX_TOKENS)
+
+
+def _adaptive_kwargs(create_kwargs, stage):
+    """create_kwargs with max_tokens lowered to MAX_TOKENS_POLICY's cap for the stage (the same
+    dict when no lower cap applies). Uncapped requests (max_tokens None) stay uncapped until the
+    stage has a learned cap, so a cut response is retried without one."""
+    if MAX_TOKENS_POLICY is None:
+        return create_kwargs
+    full_cap = create_kwargs.get("max_tokens")
+    cap = MAX_TOKENS_POLICY.cap(create_kwargs["model"], stage, full_cap)
+    return create_kwargs if cap == full_cap else {**create_kwargs, "max_tokens": cap}
+
+
+def _cut_by_adaptive_cap(sent_kwargs, create_kwargs, finish_reason, stage):
+    """True when a response ran into the adaptive cap rather than the caller's (send it again)."""
+    if sent_kwargs is create_kwargs or finish_reason != "length":
+        return False
+    MAX_TOKENS_POLICY.on_truncated(create_kwargs["model"], stage)
+    return True
+
+
+def _record_finish(sent_kwargs, stage, usage, finish_reason):
+    telemetry.on_finish(finish_reason, sent_kwargs.get("max_tokens"))
+    if MAX_TOKENS_POLICY is not None and usage is not None:
+        MAX_TOKENS_POLICY.observe(sent_kwargs["model"], stage, usage.completion_tokens)
+
+
+def _chat_on_endpoint(base_url, create_kwargs, stage=None):
+    """Blocking chat completion with retries on one replica. Returns stripped content or None.
+    Under a deadline (tools/deadlines.py) each request's HTTP timeout is the time left."""
+    client = get_sync_client(base_url)
+
+    def _send(kwargs):
+        timeout = deadlines.remaining()
+        with token_slot_sync(base_url, _request_tokens(kwargs)), endpoint_slot_sync(base_url):
+            telemetry.on_send(base_url)
+            if timeout is not None:
+                resp = client.chat.completions.create(**kwargs, timeout=max(timeout, 0.001))
+            else:
+                resp = client.chat.completions.create(**kwargs)
+        record_usage(resp.usage)
+        telemetry.on_usage(resp.usage)
+        return resp
+
+    def _create():
+        kwargs = _adaptive_kwargs(create_kwargs, stage)
+        resp = _send(kwargs)
+        if _cut_by_adaptive_cap(kwargs, create_kwargs, resp.choices[0].finish_reason, stage):
+            kwargs = create_kwargs
+            resp = _send(kwargs)
+        _record_finish(kwargs, stage, resp.usage, resp.choices[0].finish_reason)
+        return (resp.choices[0].message.content or "").strip()
+
+    return call_with_retries(base_url, _create, deadline=deadlines.current())
+
+
+async def _chat_on_endpoint_async(base_url, create_kwargs, stage=None):
+    """Async chat completion with retries on one replica. Returns stripped content or None.
+    Under a deadline the request is cancelled (and aborted upstream) when it runs out."""
+    client = get_async_client(base_url)
+
+    async def _send(kwargs):
+        async with token_slot(base_url, _request_tokens(kwargs)), endpoint_slot(base_url):
+            telemetry.on_send(base_url)
+            resp = await asyncio.wait_for(client.chat.completions.create(**kwargs), deadlines.remaining())
+        record_usage(resp.usage)
+        telemetry.on_usage(resp.usage)
+        return resp
+
+    async def _create():
+        kwargs = _adaptive_kwargs(create_kwargs, stage)
+        resp = await _send(kwargs)
+        if _cut_by_adaptive_cap(kwargs, create_kwargs, resp.choices[0].finish_reason, stage):
+            kwargs = create_kwargs
+            resp = await _send(kwargs)
+        _record_finish(kwargs, stage, resp.usage, resp.choices[0].finish_reason)
+        return (resp.choices[0].message.content or "").strip()
+
+    return await acall_with_retries(base_url, _create, deadline=deadlines.current())
+
+
+async def _chat_on_endpoint_stream_async(base_url, create_kwargs, stop_field, stage_key, stage=None):
+    """Streaming _chat_on_endpoint_async that closes the stream once stop_field is complete.
+
+    Returns (content, stopped_early). A stopped response is completed into a JSON object
+    holding the decisive field (and an empty reasoning if none was generated yet).
+    """
+    client = get_async_client(base_url)
+    run_full = streaming.should_run_baseline(stage_key)
+
+    async def _consume(kwargs):
+        text, n_chunks, stopped, usage, finish_reason = "", 0, False, None, None
+        stream = await client.chat.completions.create(
+            **kwargs, stream=True, stream_options={"include_usage": True}
+        )
+        try:
+            async for chunk in stream:
+                if getattr(chunk, "usage", None) is not None:
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                finish_reason = chunk.choices[0].finish_reason or finish_reason
+                delta = chunk.choices[0].delta.content
+                if not delta:
+                    continue
+                if not text:
+                    telemetry.on_first_token()
+                text += delta
+                n_chunks += 1
+                if not run_full:
+                    end = streaming.decisive_field_end(text, stop_field)
+                    if end is not None:
+                        text, stopped = text[:end], True
+                        break
+        finally:
+            await stream.close()
+        return text, n_chunks, stopped, usage, finish_reason
+
+    async def _send(kwargs):
+        async with token_slot(base_url, _request_tokens(kwargs)), endpoint_slot(base_url):
+            telemetry.on_send(base_url)
+            return await asyncio.wait_for(_consume(kwargs), deadlines.remaining())
+
+    async def _create():
+        start = time.perf_counter()
+        kwargs = _adaptive_kwargs(create_kwargs, stage)
+        text, n_chunks, stopped, usage, finish_reason = await _send(kwargs)
+        if not stopped and _cut_by_adaptive_cap(kwargs, create_kwargs, finish_reason, stage):
+            record_usage(usage)
+            kwargs = create_kwargs
+            text, n_chunks, stopped, usage, finish_reason = await _send(kwargs)
+        record_usage(usage)
+        telemetry.on_usage(usage, early_stop=stopped)
+        n_tokens = usage.completion_tokens if usage is not None and not stopped else n_chunks
+        streaming.record(stage_key, n_tokens, time.perf_counter() - start, stopped)
+        if stopped:
+            telemetry.on_finish("early_stop", kwargs.get("max_tokens"))
+            return streaming.finalize_partial(text, stop_field), True
+        _record_finish(kwargs, stage, usage, finish_reason)
+        return text.strip(), False
+
+    return await acall_with_retries(base_url, _create, deadline=deadlines.current()) or (None, False)
+
+
+def _sglang_chat(model, create_kwargs, stage=None):
+    """Chat completion for model: LLM cache, then the least-loaded replica, failing over to
+    the remaining replicas if one gives up. Returns stripped content or None."""
+    with telemetry.track(stage, model), deadlines.scope(LLM_CALL_TIMEOUT):
+        cached = llm_cache.lookup(create_kwargs)
+        if cached is not None:
+            telemetry.set_status("cache_hit")
+            return cached
+        if llm_cache.is_replay_only():
+            print(f"LLM cache replay miss (model={create_kwargs.get('model')}); not calling server")
+            telemetry.set_status("replay_miss")
+            return None
+        if batch_jobs.is_enabled():
+            telemetry.set_status("deferred")
+            batch_jobs.defer(create_kwargs, stage)
+        pool = _sglang_pool(model)
+        tried = []
+        for _ in pool.replicas:
+            if deadlines.expired():
+                break
+            with pool.lease(exclude=tried) as base_url:
+                content = _chat_on_endpoint(base_url, create_kwargs, stage)
+            if content is not None:
+                llm_cache.store(create_kwargs, content)
+                return content
+            tried.append(base_url)
+        telemetry.set_status("deadline" if deadlines.expired() else "failed")
+        return None
+
+
+async def _sglang_chat_async(model, create_kwargs, stop_field=None, stage=None):
+    """Async _sglang_chat. With STREAM_EARLY_STOP and a stop_field (the decisive JSON key,
+    reasoning optional) the request is streamed and cut once that field is complete;
+    cut responses are not written to the LLM cache. With SINGLEFLIGHT, identical
+    deterministic requests already in flight share one upstream call. The whole call
+    (retries and fail-over included) is bounded by LLM_CALL_TIMEOUT and any enclosing
+    deadline (tools/deadlines.py)."""
+    with telemetry.track(stage, model), deadlines.scope(LLM_CALL_TIMEOUT):
+        cached = llm_cache.lookup(create_kwargs)
+        if cached is not None:
+            telemetry.set_status("cache_hit")
+            return cached
+        if llm_cache.is_replay_only():
+            print(f"LLM cache replay miss (model={create_kwargs.get('model')}); not calling server")
+            telemetry.set_status("replay_miss")
+            return None
+        if batch_jobs.is_enabled():
+            telemetry.set_status("deferred")
+            batch_jobs.defer(create_kwargs, stage)
+        stop_field = stop_field if STREAM_EARLY_STOP else None
+        if SINGLEFLIGHT and singleflight.is_deterministic(create_kwargs):
+            content, coalesced = await _singleflight.do(
+                singleflight.request_key(create_kwargs, stop_field),
+                lambda: _sglang_chat_upstream_async(model, create_kwargs, stop_field, stage),
+            )
+            if coalesced:
+                telemetry.set_status("coalesced")
+        else:
+            content = await _sglang_chat_upstream_async(model, create_kwargs, stop_field, stage)
+        if content is None:
+            telemetry.set_status("deadline" if deadlines.expired() else "failed")
+        return content
+
+
+async def _sglang_chat_upstream_async(model, create_kwargs, stop_field, stage):
+    """Send create_kwargs upstream; with HEDGE_POLICY a straggler gets a duplicate on another replica."""
+    if HEDGE_POLICY is None:
+        return await _chat_with_failover_async(model, create_kwargs, stop_field, stage)
+    used = []
+
+    async def _hedge():
+        telemetry.on_hedge()
+        return await _chat_with_failover_async(model, create_kwargs, stop_field, stage, exclude=used[-1:])
+
+    return await HEDGE_POLICY.run(
+        stage or "default",
+        lambda: _chat_with_failover_async(model, create_kwargs, stop_field, stage, on_replica=used.append),
+        _hedge,
+    )
+
+
+async def _chat_with_failover_async(model, create_kwargs, stop_field, stage, exclude=(), on_replica=None):
+    """Send create_kwargs to the least-loaded replica (not in exclude), failing over to the others."""
+    pool = _sglang_pool(model)
+    tried = list(exclude)
+    for _ in pool.replicas:
+        if deadlines.expired():
+            break
+        stopped = False
+        with pool.lease(exclude=tried) as base_url:
+            if on_replica is not None:
+                on_replica(base_url)
+            if stop_field is not None:
+                content, stopped = await _chat_on_endpoint_stream_async(
+                    base_url, create_kwargs, stop_field, f"{stage or 'default'}:{stop_field}", stage
+                )
+            else:
+                content = await _chat_on_endpoint_async(base_url, create_kwargs, stage)
+        if content is not None:
+            if not stopped:
+                llm_cache.store(create_kwargs, content)
+            return content
+        tried.append(base_url)
+    return None
+
+
+LLAMA_SGLANG_MODEL = "meta-llama/Meta-Llama-3-8B-Instruct"
+
+
+def _apply_schema(create_kwargs, schema):
+    """Add the named JSON-schema constraint (tools/structured_output.py) when enabled."""
+    if CONSTRAINED_DECODING and schema is not None:
+        create_kwargs["response_format"] = response_format(schema)
+    return create_kwargs
+
+
+def _llama_create_kwargs(messages, max_tokens, schema=None):
+    return _apply_schema(dict(
+        model=LLAMA_SGLANG_MODEL,
+        messages=messages,
+        temperature=0.6,
+        top_p=1,
+        max_tokens=max_tokens,
+    ), schema)
 
 
 def llama_3_8b_instruct_generate(
-    llm_instance, messages, max_tokens=SGLANG_CHAT_MAX_TOKENS, enable_thinking_bool=False, **kwargs
+    llm_instance, messages, max_tokens=SGLANG_CHAT_MAX_TOKENS, enable_thinking_bool=False, stage=None, schema=None,
+    **kwargs
 ):
     """Generate text from chat input using the LLM.
     
@@ -73,36 +403,27 @@ def llama_3_8b_instruct_generate(
     Returns:
         Generated text string
     """
-    client = OpenAI(
-        base_url=f"http://{SGLANG_HOST}:30000/v1",
-        api_key="EMPTY",
-    )
-    for n_try in range(10):
-        try:
-            time.sleep(0.5)
-            resp = client.chat.completions.create(
-                model="meta-llama/Meta-Llama-3-8B-Instruct",
-                messages=messages,
-                temperature=0.6,
-                top_p=1,
-                max_tokens=max_tokens,
-            )
-            content = (resp.choices[0].message.content or "").strip()
-            break
-        except KeyboardInterrupt:
-            raise
-        except Exception as e:
-            print(f"Exception: {e}")
-
-            print("Sleep for 10 sec, then retry...")
-            time.sleep(10)
-    else:
+    content = _sglang_chat(LLAMA_SGLANG_MODEL, _llama_create_kwargs(messages, max_tokens, schema), stage=stage)
+    if content is None:
         print("Error: Failed to generate response")
         content = ""
+    return None, content
+
 
+async def llama_3_8b_instruct_generate_async(
+    llm_instance, messages, max_tokens=SGLANG_CHAT_MAX_TOKENS, enable_thinking_bool=False,
+    stop_field=None, stage=None, schema=None, **kwargs
+):
+    """Async counterpart of llama_3_8b_instruct_generate (awaits the pooled client directly)."""
+    content = await _sglang_chat_async(
+        LLAMA_SGLANG_MODEL, _llama_create_kwargs(messages, max_tokens, schema), stop_field=stop_field, stage=stage
+    )
+    if content is None:
+        print("Error: Failed to generate response")
+        content = ""
     return None, content
 
-# SGLang :30002 default (see _MODEL_PORTS below; most models → 30002).
+# SGLang :30002 default (see _MODEL_PORTS above; most models → 30002).
 GEMMA3_12B_SGLANG_MODEL_ID = "google/gemma-3-12b-it"
 GEMMA3_12B_SGLANG_API_MODEL = os.environ.get(
     "GEMMA3_12B_SGLANG_API_MODEL",
@@ -146,68 +467,81 @@ def _normalize_messages_text_parts(messages, model: str):
     return out
 
 
+def _qwen_create_kwargs(model, messages, max_tokens, schema=None):
+    create_kwargs = dict(
+        model=model,
+        messages=_normalize_messages_text_parts(messages, model),
+        temperature=0.6,
+        top_p=1,
+        max_tokens=max_tokens,
+    )
+    if model.startswith("Qwen"):
+        create_kwargs["extra_body"] = {
+            "chat_template_kwargs": {"enable_thinking": False}
+        }
+    return _apply_schema(create_kwargs, schema)
+
+
+def _split_thinking(content, enable_thinking_bool):
+    """Split a leading <think>...</think> block off content; returns (thinking_content, response)."""
+    thinking_content = None
+    if content is None:
+        return None, ""
+    if content.startswith("<think>"):
+        i = content.find("</think>")
+        if i != -1:
+            thinking_content, content = content[7:i].strip(), content[i + 8:].strip()
+    if not enable_thinking_bool:
+        return None, content
+    return (thinking_content, content)
+
+
+def _print_sglang_failure(model):
+    replicas = [r.base_url for r in _sglang_pool(model).replicas]
+    print(
+        f"Error: Failed to generate response from SGLang "
+        f"(model={model}, replicas={replicas})"
+    )
+
+
 def qwen_3_sglang_generate(
     llm_instance=None,
     messages=None,
     max_tokens=SGLANG_CHAT_MAX_TOKENS,
     enable_thinking_bool=False,
     model=GEMMA3_12B_SGLANG_API_MODEL,
+    stage=None,
+    schema=None,
     **kwargs,
 ):
     """
     Get response from SGLang server using OpenAI-compatible API.
     Returns (thinking_content, response) to match other generate_text_funcs.
     """
-    _MODEL_PORTS = {
-        "Qwen/Qwen3-14B": 30001,
-        "zai-org/GLM-4-9B-0414": 30003,
-    }
-    _port = _MODEL_PORTS.get(model, 30002)
-    client = OpenAI(
-        base_url=f"http://{SGLANG_HOST}:{_port}/v1",
-        api_key="EMPTY",
-    )
-    thinking_content = None
-    content = None
-    api_messages = _normalize_messages_text_parts(messages, model)
-    for n_try in range(10):
-        try:
-            time.sleep(0.5)
-            create_kwargs = dict(
-                model=model,
-                messages=api_messages,
-                temperature=0.6,
-                top_p=1,
-                max_tokens=max_tokens,
-            )
-            if model.startswith("Qwen"):
-                create_kwargs["extra_body"] = {
-                    "chat_template_kwargs": {"enable_thinking": False}
-                }
-            resp = client.chat.completions.create(**create_kwargs)
-            content = (resp.choices[0].message.content or "").strip()
-            break
-        except KeyboardInterrupt:
-            raise
-        except Exception as e:
-            print(f"Exception: {e}")
-            print("Sleep for 10 sec, then retry...")
-            time.sleep(10)
-    else:
-        print(
-            f"Error: Failed to generate response from SGLang "
-            f"(model={model}, host={SGLANG_HOST}, port={_port}) after 10 retries"
-        )
+    content = _sglang_chat(model, _qwen_create_kwargs(model, messages, max_tokens, schema), stage=stage)
+    if content is None:
+        _print_sglang_failure(model)
+    return _split_thinking(content, enable_thinking_bool)
 
+
+async def qwen_3_sglang_generate_async(
+    llm_instance=None,
+    messages=None,
+    max_tokens=SGLANG_CHAT_MAX_TOKENS,
+    enable_thinking_bool=False,
+    model=GEMMA3_12B_SGLANG_API_MODEL,
+    stop_field=None,
+    stage=None,
+    schema=None,
+    **kwargs,
+):
+    """Async counterpart of qwen_3_sglang_generate (awaits the pooled client directly)."""
+    content = await _sglang_chat_async(
+        model, _qwen_create_kwargs(model, messages, max_tokens, schema), stop_field=stop_field, stage=stage
+    )
     if content is None:
-        return None, ""
-    if content.startswith("<think>"):
-        i = content.find("</think>")
-        if i != -1:
-            thinking_content, content = content[7:i].strip(), content[i + 8:].strip()
-    if not enable_thinking_bool:
-        return None, content
-    return (thinking_content, content)
+        _print_sglang_failure(model)
+    return _split_thinking(content, enable_thinking_bool)
 
 
 def _get_steering_model_and_axis():
@@ -230,6 +564,8 @@ def _get_steering_model_and_axis():
             "Install with: pip install assistant-axis"
         ) from e
     from huggingface_hub import hf_hub_download
+    import torch
+    from transformers import AutoTokenizer, AutoModelForCausalLM
 
     axis_filename = STEERING_AXIS_FILENAMES.get(model_name)
     if axis_filename is None:
@@ -281,45 +617,102 @@ def qwen3_32b_steering_generate(
     except ImportError as e:
         raise ImportError("assistant_axis required for steering. pip install assistant-axis") from e
 
-    model, tokenizer, axis, config = _get_steering_model_and_axis()
-    layer = config["target_layer"]
     # Persona generation/revising: unsteered. Question-answering: use STEERING_COEFFICIENT.
     coef = STEERING_COEFFICIENT if use_steering else 0.0
+    if _steering_uses_worker():
+        return None, _get_steering_worker().generate(messages, max_tokens, coef).strip()
+    # one conversation at a time: concurrent callers share the model, so serialize them
+    with _steering_lock:
+        model, tokenizer, axis, config = _get_steering_model_and_axis()
+        layer = config["target_layer"]
+        if abs(coef) < 1e-6:
+            response = generate_response(
+                model,
+                tokenizer,
+                messages,
+                max_new_tokens=max_tokens,
+                temperature=TEMPERATURE if TEMPERATURE > 0 else 0.7,
+                top_p=0.9,
+                do_sample=TEMPERATURE > 0,
+            )
+            return None, response.strip()
 
-    if abs(coef) < 1e-6:
-        response = generate_response(
+        with ActivationSteering(
             model,
-            tokenizer,
-            messages,
-            max_new_tokens=max_tokens,
-            temperature=TEMPERATURE if TEMPERATURE > 0 else 0.7,
-            top_p=0.9,
-            do_sample=TEMPERATURE > 0,
-        )
-        return None, response.strip()
-
-    with ActivationSteering(
-        model,
-        steering_vectors=[axis[layer]],
-        coefficients=[coef],
-        layer_indices=[layer],
-    ):
-        response = generate_response(
-            model,
-            tokenizer,
-            messages,
-            max_new_tokens=max_tokens,
-            temperature=TEMPERATURE if TEMPERATURE > 0 else 0.7,
-            top_p=0.9,
-            do_sample=TEMPERATURE > 0,
-        )
+            steering_vectors=[axis[layer]],
+            coefficients=[coef],
+            layer_indices=[layer],
+        ):
+            response = generate_response(
+                model,
+                tokenizer,
+                messages,
+                max_new_tokens=max_tokens,
+                temperature=TEMPERATURE if TEMPERATURE > 0 else 0.7,
+                top_p=0.9,
+                do_sample=TEMPERATURE > 0,
+            )
     return None, response.strip()
 
 
+def _steering_uses_worker():
+    """Whether steering generations go through the worker thread.
+
+    With shared-prefix groups the worker runs the model, so every other steering call
+    (refine, persona) must go through it too: ActivationSteering hooks the whole model,
+    and a call under _steering_lock would run it from a second thread at the same time."""
+    return STEERING_BATCH_SIZE > 1 or STEERING_SHARED_PREFIX
+
+
+def _get_steering_worker():
+    """Batching worker owning the steering model (created on first use, rebuilt if the model changes)."""
+    global _steering_worker
+    with _steering_lock:
+        model, tokenizer, axis, config = _get_steering_model_and_axis()
+        if _steering_worker is None or _steering_worker.model is not model:
+            if _steering_worker is not None:
+                _steering_worker.stop()
+            layer = config["target_layer"]
+            _steering_worker = SteeringBatchWorker(
+                model,
+                tokenizer,
+                steering_vector=axis[layer],
+                layer=layer,
+                max_batch_size=STEERING_BATCH_SIZE,
+                temperature=TEMPERATURE,
+                top_p=0.9,
+            ).start()
+        return _steering_worker
+
+
 # Steering generator used for any model in STEERING_AXIS_FILENAMES when STEERING_COEFFICIENT is set
 def _steering_generate(llm_instance, messages, max_tokens=8192, enable_thinking_bool=False, use_steering=True, **kwargs):
     return qwen3_32b_steering_generate(llm_instance, messages, max_tokens, enable_thinking_bool, use_steering=use_steering)
 
+
+async def _steering_generate_async(llm_instance, messages, max_tokens=8192, enable_thinking_bool=False, use_steering=True, **kwargs):
+    """Await the batching worker directly instead of parking a thread per request."""
+    if STEERING_COEFFICIENT is None:
+        raise ValueError(
+            "STEERING_COEFFICIENT must be set when using steering (e.g. via --steering_coefficient in iterate.py)"
+        )
+    worker = await asyncio.to_thread(_get_steering_worker)  # first call loads the model
+    coef = STEERING_COEFFICIENT if use_steering else 0.0
+    response = await worker.agenerate(messages, max_tokens, coef)
+    return None, response.strip()
+
+
+async def _steering_generate_group_async(llm_instance, list_of_messages, max_tokens=8192, use_steering=True, **kwargs):
+    """Generate chats that share a prompt prefix from one prefilled KV cache (see steering_worker)."""
+    if STEERING_COEFFICIENT is None:
+        raise ValueError(
+            "STEERING_COEFFICIENT must be set when using steering (e.g. via --steering_coefficient in iterate.py)"
+        )
+    worker = await asyncio.to_thread(_get_steering_worker)
+    coef = STEERING_COEFFICIENT if use_steering else 0.0
+    responses = await worker.agenerate_group(list_of_messages, max_tokens, coef)
+    return [(None, r.strip()) for r in responses]
+
 _gemma3_12b_sglang = partial(qwen_3_sglang_generate, model=GEMMA3_12B_SGLANG_API_MODEL)
 _qwen35_sglang = partial(qwen_3_sglang_generate, model="Qwen/Qwen3.5-35B-A3B")
 _glm4_sglang = partial(qwen_3_sglang_generate, model="zai-org/GLM-4-9B-0414")
@@ -339,6 +732,32 @@ generate_text_funcs = {
    "meta-llama/Llama-3.3-70B-Instruct": _steering_generate,
 }
 
+# Native async variants for SGLang-backed models; models missing here (steering) run
+# their generate_text_funcs entry in a worker thread from async_generate.
+async_generate_text_funcs = {
+   "Qwen/Qwen3-4B": partial(qwen_3_sglang_generate_async, model="Qwen/Qwen3-4B"),
+   "meta-llama/Meta-Llama-3-8B-Instruct": llama_3_8b_instruct_generate_async,
+   "Qwen/Qwen3-14B": partial(qwen_3_sglang_generate_async, model="Qwen/Qwen3-14B"),
+   GEMMA3_12B_SGLANG_MODEL_ID: partial(qwen_3_sglang_generate_async, model=GEMMA3_12B_SGLANG_API_MODEL),
+   LEGACY_QWEN3_06B_SGLANG_MODEL_ID: partial(qwen_3_sglang_generate_async, model=GEMMA3_12B_SGLANG_API_MODEL),
+   LEGACY_MISTRAL_SGLANG_MODEL_ID: partial(qwen_3_sglang_generate_async, model=GEMMA3_12B_SGLANG_API_MODEL),
+   "Qwen/Qwen3.5-35B-A3B": partial(qwen_3_sglang_generate_async, model="Qwen/Qwen3.5-35B-A3B"),
+   "zai-org/GLM-4-9B-0414": partial(qwen_3_sglang_generate_async, model="zai-org/GLM-4-9B-0414"),
+   "Qwen/Qwen3-32B": partial(qwen_3_sglang_generate_async, model="Qwen/Qwen3-32B"),
+}
+
+
+def sglang_request(model_name, messages, max_tokens=SGLANG_CHAT_MAX_TOKENS):
+    """(pool model, create_kwargs) that model_name's SGLang generate function sends for messages,
+    or None for models not served by SGLang (steering)."""
+    func = async_generate_text_funcs.get(model_name)
+    if func is None:
+        return None
+    if func is llama_3_8b_instruct_generate_async:
+        return LLAMA_SGLANG_MODEL, _llama_create_kwargs(messages, max_tokens)
+    model = func.keywords["model"]
+    return model, _qwen_create_kwargs(model, messages, max_tokens)
+
 
 def verify_sglang_model(model_name: str | None = None) -> bool:
     """Warn if MODEL_NAME is not in the SGLang server's /v1/models list."""
@@ -347,34 +766,136 @@ def verify_sglang_model(model_name: str | None = None) -> bool:
         return True
     if model_name in ("google/gemma-2-27b-it", "meta-llama/Llama-3.3-70B-Instruct"):
         return True  # steering path, not SGLang
-    _MODEL_PORTS = {"Qwen/Qwen3-14B": 30001, "zai-org/GLM-4-9B-0414": 30003}
-    port = _MODEL_PORTS.get(model_name, 30002)
-    try:
-        client = OpenAI(base_url=f"http://{SGLANG_HOST}:{port}/v1", api_key="EMPTY")
-        listed = [m.id for m in client.models.list().data]
-        if model_name not in listed:
+    ok = True
+    for replica in _sglang_pool(model_name).replicas:
+        base_url = replica.base_url
+        try:
+            client = get_sync_client(base_url)
+            listed = [m.id for m in client.models.list().data]
+            if model_name not in listed:
+                print(
+                    f"\n*** SGLang model mismatch ({base_url}) ***\n"
+                    f"  Requested: {model_name}\n"
+                    f"  Served:    {listed}\n"
+                    f"  Fix: use --model {listed[0]!r} or start SGLang with the requested model.\n"
+                    f"  Empty responses / parse errors will occur until this is fixed.\n"
+                )
+                ok = False
+        except Exception as e:
             print(
-                f"\n*** SGLang model mismatch (port {port}) ***\n"
-                f"  Requested: {model_name}\n"
-                f"  Served:    {listed}\n"
-                f"  Fix: use --model {listed[0]!r} or start SGLang with the requested model.\n"
-                f"  Empty responses / parse errors will occur until this is fixed.\n"
+                f"\n*** Cannot reach SGLang at {base_url} ***\n"
+                f"  {e}\n"
+                f"  Start the server before running iterate.py.\n"
             )
-            return False
-    except Exception as e:
-        print(
-            f"\n*** Cannot reach SGLang at {SGLANG_HOST}:{port} ***\n"
-            f"  {e}\n"
-            f"  Start the server before running iterate.py.\n"
-        )
-        return False
-    return True
+            ok = False
+    return ok
 
 
 async def async_generate(llm_instance, chat_input, **kwargs):
-    """Async wrapper: runs the model-appropriate generate function in a thread pool."""
+    """Await the model's native async generate function (SGLang models); in-process
+    models without one (steering) fall back to a thread pool."""
+    telemetry.mark_queued()
+    async_func = async_generate_text_funcs.get(MODEL_NAME)
+    if async_func is not None:
+        if PREFIX_SCHEDULER is not None:
+            return await PREFIX_SCHEDULER.run(
+                prefix_key(chat_input), lambda: async_func(llm_instance, chat_input, **kwargs)
+            )
+        return await async_func(llm_instance, chat_input, **kwargs)
     func = generate_text_funcs[MODEL_NAME]
-    return await asyncio.to_thread(func, llm_instance, chat_input, **kwargs)
+    with telemetry.track(kwargs.get("stage"), MODEL_NAME):
+        telemetry.on_send("local")
+        if func is _steering_generate and _steering_uses_worker():
+            return await _steering_generate_async(llm_instance, chat_input, **kwargs)
+        return await asyncio.to_thread(func, llm_instance, chat_input, **kwargs)
+
+
+def endpoint_capacity(model=None):
+    """Current total request cap over model's replicas (adaptive concurrency)."""
+    pool = _sglang_pool(model or MODEL_NAME)
+    return adaptive_concurrency.total_limit([r.base_url for r in pool.replicas])
+
+
+def stage_capacity(model):
+    """Limit of a pipeline stage run on model (tools/stage_pipeline.py), as a callable.
+
+    With adaptive concurrency an SGLang stage follows its model's AIMD caps (times
+    QUESTION_HEADROOM, as question_semaphore does); otherwise MAX_CONCURRENT.
+    """
+    if model is not None and adaptive_concurrency.is_enabled() and model in async_generate_text_funcs:
+        return lambda: QUESTION_HEADROOM * endpoint_capacity(model)
+    limit = MAX_CONCURRENT
+    return lambda: limit
+
+
+def question_semaphore():
+    """Gate on questions in progress for the runners.
+
+    Static MAX_CONCURRENT normally; with adaptive concurrency on an SGLang model the
+    capacity follows the endpoints' AIMD caps (times QUESTION_HEADROOM, so each
+    endpoint has queued work to saturate its cap with).
+    """
+    if adaptive_concurrency.is_enabled() and MODEL_NAME in async_generate_text_funcs:
+        return adaptive_concurrency.AdaptiveSemaphore(lambda: QUESTION_HEADROOM * endpoint_capacity())
+    return asyncio.Semaphore(MAX_CONCURRENT)
+
+
+async def generate_batch(llm_instance, list_of_messages, check=None, **kwargs):
+    """Send a group of prompts together as one coordinated concurrent burst.
+
+    All requests are issued at once (so prompts sharing a system persona reach SGLang
+    together and batch server-side) and awaited as a group. Returns the
+    (thinking_content, response) tuples in the same order as list_of_messages.
+    On the local steering model with STEERING_SHARED_PREFIX the group is generated
+    from one shared prefix KV cache instead.
+
+    With check, each output is passed to check(index, output) as soon as it arrives and
+    the check results are returned (same order) instead. All-or-nothing groups such as
+    a Hard set's four options return None from check on a failure: generate_batch then
+    returns None at once and cancels the requests still running.
+    """
+    if (
+        STEERING_SHARED_PREFIX
+        and len(list_of_messages) > 1
+        and generate_text_funcs.get(MODEL_NAME) is _steering_generate
+    ):
+        with telemetry.track(kwargs.get("stage"), MODEL_NAME):
+            telemetry.on_send("local")
+            outputs = await _steering_generate_group_async(llm_instance, list_of_messages, **kwargs)
+        if check is None:
+            return outputs
+        results = []
+        for j, output in enumerate(outputs):
+            results.append(check(j, output))
+            if results[-1] is None:
+                return None
+        return results
+    if check is not None:
+        return await _generate_checked(llm_instance, list_of_messages, check, **kwargs)
+    return list(await asyncio.gather(
+        *(async_generate(llm_instance, messages, **kwargs) for messages in list_of_messages)
+    ))
+
+
+async def _generate_checked(llm_instance, list_of_messages, check, **kwargs):
+    tasks = [asyncio.ensure_future(async_generate(llm_instance, messages, **kwargs)) for messages in list_of_messages]
+    index = {task: j for j, task in enumerate(tasks)}
+    results = [None] * len(tasks)
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in sorted(done, key=index.get):
+                j = index[task]
+                results[j] = check(j, task.result())
+                if results[j] is None:
+                    return None
+        return results
+    finally:
+        # siblings of a failed output (or of a cancelled caller) are not worth finishing
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
 
 
 def get_llm():
@@ -401,9 +922,16 @@ def get_llm():
 def cleanup():
     """Clean up GPU memory by deleting the LLM instance and steering model if loaded."""
     global llm, _steering_model, _steering_tokenizer, _steering_axis, _steering_config, _steering_model_name
+    global _steering_worker
+    close_clients()
+    if _steering_worker is not None:
+        _steering_worker.print_stats()
+        _steering_worker.stop()
+        _steering_worker = None
     if _steering_model is not None:
         print(f"Cleaning up steering model ({_steering_model_name})...")
         try:
+            import torch
             if torch.cuda.is_available():
                 torch.cuda.empty_cache()
             del _steering_model
@@ -422,6 +950,7 @@ def cleanup():
     if llm is not None:
         print("Cleaning up GPU memory for LLM instance...")
         try:
+            import torch
             if torch.cuda.is_available():
                 torch.cuda.empty_cache()
                 print("CUDA cache cleared")
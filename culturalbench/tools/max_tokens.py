@@ -0,0 +1,97 @@
+"""Adaptive per-stage max_tokens: the stage's output-length percentile times a margin, never above the
+caller's cap; a response cut by the reduced cap is sent again once with the full cap."""
+
+import math
+import threading
+from collections import deque
+
+DEFAULT_PERCENTILE = 99
+DEFAULT_MARGIN = 1.25
+MIN_SAMPLES = 50
+MIN_CAP = 32
+WINDOW = 2000
+
+
+class MaxTokensPolicy:
+    """Per-(model, stage) output-length windows and the max_tokens derived from them."""
+
+    def __init__(self, percentile=DEFAULT_PERCENTILE, margin=DEFAULT_MARGIN, min_samples=MIN_SAMPLES):
+        self.percentile = percentile
+        self.margin = margin
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._lengths = {}  # (model, stage) -> deque of completion token counts
+        self.stats = {}
+
+    def _key_stats(self, key):
+        return self.stats.setdefault(key, {"requests": 0, "capped": 0, "truncated": 0, "tokens_saved": 0})
+
+    def limit(self, model, stage):
+        """Adaptive max_tokens for (model, stage), or None while there are too few samples."""
+        with self._lock:
+            window = self._lengths.get((model, stage))
+            if window is None or len(window) < self.min_samples:
+                return None
+            values = sorted(window)
+        k = min(len(values) - 1, int(len(values) * self.percentile / 100))
+        return max(MIN_CAP, math.ceil(values[k] * self.margin))
+
+    def cap(self, model, stage, full_cap):
+        """max_tokens to send for a request of stage whose caller asked for full_cap
+        (None: no cap, e.g. refine; the learned limit then applies without a ceiling)."""
+        if stage is None:
+            return full_cap
+        limit = self.limit(model, stage)
+        with self._lock:
+            s = self._key_stats((model, stage))
+            s["requests"] += 1
+            if limit is None or (full_cap is not None and limit >= full_cap):
+                return full_cap
+            s["capped"] += 1
+            if full_cap is not None:
+                s["tokens_saved"] += full_cap - limit
+        return limit
+
+    def observe(self, model, stage, completion_tokens):
+        """Record the length of a response that was not cut by an adaptive cap."""
+        if stage is None or completion_tokens is None:
+            return
+        with self._lock:
+            self._lengths.setdefault((model, stage), deque(maxlen=WINDOW)).append(completion_tokens)
+
+    def on_truncated(self, model, stage):
+        with self._lock:
+            self._key_stats((model, stage))["truncated"] += 1
+
+    def seed(self, lengths):
+        """Prime the windows from {(model, stage): [completion_tokens, ...]} (telemetry.output_lengths)."""
+        n = 0
+        with self._lock:
+            for key, values in lengths.items():
+                if key[1] is None:
+                    continue
+                self._lengths.setdefault(key, deque(maxlen=WINDOW)).extend(values)
+                n += len(values)
+        return n
+
+    def get_stats(self):
+        out = {}
+        with self._lock:
+            items = {k: dict(v) for k, v in self.stats.items()}
+        for (model, stage), s in items.items():
+            s["max_tokens"] = self.limit(model, stage)
+            s["truncation_rate"] = round(s["truncated"] / s["capped"], 4) if s["capped"] else 0.0
+            out[f"{model}:{stage}"] = s
+        return out
+
+    def print_stats(self):
+        stats = self.get_stats()
+        if not stats:
+            return
+        print(f"\n=== Adaptive max_tokens (p{self.percentile} x {self.margin}) ===")
+        for key, s in stats.items():
+            print(
+                f"  {key}: requests={s['requests']} capped={s['capped']} max_tokens={s['max_tokens']} "
+                f"truncated={s['truncated']} ({s['truncation_rate']:.2%} retried at full cap) "
+                f"reserved_tokens_saved={s['tokens_saved']}"
+            )
@@ -1,5 +1,5 @@
 """Long-term memory for cross-question persona refinement (eng mode)."""
 
-from .memory_store import MemoryStore, get_memory_store
+from .memory_store import MemoryStore, get_memory_store, warm_embedder
 
-__all__ = ["MemoryStore", "get_memory_store"]
+__all__ = ["MemoryStore", "get_memory_store", "warm_embedder"]
@@ -5,6 +5,7 @@ from __future__ import annotations
 import asyncio
 import os
 import re
+import threading
 from typing import Any, Dict, List, Optional
 
 from tools.db.db_utils import load_results
@@ -24,6 +25,8 @@ _STORE_CACHE: Dict[str, "MemoryStore"] = {}
 RETRIEVAL_CANDIDATE_MULTIPLIER = 10
 TOP_K = 5
 _PRINT_LOCK: Optional[asyncio.Lock] = None
+_embedding_function = None
+_embedding_lock = threading.Lock()
 
 
 def memory_dir_from_db(db_path: str) -> str:
@@ -37,10 +40,20 @@ def _sanitize_collection_name(name: str) -> str:
 
 
 def _get_embedding_function():
-    """Chroma default ONNX embedder (all-MiniLM-L6-v2) — no sentence-transformers import."""
-    from chromadb.utils import embedding_functions
+    """Chroma default ONNX embedder (all-MiniLM-L6-v2) — no sentence-transformers import.
+    One instance per process, so the ONNX model is loaded once for all stores."""
+    global _embedding_function
+    with _embedding_lock:
+        if _embedding_function is None:
+            from chromadb.utils import embedding_functions
 
-    return embedding_functions.DefaultEmbeddingFunction()
+            _embedding_function = embedding_functions.DefaultEmbeddingFunction()
+    return _embedding_function
+
+
+def warm_embedder() -> None:
+    """Load the embedder's ONNX model now instead of at the first memory lookup."""
+    _get_embedding_function()(["warm-up"])
 
 
 class MemoryStore:
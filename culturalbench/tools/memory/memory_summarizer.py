@@ -10,6 +10,7 @@ from typing import Any, Dict, List, Optional
 
 from tools import llm_utils
 from tools.llm_utils import async_generate, get_llm
+from tools import batch_jobs
 
 MEMORY_SUMMARIZE_SYSTEM = """
 You write compact memory summaries for a cultural persona refinement system.
@@ -97,7 +98,7 @@ async def _summarize_chat(system: str, user: str, sem: asyncio.Semaphore) -> str
             {"role": "user", "content": user},
         ]
         _, response = await async_generate(
-            llm, messages, use_steering=False, max_tokens=512
+            llm, messages, use_steering=False, max_tokens=512, stage="summary"
         )
         return (response or "").strip()
 
@@ -119,7 +120,7 @@ async def ensure_memory_summaries(
     on_progress: Optional[Any] = None,
 ) -> List[Dict[str, Any]]:
     """Attach ``summary`` to each record; use cache and LLM for misses."""
-    sem = asyncio.Semaphore(llm_utils.MAX_CONCURRENT)
+    sem = llm_utils.question_semaphore()
     pending: List[Dict[str, Any]] = []
 
     for rec in records:
@@ -144,11 +145,12 @@ async def ensure_memory_summaries(
             rec["summary"] = summary
             return rec
 
-        tasks = [one(rec) for rec in pending]
-        done = 0
+        tasks = [batch_jobs.deferrable(one(rec)) for rec in pending]
+        done = deferred = 0
         total = len(pending)
         for coro in asyncio.as_completed(tasks):
-            await coro
+            if await coro is batch_jobs.DEFERRED:
+                deferred += 1
             done += 1
             if done == total or done == 1 or done % max(1, total // 5) == 0:
                 print(f"  Summarized {done}/{total} memories...", flush=True)
@@ -156,6 +158,7 @@ async def ensure_memory_summaries(
                 on_progress(done, total)
 
         cache.flush()
+        batch_jobs.raise_if_deferred(deferred, "memory summaries")
         print(f"Finished summarizing {total} memories.", flush=True)
 
     return records
@@ -0,0 +1,151 @@
+"""Prefix-cache-aware request scheduler for SGLang: caps requests in flight and dispatches
+waiters of the last prefix group first (up to a burst cap), plus cached-token usage stats."""
+
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict, deque
+
+MAX_GROUP_BURST = 32
+
+_usage_lock = threading.Lock()
+_usage = {"requests": 0, "reported": 0, "prompt_tokens": 0, "cached_tokens": 0}
+
+
+def prefix_key(messages):
+    """Group key for a chat request: its system message, else the head of the first message."""
+    if not messages:
+        return ""
+    first = messages[0]
+    content = first.get("content", "") if isinstance(first, dict) else first
+    if not isinstance(content, str):
+        content = str(content)
+    if not (isinstance(first, dict) and first.get("role") == "system"):
+        content = content[:512]
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+class PrefixScheduler:
+    """Caps in-flight requests and dispatches waiters grouped by prefix key.
+
+    max_in_flight is an int, or a callable re-read on every dispatch (adaptive
+    concurrency passes the endpoints' current total cap).
+    """
+
+    def __init__(self, max_in_flight, max_group_burst=MAX_GROUP_BURST):
+        self.max_in_flight = max_in_flight if callable(max_in_flight) else max(1, max_in_flight)
+        self.max_group_burst = max_group_burst
+        self._waiting = OrderedDict()  # prefix key -> deque[Future]
+        self._in_flight = 0
+        self._last_key = None
+        self._burst = 0
+        self.stats = {"dispatched": 0, "queued": 0, "same_prefix_dispatches": 0, "group_switches": 0}
+
+    async def run(self, key, coro_fn):
+        """Await coro_fn() once a slot is granted to this request's prefix group."""
+        await self._acquire(key)
+        try:
+            return await coro_fn()
+        finally:
+            self._release()
+
+    def _capacity(self):
+        if callable(self.max_in_flight):
+            return max(1, int(self.max_in_flight()))
+        return self.max_in_flight
+
+    def _grant(self, key):
+        self._in_flight += 1
+        self.stats["dispatched"] += 1
+        if key == self._last_key:
+            self._burst += 1
+            self.stats["same_prefix_dispatches"] += 1
+        else:
+            if self._last_key is not None:
+                self.stats["group_switches"] += 1
+            self._last_key = key
+            self._burst = 1
+
+    async def _acquire(self, key):
+        if self._in_flight < self._capacity() and not self._waiting:
+            self._grant(key)
+            return
+        fut = asyncio.get_running_loop().create_future()
+        self._waiting.setdefault(key, deque()).append(fut)
+        self.stats["queued"] += 1
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # slot was granted right before cancellation; hand it back
+                self._release()
+            else:
+                queue = self._waiting.get(key)
+                if queue is not None and fut in queue:
+                    queue.remove(fut)
+                    if not queue:
+                        del self._waiting[key]
+            raise
+
+    def _next_key(self):
+        if self._last_key in self._waiting and self._burst < self.max_group_burst:
+            return self._last_key
+        for key in self._waiting:
+            if key != self._last_key:
+                return key
+        return next(iter(self._waiting))
+
+    def _release(self):
+        self._in_flight -= 1
+        while self._in_flight < self._capacity() and self._waiting:
+            key = self._next_key()
+            queue = self._waiting[key]
+            fut = queue.popleft()
+            if not queue:
+                del self._waiting[key]
+            if fut.done():
+                continue
+            self._grant(key)
+            fut.set_result(None)
+
+
+def record_usage(usage):
+    """Accumulate prompt/cached token counts from an OpenAI-style usage object."""
+    with _usage_lock:
+        _usage["requests"] += 1
+        if usage is None:
+            return
+        _usage["prompt_tokens"] += getattr(usage, "prompt_tokens", 0) or 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = getattr(details, "cached_tokens", None) if details is not None else None
+        if cached is not None:
+            _usage["reported"] += 1
+            _usage["cached_tokens"] += cached
+
+
+def get_prefix_cache_stats():
+    with _usage_lock:
+        out = dict(_usage)
+    out["cached_ratio"] = (
+        round(out["cached_tokens"] / out["prompt_tokens"], 4) if out["prompt_tokens"] else 0.0
+    )
+    return out
+
+
+def print_prefix_cache_stats(scheduler=None):
+    s = get_prefix_cache_stats()
+    if not s["requests"]:
+        return
+    line = (
+        f"  prefix cache: cached_tokens={s['cached_tokens']} / prompt_tokens={s['prompt_tokens']} "
+        f"({s['cached_ratio']:.2%})"
+    )
+    if not s["reported"]:
+        line += " [server did not report cached tokens; start SGLang with --enable-cache-report]"
+    print(line)
+    if scheduler is not None:
+        st = scheduler.stats
+        print(
+            f"  prefix scheduler: dispatched={st['dispatched']} queued={st['queued']} "
+            f"same_prefix={st['same_prefix_dispatches']} group_switches={st['group_switches']}"
+        )
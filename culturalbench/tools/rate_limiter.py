@@ -0,0 +1,308 @@
+"""Per-endpoint token bucket, jittered backoff by error class and circuit breaker for LLM calls.
+Kept free of openai/httpx imports so BLEnD can share it."""
+
+import asyncio
+import os
+import random
+import threading
+import time
+
+SGLANG_RATE_LIMIT_RPS = float(os.environ.get("SGLANG_RATE_LIMIT_RPS", "100"))
+SGLANG_RATE_LIMIT_BURST = float(os.environ.get("SGLANG_RATE_LIMIT_BURST", "100"))
+MIN_RATE_RPS = 1.0
+RATE_RECOVERY_STEP = 0.5  # requests/sec regained per success after a throttle
+
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_COOLDOWN_SEC = 30.0
+
+MAX_TRIES = 10
+
+# error class -> (base delay, max delay, retryable)
+BACKOFF_POLICY = {
+    "connection": (1.0, 15.0, True),
+    "timeout": (2.0, 30.0, True),
+    "server": (1.0, 20.0, True),
+    "throttled": (2.0, 30.0, True),
+    "client": (0.0, 0.0, False),
+    "other": (1.0, 10.0, True),
+}
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised when a request is rejected because the endpoint's circuit is open."""
+
+
+def classify_error(exc):
+    """Map an exception from the OpenAI SDK / httpx / requests to an error class."""
+    name = type(exc).__name__
+    if isinstance(exc, (asyncio.TimeoutError, TimeoutError)) or "Timeout" in name:
+        return "timeout"
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    if status == 429 or status == 503:
+        return "throttled"
+    if status is not None and status >= 500:
+        return "server"
+    if status is not None and 400 <= status < 500:
+        return "client"
+    if isinstance(exc, ConnectionError) or "Connect" in name:
+        return "connection"
+    return "other"
+
+
+def backoff_delay(error_class, attempt):
+    """Full-jitter exponential backoff for the given error class and 0-based attempt."""
+    base, cap, _ = BACKOFF_POLICY[error_class]
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class TokenBucket:
+    """Token bucket with reservation semantics (caller sleeps for the returned delay)."""
+
+    def __init__(self, rate, burst):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def reserve(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+    def throttle(self):
+        self.rate = max(MIN_RATE_RPS, self.rate / 2)
+
+    def recover(self):
+        if self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate + RATE_RECOVERY_STEP)
+
+
+class EndpointLimiter:
+    """Rate limiter + circuit breaker + counters for one endpoint."""
+
+    def __init__(self, endpoint, rate=None, burst=None):
+        self.endpoint = endpoint
+        self.bucket = TokenBucket(rate or SGLANG_RATE_LIMIT_RPS, burst or SGLANG_RATE_LIMIT_BURST)
+        self._lock = threading.Lock()
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.half_open_probe = False
+        self.stats = {
+            "requests": 0,
+            "successes": 0,
+            "retries": 0,
+            "failures": 0,
+            "throttled": 0,
+            "throttle_wait_sec": 0.0,
+            "circuit_rejections": 0,
+            "circuit_opens": 0,
+        }
+        self.errors_by_class = {k: 0 for k in BACKOFF_POLICY}
+
+    def _admit(self):
+        """Check the circuit and take a token; returns (seconds to wait before sending,
+        whether this request is the half-open probe)."""
+        with self._lock:
+            now = time.monotonic()
+            probe = False
+            if self.open_until:
+                if now < self.open_until or self.half_open_probe:
+                    self.stats["circuit_rejections"] += 1
+                    raise CircuitOpenError(f"circuit open for {self.endpoint}")
+                # cooldown elapsed: let a single probe through (half-open)
+                self.half_open_probe = probe = True
+            self.stats["requests"] += 1
+            wait = self.bucket.reserve()
+            if wait > 0:
+                self.stats["throttled"] += 1
+                self.stats["throttle_wait_sec"] += wait
+            return wait, probe
+
+    def acquire(self):
+        """Wait for admission; returns whether this request is the half-open probe."""
+        wait, probe = self._admit()
+        if wait > 0:
+            time.sleep(wait)
+        return probe
+
+    async def acquire_async(self):
+        """Async acquire; a probe cancelled while waiting for its token is released."""
+        wait, probe = self._admit()
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            except BaseException:
+                if probe:
+                    self.release_probe()
+                raise
+        return probe
+
+    def release_probe(self):
+        """The half-open probe ended without an outcome (cancelled, interrupted): let the next request probe."""
+        with self._lock:
+            self.half_open_probe = False
+
+    def on_success(self):
+        with self._lock:
+            self.stats["successes"] += 1
+            self.consecutive_failures = 0
+            self.open_until = 0.0
+            self.half_open_probe = False
+            self.bucket.recover()
+
+    def on_failure(self, exc, attempt, max_tries=MAX_TRIES):
+        """Record a failure; returns (error_class, delay) or (error_class, None) to give up."""
+        error_class = classify_error(exc)
+        with self._lock:
+            self.errors_by_class[error_class] += 1
+            if error_class == "throttled":
+                self.bucket.throttle()
+            if error_class == "connection" or self.half_open_probe:
+                self.consecutive_failures += 1
+                if self.half_open_probe or self.consecutive_failures >= CIRCUIT_FAILURE_THRESHOLD:
+                    self.open_until = time.monotonic() + CIRCUIT_COOLDOWN_SEC
+                    self.half_open_probe = False
+                    self.stats["circuit_opens"] += 1
+            retryable = BACKOFF_POLICY[error_class][2] and not self.open_until
+            if not retryable or attempt + 1 >= max_tries:
+                self.stats["failures"] += 1
+                return error_class, None
+            self.stats["retries"] += 1
+        return error_class, backoff_delay(error_class, attempt)
+
+    def give_up(self):
+        with self._lock:
+            self.stats["failures"] += 1
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(endpoint):
+    """Return the shared EndpointLimiter for endpoint (a base URL)."""
+    limiter = _limiters.get(endpoint)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.setdefault(endpoint, EndpointLimiter(endpoint))
+    return limiter
+
+
+def _past_deadline(deadline, delay=0.0):
+    """True if deadline (time.monotonic() based, or None) falls before now + delay."""
+    return deadline is not None and time.monotonic() + delay >= deadline
+
+
+def call_with_retries(endpoint, fn, label="", max_tries=MAX_TRIES, deadline=None):
+    """Call fn() under endpoint's limiter with classified, jittered retries. Returns None on failure.
+
+    With a deadline (time.monotonic() based) no attempt or backoff sleep starts past it.
+    """
+    limiter = get_limiter(endpoint)
+    for attempt in range(max_tries):
+        if _past_deadline(deadline):
+            print(f"{label}Deadline reached on {endpoint}; giving up")
+            limiter.give_up()
+            return None
+        try:
+            probe = limiter.acquire()
+        except CircuitOpenError as e:
+            print(f"{label}{e}; failing fast")
+            limiter.give_up()
+            return None
+        try:
+            result = fn()
+        except Exception as e:
+            error_class, delay = limiter.on_failure(e, attempt, max_tries)
+            print(f"{label}Exception ({error_class}) on {endpoint}: {e}")
+            if delay is None:
+                return None
+            if _past_deadline(deadline, delay):
+                print(f"{label}Deadline reached on {endpoint}; not retrying")
+                limiter.give_up()
+                return None
+            print(f"{label}Retrying in {delay:.1f}s (attempt {attempt + 2}/{max_tries})...")
+            time.sleep(delay)
+            continue
+        except BaseException:
+            # interrupted: a probe without an outcome must not keep the circuit half-open
+            if probe:
+                limiter.release_probe()
+            raise
+        limiter.on_success()
+        return result
+    return None
+
+
+async def acall_with_retries(endpoint, coro_fn, label="", max_tries=MAX_TRIES, deadline=None):
+    """Async call_with_retries: awaits coro_fn() under endpoint's limiter. Returns None on failure."""
+    limiter = get_limiter(endpoint)
+    for attempt in range(max_tries):
+        if _past_deadline(deadline):
+            print(f"{label}Deadline reached on {endpoint}; giving up")
+            limiter.give_up()
+            return None
+        try:
+            probe = await limiter.acquire_async()
+        except CircuitOpenError as e:
+            print(f"{label}{e}; failing fast")
+            limiter.give_up()
+            return None
+        try:
+            result = await coro_fn()
+        except Exception as e:
+            error_class, delay = limiter.on_failure(e, attempt, max_tries)
+            print(f"{label}Exception ({error_class}) on {endpoint}: {e}")
+            if delay is None:
+                return None
+            if _past_deadline(deadline, delay):
+                print(f"{label}Deadline reached on {endpoint}; not retrying")
+                limiter.give_up()
+                return None
+            print(f"{label}Retrying in {delay:.1f}s (attempt {attempt + 2}/{max_tries})...")
+            await asyncio.sleep(delay)
+            continue
+        except BaseException:
+            # hedging, deadlines and sibling cancellation cancel calls mid-flight; a cancelled
+            # probe has no outcome, so it must not keep the circuit half-open forever
+            if probe:
+                limiter.release_probe()
+            raise
+        limiter.on_success()
+        return result
+    return None
+
+
+def get_limiter_stats():
+    """Snapshot of counters per endpoint: {endpoint: {..., "errors": {class: n}}}."""
+    out = {}
+    for endpoint, limiter in list(_limiters.items()):
+        with limiter._lock:
+            out[endpoint] = {
+                **limiter.stats,
+                "current_rate_rps": limiter.bucket.rate,
+                "errors": dict(limiter.errors_by_class),
+            }
+    return out
+
+
+def print_limiter_stats():
+    stats = get_limiter_stats()
+    if not stats:
+        return
+    print("\n=== LLM endpoint stats ===")
+    for endpoint, s in stats.items():
+        errors = ", ".join(f"{k}={v}" for k, v in s["errors"].items() if v)
+        print(
+            f"  {endpoint}: requests={s['requests']} ok={s['successes']} retries={s['retries']} "
+            f"failed={s['failures']} throttled={s['throttled']} ({s['throttle_wait_sec']:.1f}s) "
+            f"circuit_opens={s['circuit_opens']} rejected={s['circuit_rejections']}"
+            + (f" errors[{errors}]" if errors else "")
+        )
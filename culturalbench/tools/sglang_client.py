@@ -0,0 +1,91 @@
+"""Pooled OpenAI-compatible clients for SGLang servers, one per base URL; async clients are bound
+to the event loop that created them and rebuilt when a new loop starts."""
+
+import asyncio
+import os
+import threading
+
+import httpx
+from openai import AsyncOpenAI, OpenAI
+
+SGLANG_POOL_MAX_CONNECTIONS = int(os.environ.get("SGLANG_POOL_MAX_CONNECTIONS", "256"))
+SGLANG_POOL_MAX_KEEPALIVE = int(os.environ.get("SGLANG_POOL_MAX_KEEPALIVE", "64"))
+SGLANG_REQUEST_TIMEOUT = float(os.environ.get("SGLANG_REQUEST_TIMEOUT", "600"))
+
+# base_url -> (loop, AsyncOpenAI)
+_async_clients = {}
+# base_url -> OpenAI
+_sync_clients = {}
+_sync_lock = threading.Lock()
+
+
+def sglang_base_url(host, port):
+    """OpenAI-compatible base URL for an SGLang server."""
+    return f"http://{host}:{port}/v1"
+
+
+def _limits():
+    return httpx.Limits(
+        max_connections=SGLANG_POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=SGLANG_POOL_MAX_KEEPALIVE,
+    )
+
+
+def get_async_client(base_url):
+    """Return the pooled AsyncOpenAI client for base_url (must be called inside a running loop).
+
+    max_retries=0: retries are handled by the callers in llm_utils so that the
+    SDK does not add hidden attempts on top of them.
+    """
+    loop = asyncio.get_running_loop()
+    entry = _async_clients.get(base_url)
+    if entry is not None and entry[0] is loop:
+        return entry[1]
+    http_client = httpx.AsyncClient(limits=_limits(), timeout=SGLANG_REQUEST_TIMEOUT)
+    client = AsyncOpenAI(
+        base_url=base_url,
+        api_key="EMPTY",
+        http_client=http_client,
+        max_retries=0,
+    )
+    _async_clients[base_url] = (loop, client)
+    return client
+
+
+def get_sync_client(base_url):
+    """Return the pooled (thread-safe) OpenAI client for base_url."""
+    client = _sync_clients.get(base_url)
+    if client is not None:
+        return client
+    with _sync_lock:
+        client = _sync_clients.get(base_url)
+        if client is None:
+            http_client = httpx.Client(limits=_limits(), timeout=SGLANG_REQUEST_TIMEOUT)
+            client = OpenAI(
+                base_url=base_url,
+                api_key="EMPTY",
+                http_client=http_client,
+                max_retries=0,
+            )
+            _sync_clients[base_url] = client
+    return client
+
+
+async def aclose_clients():
+    """Close async clients owned by the current loop (call before the loop shuts down)."""
+    loop = asyncio.get_running_loop()
+    for base_url, (owner, client) in list(_async_clients.items()):
+        if owner is loop:
+            await client.close()
+            del _async_clients[base_url]
+
+
+def close_clients():
+    """Close pooled sync clients and drop async clients whose loop has gone away."""
+    with _sync_lock:
+        for client in _sync_clients.values():
+            client.close()
+        _sync_clients.clear()
+    for base_url, (owner, _) in list(_async_clients.items()):
+        if owner.is_closed():
+            del _async_clients[base_url]
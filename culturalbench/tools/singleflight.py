@@ -0,0 +1,75 @@
+"""Singleflight: identical in-flight LLM requests share one upstream task, cancelled only when every waiter is.
+Only reproducible requests coalesce: greedy decoding, or any request while the LLM cache is on."""
+
+import asyncio
+import threading
+
+from . import llm_cache
+
+_lock = threading.Lock()
+_stats = {"leaders": 0, "coalesced": 0}
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Per-event-loop table of in-flight requests keyed by request hash."""
+
+    def __init__(self):
+        self._flights = {}
+
+    async def do(self, key, coro_fn):
+        """Await coro_fn() once per key at a time; returns (result, coalesced)."""
+        flight = self._flights.get(key)
+        coalesced = flight is not None
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(coro_fn()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _t, k=key, f=flight: self._done(k, f))
+        with _lock:
+            _stats["coalesced" if coalesced else "leaders"] += 1
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task), coalesced
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                flight.task.cancel()  # nobody is waiting for the answer any more
+
+    def _done(self, key, flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+
+def is_deterministic(create_kwargs):
+    """True when identical requests may share one response."""
+    return create_kwargs.get("temperature") == 0 or llm_cache.get_cache() is not None
+
+
+def request_key(create_kwargs, stop_field=None):
+    key = llm_cache.LLMCache.make_key(create_kwargs)
+    return f"{key}:{stop_field}" if stop_field else key
+
+
+def get_stats():
+    with _lock:
+        out = dict(_stats)
+    total = out["leaders"] + out["coalesced"]
+    out["coalesced_rate"] = round(out["coalesced"] / total, 4) if total else 0.0
+    return out
+
+
+def print_stats():
+    s = get_stats()
+    if not s["coalesced"] and not s["leaders"]:
+        return
+    print(
+        f"  singleflight: upstream={s['leaders']} coalesced={s['coalesced']} "
+        f"({s['coalesced_rate']:.2%} of eligible requests)"
+    )
@@ -0,0 +1,137 @@
+"""Stage-pipelined iterations: a concurrency limit per (stage, model) instead of per question, so a
+question holds a slot only while it is in a stage and each model's pool is saturated on its own."""
+
+import contextlib
+import time
+
+from .adaptive_concurrency import AdaptiveSemaphore
+
+STAGES = ("feedback", "memory", "refine", "translate", "answer")
+
+_limits = None  # stage -> explicit limit; None = pipeline disabled
+_default_capacity = None  # model -> callable returning the current limit of a stage without one
+_stats = {}  # "stage" or "stage:model" -> counters, accumulated over iterations
+
+
+def parse_limits(spec):
+    """Parse "feedback=16,answer=64" into {stage: limit} (empty spec = all defaults)."""
+    limits = {}
+    for part in (spec or "").split(","):
+        if not part.strip():
+            continue
+        name, _, value = part.partition("=")
+        name = name.strip()
+        if name not in STAGES or not value.strip().isdigit() or int(value) < 1:
+            raise ValueError(f"bad stage limit {part!r}: expected <stage>=<n> with stage in {', '.join(STAGES)}")
+        limits[name] = int(value)
+    return limits
+
+
+def configure(limits, default_capacity):
+    """Run iterations as a stage pipeline with these per-stage limits ({} = defaults).
+
+    default_capacity(model) returns a callable giving the current limit of a stage without an
+    explicit one (llm_utils.stage_capacity follows adaptive concurrency's caps)."""
+    global _limits, _default_capacity
+    _limits = dict(limits or {})
+    _default_capacity = default_capacity
+    _stats.clear()
+    shown = ", ".join(f"{k}={v}" for k, v in _limits.items()) or "defaults"
+    print(f"Stage pipeline: per-stage concurrency ({shown})")
+
+
+def is_enabled():
+    return _limits is not None
+
+
+def _capacity_fn(stage, model):
+    if stage in _limits:
+        limit = _limits[stage]
+        return lambda: limit
+    return _default_capacity(model)
+
+
+def _stats_key(stage, model):
+    return f"{stage}:{model}" if model else stage
+
+
+class StagePipeline:
+    """Gates for one iteration: question() admits a question, stage(name) holds a slot of name's pool.
+
+    Disabled (no stages), question() is question_gate() and stage() is a no-op, i.e. the chain
+    holds one slot throughout as before."""
+
+    def __init__(self, stages=None, question_gate=None):
+        self._gates = {}
+        if not stages:
+            self._admission = question_gate()
+            return
+        capacity_fns = []
+        for stage, model in stages.items():
+            fn = _capacity_fn(stage, model)
+            capacity_fns.append(fn)
+            key = _stats_key(stage, model)
+            _stats.setdefault(key, {
+                "entered": 0, "waited": 0, "wait_sec": 0.0, "max_wait_sec": 0.0,
+                "busy_sec": 0.0, "in_stage": 0, "peak": 0,
+            })
+            self._gates[stage] = (AdaptiveSemaphore(fn), _stats[key])
+        self._admission = AdaptiveSemaphore(lambda: sum(fn() for fn in capacity_fns))
+
+    def question(self):
+        return self._admission
+
+    @contextlib.asynccontextmanager
+    async def stage(self, name):
+        gate = self._gates.get(name)
+        if gate is None:
+            yield
+            return
+        sem, s = gate
+        start = time.monotonic()
+        await sem.acquire()
+        entered = time.monotonic()
+        waited = entered - start
+        s["entered"] += 1
+        if waited > 0.001:
+            s["waited"] += 1
+            s["wait_sec"] += waited
+            s["max_wait_sec"] = max(s["max_wait_sec"], waited)
+        s["in_stage"] += 1
+        s["peak"] = max(s["peak"], s["in_stage"])
+        try:
+            yield
+        finally:
+            s["in_stage"] -= 1
+            s["busy_sec"] += time.monotonic() - entered
+            sem.release()
+
+
+def for_iteration(stages, question_gate):
+    """StagePipeline for an iteration using stages ({stage: model or None}); question_gate() when disabled."""
+    return StagePipeline(stages if _limits is not None else None, question_gate)
+
+
+def get_stats():
+    out = {}
+    for key, s in _stats.items():
+        s = dict(s)
+        s.pop("in_stage")
+        s["avg_wait_sec"] = round(s["wait_sec"] / s["waited"], 4) if s["waited"] else 0.0
+        s["wait_sec"] = round(s["wait_sec"], 3)
+        s["max_wait_sec"] = round(s["max_wait_sec"], 3)
+        s["busy_sec"] = round(s["busy_sec"], 3)
+        out[key] = s
+    return out
+
+
+def print_stats():
+    stats = get_stats()
+    if not stats:
+        return
+    print("\n=== Stage pipeline ===")
+    for key, s in stats.items():
+        print(
+            f"  {key}: entered={s['entered']} peak_in_stage={s['peak']} busy={s['busy_sec']}s "
+            f"waited={s['waited']} (avg {s['avg_wait_sec']}s, max {s['max_wait_sec']}s)"
+        )
@@ -0,0 +1,318 @@
+"""Micro-batching generation worker for the in-process steering model: one thread owns the model and
+batches queued requests that share a steering coefficient (see misc/steering_worker_smoke.py)."""
+
+import asyncio
+import contextlib
+import copy
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+DEFAULT_MAX_NEW_TOKENS = 8192
+DEFAULT_MAX_BATCH_SIZE = 8
+DEFAULT_MAX_WAIT_MS = 10
+
+_STOP = object()  # queued by stop(); distinct from _next's None ("nothing arrived in time")
+
+
+class _Request:
+    __slots__ = ("messages", "max_new_tokens", "coefficient", "future", "enqueued", "group")
+
+    def __init__(self, messages, max_new_tokens, coefficient, group=False):
+        self.messages = messages  # a list of chats when group=True
+        self.group = group
+        self.max_new_tokens = max_new_tokens or DEFAULT_MAX_NEW_TOKENS
+        self.coefficient = 0.0 if abs(coefficient or 0.0) < 1e-6 else float(coefficient)
+        self.future = Future()
+        self.enqueued = time.monotonic()
+
+
+class SteeringBatchWorker:
+    """Owns a HF causal LM (+ optional steering vector) and serves batched generations."""
+
+    def __init__(
+        self,
+        model,
+        tokenizer,
+        steering_vector=None,
+        layer=None,
+        max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+        max_wait_ms=DEFAULT_MAX_WAIT_MS,
+        temperature=0.0,
+        top_p=0.9,
+        steering_cls=None,
+    ):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.steering_vector = steering_vector
+        self.layer = layer
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self.temperature = temperature
+        self.top_p = top_p
+        self._steering_cls = steering_cls
+        self._queue = queue.Queue()
+        self._held = deque()  # requests pulled off the queue but left for a later batch
+        self._thread = None
+        self._stopping = False
+        self.stats = {
+            "requests": 0, "batches": 0, "batched_rows": 0, "max_batch": 0, "queue_wait_sec": 0.0,
+            "groups": 0, "group_rows": 0, "prefix_tokens_reused": 0, "prefill_sec": 0.0, "prefill_sec_saved": 0.0,
+        }
+
+        tokenizer.padding_side = "left"
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+
+    # -- public API ----------------------------------------------------------
+
+    def start(self):
+        if self._thread is None:
+            self._stopping = False
+            self._thread = threading.Thread(target=self._loop, name="steering-worker", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Finish queued requests, then stop the worker thread."""
+        if self._thread is None:
+            return
+        self._stopping = True
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+
+    def submit(self, messages, max_new_tokens=DEFAULT_MAX_NEW_TOKENS, coefficient=0.0):
+        """Queue one chat for generation; returns a Future resolving to the response text."""
+        if self._thread is None:
+            self.start()
+        req = _Request(messages, max_new_tokens, coefficient)
+        self._queue.put(req)
+        return req.future
+
+    def submit_group(self, list_of_messages, max_new_tokens=DEFAULT_MAX_NEW_TOKENS, coefficient=0.0):
+        """Queue chats sharing a prompt prefix; the Future resolves to their responses in order."""
+        if self._thread is None:
+            self.start()
+        req = _Request(list(list_of_messages), max_new_tokens, coefficient, group=True)
+        self._queue.put(req)
+        return req.future
+
+    async def agenerate_group(self, list_of_messages, max_new_tokens=DEFAULT_MAX_NEW_TOKENS, coefficient=0.0):
+        return await asyncio.wrap_future(self.submit_group(list_of_messages, max_new_tokens, coefficient))
+
+    def generate(self, messages, max_new_tokens=DEFAULT_MAX_NEW_TOKENS, coefficient=0.0):
+        """Blocking submit()."""
+        return self.submit(messages, max_new_tokens, coefficient).result()
+
+    async def agenerate(self, messages, max_new_tokens=DEFAULT_MAX_NEW_TOKENS, coefficient=0.0):
+        return await asyncio.wrap_future(self.submit(messages, max_new_tokens, coefficient))
+
+    # -- worker ----------------------------------------------------------------
+
+    def _next(self, timeout):
+        if self._held:
+            return self._held.popleft()
+        try:
+            return self._queue.get(timeout=timeout) if timeout is not None else self._queue.get()
+        except queue.Empty:
+            return None
+
+    def _collect_batch(self):
+        """Next batch to run, or _STOP once stop() was called and its sentinel came up."""
+        first = self._next(None)
+        if first is _STOP:
+            return _STOP
+        if first.group:
+            return [first]  # groups run on their own (shared-prefix cache)
+        batch = [first]
+        skipped = []
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 and self._queue.empty() and not self._held:
+                break
+            req = self._next(max(remaining, 0) if not self._held else 0)
+            if req is _STOP:
+                self._queue.put(_STOP)  # stop after this batch and whatever is still queued
+                break
+            if req is None:
+                if remaining <= 0:
+                    break
+                continue
+            if req.coefficient == first.coefficient and not req.group:
+                batch.append(req)
+            else:
+                skipped.append(req)
+        self._held.extendleft(reversed(skipped))
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect_batch()
+            if batch is _STOP:
+                if not self._held and self._queue.empty():
+                    return
+                self._queue.put(_STOP)  # requests are still waiting: serve them first
+                continue
+            # callers that gave up (task cancelled, deadline) are dropped before any compute
+            batch = [r for r in batch if r.future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            now = time.monotonic()
+            self.stats["requests"] += len(batch)
+            self.stats["queue_wait_sec"] += sum(now - r.enqueued for r in batch)
+            if batch[0].group:
+                self._serve_group(batch[0])
+                continue
+            self.stats["batches"] += 1
+            self.stats["batched_rows"] += len(batch)
+            self.stats["max_batch"] = max(self.stats["max_batch"], len(batch))
+            try:
+                outputs = self._run_batch(batch)
+            except BaseException as e:
+                for req in batch:
+                    if not req.future.done():
+                        req.future.set_exception(e)
+                continue
+            for req, text in zip(batch, outputs):
+                if not req.future.done():
+                    req.future.set_result(text)
+
+    def _steering(self, coefficient):
+        if coefficient == 0.0 or self.steering_vector is None:
+            return None
+        steering_cls = self._steering_cls
+        if steering_cls is None:
+            from assistant_axis import ActivationSteering
+            steering_cls = ActivationSteering
+        return steering_cls(
+            self.model,
+            steering_vectors=[self.steering_vector],
+            coefficients=[coefficient],
+            layer_indices=[self.layer],
+        )
+
+    def _render(self, messages):
+        return self.tokenizer.apply_chat_template(
+            messages, tokenize=False, add_generation_prompt=True, enable_thinking=False
+        )
+
+    def _gen_kwargs(self, max_new_tokens):
+        gen_kwargs = dict(
+            max_new_tokens=max_new_tokens,
+            pad_token_id=self.tokenizer.pad_token_id,
+            do_sample=self.temperature > 0,
+        )
+        if self.temperature > 0:
+            gen_kwargs.update(temperature=self.temperature, top_p=self.top_p)
+        return gen_kwargs
+
+    def _run_batch(self, batch):
+        import torch
+
+        prompts = [self._render(r.messages) for r in batch]
+        inputs = self.tokenizer(prompts, return_tensors="pt", padding=True, add_special_tokens=False)
+        inputs = inputs.to(self.model.device)
+        gen_kwargs = self._gen_kwargs(max(r.max_new_tokens for r in batch))
+
+        steering = self._steering(batch[0].coefficient)
+        with torch.inference_mode():
+            if steering is not None:
+                with steering:
+                    out = self.model.generate(**inputs, **gen_kwargs)
+            else:
+                out = self.model.generate(**inputs, **gen_kwargs)
+
+        prompt_len = inputs["input_ids"].shape[1]
+        texts = []
+        for i, req in enumerate(batch):
+            new_tokens = out[i, prompt_len:prompt_len + req.max_new_tokens]
+            texts.append(self.tokenizer.decode(new_tokens, skip_special_tokens=True))
+        return texts
+
+    def _serve_group(self, req):
+        self.stats["groups"] += 1
+        self.stats["group_rows"] += len(req.messages)
+        try:
+            outputs = self._run_group(req)
+        except BaseException as e:
+            req.future.set_exception(e)
+            return
+        req.future.set_result(outputs)
+
+    def _run_group(self, req):
+        """Prefill the chats' common token prefix once, then generate each continuation from a copy."""
+        import torch
+        from transformers import DynamicCache
+
+        rows = [
+            self.tokenizer(self._render(m), return_tensors="pt", add_special_tokens=False)["input_ids"][0]
+            for m in req.messages
+        ]
+        # generate() needs at least one uncached token per row
+        n_prefix = min(common_prefix_len(rows), min(len(r) for r in rows) - 1)
+        gen_kwargs = self._gen_kwargs(req.max_new_tokens)
+        device = self.model.device
+        steering = self._steering(req.coefficient)
+        outputs = []
+        with torch.inference_mode(), (steering if steering is not None else contextlib.nullcontext()):
+            prefix_cache = None
+            if n_prefix > 0:
+                start = time.perf_counter()
+                prefix_cache = self.model(
+                    input_ids=rows[0][:n_prefix].unsqueeze(0).to(device),
+                    past_key_values=DynamicCache(),
+                    use_cache=True,
+                ).past_key_values
+                prefill_sec = time.perf_counter() - start
+                reused = len(rows) - 1
+                self.stats["prefix_tokens_reused"] += n_prefix * reused
+                self.stats["prefill_sec"] += prefill_sec
+                self.stats["prefill_sec_saved"] += prefill_sec * reused
+            for row in rows:
+                input_ids = row.unsqueeze(0).to(device)
+                out = self.model.generate(
+                    input_ids=input_ids,
+                    attention_mask=torch.ones_like(input_ids),
+                    past_key_values=copy.deepcopy(prefix_cache) if prefix_cache is not None else None,
+                    **gen_kwargs,
+                )
+                outputs.append(self.tokenizer.decode(out[0, len(row):], skip_special_tokens=True))
+        return outputs
+
+    def get_stats(self):
+        out = dict(self.stats)
+        out["avg_batch"] = round(out["batched_rows"] / out["batches"], 2) if out["batches"] else 0.0
+        out["avg_queue_wait_sec"] = round(out["queue_wait_sec"] / out["requests"], 4) if out["requests"] else 0.0
+        return out
+
+    def print_stats(self):
+        s = self.get_stats()
+        if not s["batches"] and not s["groups"]:
+            return
+        print(
+            f"  steering worker: requests={s['requests']} batches={s['batches']} avg_batch={s['avg_batch']} "
+            f"max_batch={s['max_batch']} avg_queue_wait={s['avg_queue_wait_sec']}s"
+        )
+        if s["groups"]:
+            print(
+                f"  shared-prefix groups: {s['groups']} ({s['group_rows']} rows) "
+                f"prefix tokens reused={s['prefix_tokens_reused']} "
+                f"prefill saved ~{s['prefill_sec_saved']:.2f}s ({s['prefill_sec_saved'] / s['groups']:.3f}s/set)"
+            )
+
+
+def common_prefix_len(rows):
+    """Length of the longest token prefix shared by all rows (1-D tensors or lists)."""
+    if not rows:
+        return 0
+    n = min(len(r) for r in rows)
+    first = rows[0]
+    for i in range(n):
+        tok = int(first[i])
+        if any(int(r[i]) != tok for r in rows[1:]):
+            return i
+    return n
@@ -0,0 +1,123 @@
+"""Early-terminating streaming for JSON answer prompts: the stream is closed once the decisive
+field ("answer" / "correct") is complete; every BASELINE_EVERY-th request runs in full to estimate savings."""
+
+import json
+import re
+import threading
+
+import json_repair
+
+BASELINE_EVERY = 20
+
+_lock = threading.Lock()
+_stats = {}  # stage key -> counters
+
+
+def _answer_start(text):
+    """Offset where the answer starts: after a closed <think> block, None while still thinking."""
+    if not text.lstrip().startswith("<think>"):
+        return 0
+    i = text.find("</think>")
+    return None if i == -1 else i + len("</think>")
+
+
+def decisive_field_end(text, field):
+    """Index just past the completed value of ``field`` in partial JSON text, or None."""
+    start = _answer_start(text)
+    if start is None:
+        return None
+    m = re.compile(
+        rf'"{re.escape(field)}"\s*:\s*(?:"((?:[^"\\]|\\.)*)"|(true|false|null)\b)',
+        re.IGNORECASE,
+    ).search(text, start)
+    return m.end() if m else None
+
+
+def finalize_partial(text, field):
+    """Turn a stream cut right after ``field`` into a complete JSON object.
+
+    The decisive field is kept as generated (an unquoted true/false is quoted, as the
+    prompts ask); an optional ``reasoning`` key is filled with whatever was produced
+    (usually nothing) so downstream parsers see the usual shape. A leading <think>
+    block is preserved.
+    """
+    start = _answer_start(text) or 0
+    head, body = text[:start], text[start:]
+    try:
+        obj = json_repair.loads(body)
+    except Exception:
+        obj = None
+    if not isinstance(obj, dict) or field not in obj:
+        return text
+    if isinstance(obj[field], bool):
+        obj[field] = str(obj[field]).lower()  # parse_hard_answer and the runners read strings
+    obj.setdefault("reasoning", "")
+    return head + json.dumps(obj, ensure_ascii=False)
+
+
+def should_run_baseline(stage_key):
+    """True for the requests of a stage that should stream to completion (calibration)."""
+    with _lock:
+        s = _stats.setdefault(stage_key, _new_stats())
+        s["seen"] += 1
+        return s["seen"] % BASELINE_EVERY == 1
+
+
+def _new_stats():
+    return {
+        "seen": 0,
+        "stopped": 0,
+        "stopped_tokens": 0,
+        "stopped_sec": 0.0,
+        "full": 0,
+        "full_tokens": 0,
+        "full_sec": 0.0,
+    }
+
+
+def record(stage_key, n_tokens, elapsed, stopped):
+    with _lock:
+        s = _stats.setdefault(stage_key, _new_stats())
+        if stopped:
+            s["stopped"] += 1
+            s["stopped_tokens"] += n_tokens
+            s["stopped_sec"] += elapsed
+        else:
+            s["full"] += 1
+            s["full_tokens"] += n_tokens
+            s["full_sec"] += elapsed
+
+
+def get_stream_stats():
+    """Per-stage counters plus estimated output tokens / wall time saved by early stops."""
+    out = {}
+    with _lock:
+        items = {k: dict(v) for k, v in _stats.items()}
+    for key, s in items.items():
+        entry = dict(s)
+        if s["full"] and s["stopped"]:
+            mean_full_tokens = s["full_tokens"] / s["full"]
+            mean_full_sec = s["full_sec"] / s["full"]
+            entry["est_tokens_saved"] = round(
+                max(0.0, mean_full_tokens * s["stopped"] - s["stopped_tokens"]), 1
+            )
+            entry["est_sec_saved"] = round(max(0.0, mean_full_sec * s["stopped"] - s["stopped_sec"]), 2)
+        else:
+            entry["est_tokens_saved"] = None
+            entry["est_sec_saved"] = None
+        out[key] = entry
+    return out
+
+
+def print_stream_stats():
+    stats = get_stream_stats()
+    if not stats:
+        return
+    print("\n=== Streaming early stop ===")
+    for key, s in stats.items():
+        saved = (
+            f"est. saved {s['est_tokens_saved']} output tokens, {s['est_sec_saved']}s request time"
+            if s["est_tokens_saved"] is not None
+            else "no full-length baseline yet"
+        )
+        print(f"  {key}: stopped_early={s['stopped']} ran_full={s['full']} ({saved})")
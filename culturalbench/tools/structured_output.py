@@ -0,0 +1,90 @@
+"""JSON schemas for constrained decoding of the answer, refine and initial-persona prompts
+(decisive field first, for the streaming early stop), and per-stage parse-retry counts."""
+
+import threading
+
+ANSWER_EASY_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "answer": {"type": "string", "enum": ["A", "B", "C", "D"]},
+        "reasoning": {"type": "string"},
+    },
+    "required": ["answer", "reasoning"],
+}
+
+ANSWER_HARD_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "correct": {"type": "string", "enum": ["true", "false"]},
+        "reasoning": {"type": "string"},
+    },
+    "required": ["correct", "reasoning"],
+}
+
+REFINE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "reasoning": {"type": "string"},
+        "revised_persona": {"type": "string"},
+    },
+    "required": ["reasoning", "revised_persona"],
+}
+
+INITIAL_PERSONA_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "reasoning": {"type": "string"},
+        "persona": {"type": "string"},
+    },
+    "required": ["reasoning", "persona"],
+}
+
+SCHEMAS = {
+    "answer_easy": ANSWER_EASY_SCHEMA,
+    "answer_hard": ANSWER_HARD_SCHEMA,
+    "refine": REFINE_SCHEMA,
+    "initial_persona": INITIAL_PERSONA_SCHEMA,
+}
+
+_lock = threading.Lock()
+_retry_stats = {}  # stage -> {"calls", "attempts", "retries", "failures"}
+
+
+def response_format(schema_name):
+    """OpenAI-style response_format for a named schema (SGLang json_schema constraint)."""
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": schema_name, "schema": SCHEMAS[schema_name], "strict": True},
+    }
+
+
+def record_attempts(stage, attempts, ok):
+    """Record one generate-and-parse loop: attempts made and whether it ended parsed."""
+    with _lock:
+        s = _retry_stats.setdefault(stage, {"calls": 0, "attempts": 0, "retries": 0, "failures": 0})
+        s["calls"] += 1
+        s["attempts"] += attempts
+        s["retries"] += max(0, attempts - 1)
+        if not ok:
+            s["failures"] += 1
+
+
+def get_retry_stats():
+    with _lock:
+        out = {k: dict(v) for k, v in _retry_stats.items()}
+    for s in out.values():
+        s["retry_rate"] = round(s["retries"] / s["calls"], 4) if s["calls"] else 0.0
+        s["failure_rate"] = round(s["failures"] / s["calls"], 4) if s["calls"] else 0.0
+    return out
+
+
+def print_retry_stats():
+    stats = get_retry_stats()
+    if not stats:
+        return
+    print("\n=== Parse retries per stage ===")
+    for stage, s in stats.items():
+        print(
+            f"  {stage}: calls={s['calls']} retries={s['retries']} ({s['retry_rate']:.2%}) "
+            f"failures={s['failures']} ({s['failure_rate']:.2%})"
+        )
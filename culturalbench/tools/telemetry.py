@@ -0,0 +1,437 @@
+"""Per-request LLM telemetry: one llm_requests row per call in <results db>.telemetry.db, with percentile reports.
+
+    python -m tools.telemetry ../results/eng/<model>/easy_t0.6_<model>.db [--by stage|iteration|both] [--lengths]
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import math
+import os
+import sqlite3
+import threading
+import time
+
+TELEMETRY_SUFFIX = ".telemetry.db"
+FLUSH_EVERY = 200
+PERCENTILES = (50, 95, 99)
+
+# stage is initial_persona, refine, feedback, answer_easy, answer_hard or summary (culturalbench has no
+# judge call). queue_wait runs from the call being issued to the request being sent, ttft from sending
+# to the first streamed token, latency from issue to result; status is ok, cache_hit, replay_miss,
+# coalesced, deferred, failed, deadline, error or cancelled.
+_COLUMNS = (
+    "run_id", "started_at", "stage", "iteration", "model", "endpoint", "queue_wait", "ttft",
+    "latency", "retries", "prompt_tokens", "completion_tokens", "cached_tokens", "early_stop", "hedged",
+    "status", "max_tokens", "finish_reason",
+)
+_ADDED_COLUMNS = (
+    ("hedged", "INTEGER NOT NULL DEFAULT 0"),
+    ("max_tokens", "INTEGER"),
+    ("finish_reason", "TEXT"),
+)
+
+_enabled = False
+_run_id = None
+_path = None
+_conn = None
+_buffer = []
+_lock = threading.Lock()
+
+_iteration = contextvars.ContextVar("telemetry_iteration", default=None)
+_queued_at = contextvars.ContextVar("telemetry_queued_at", default=None)
+_current = contextvars.ContextVar("telemetry_call", default=None)
+
+
+class CallRecord:
+    """Timings and usage of one LLM call, filled in as the call goes through llm_utils."""
+
+    __slots__ = (
+        "stage", "iteration", "model", "endpoint", "started_at", "queue_wait", "ttft", "latency",
+        "attempts", "prompt_tokens", "completion_tokens", "cached_tokens", "early_stop", "hedged",
+        "status", "max_tokens", "finish_reason", "_t0", "_sent",
+    )
+
+    def __init__(self, stage, model, t0):
+        self.stage = stage
+        self.iteration = _iteration.get()
+        self.model = model
+        self.endpoint = None
+        self._t0 = t0
+        self._sent = None
+        self.started_at = time.time() - (time.perf_counter() - t0)
+        self.queue_wait = self.ttft = self.latency = None
+        self.attempts = 0
+        self.prompt_tokens = self.completion_tokens = self.cached_tokens = None
+        self.early_stop = False
+        self.hedged = False
+        self.status = "ok"
+        self.max_tokens = self.finish_reason = None
+
+    def row(self):
+        return (
+            _run_id, self.started_at, self.stage, self.iteration, self.model, self.endpoint,
+            self.queue_wait, self.ttft, self.latency, max(0, self.attempts - 1), self.prompt_tokens,
+            self.completion_tokens, self.cached_tokens, int(self.early_stop), int(self.hedged), self.status,
+            self.max_tokens, self.finish_reason,
+        )
+
+
+def telemetry_path(db_path):
+    """Telemetry file for a results DB (a path already ending in TELEMETRY_SUFFIX is kept)."""
+    if db_path.endswith(TELEMETRY_SUFFIX):
+        return db_path
+    return os.path.splitext(db_path)[0] + TELEMETRY_SUFFIX
+
+
+def _connect(path):
+    parent = os.path.dirname(path)
+    if parent:
+        os.makedirs(parent, exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS llm_requests (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            run_id TEXT NOT NULL,
+            started_at REAL NOT NULL,
+            stage TEXT,
+            iteration INTEGER,
+            model TEXT,
+            endpoint TEXT,
+            queue_wait REAL,
+            ttft REAL,
+            latency REAL,
+            retries INTEGER NOT NULL DEFAULT 0,
+            prompt_tokens INTEGER,
+            completion_tokens INTEGER,
+            cached_tokens INTEGER,
+            early_stop INTEGER NOT NULL DEFAULT 0,
+            hedged INTEGER NOT NULL DEFAULT 0,
+            status TEXT NOT NULL,
+            max_tokens INTEGER,
+            finish_reason TEXT
+        )
+    ''')
+    columns = {col[1] for col in conn.execute("PRAGMA table_info(llm_requests)").fetchall()}
+    for name, decl in _ADDED_COLUMNS:
+        if name not in columns:
+            conn.execute(f"ALTER TABLE llm_requests ADD COLUMN {name} {decl}")
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_run_stage ON llm_requests(run_id, stage, iteration)')
+    conn.commit()
+    return conn
+
+
+def configure(enabled=True):
+    """Start recording calls for this run (buffered until attach())."""
+    global _enabled, _run_id
+    _enabled = enabled
+    _run_id = time.strftime("%Y%m%d-%H%M%S") + f"-{os.getpid()}"
+
+
+def is_enabled():
+    return _enabled
+
+
+def get_run_id():
+    return _run_id
+
+
+def attach(db_path):
+    """Write this run's rows (including those buffered so far) next to results DB db_path."""
+    global _path, _conn
+    if not _enabled:
+        return None
+    path = telemetry_path(db_path)
+    with _lock:
+        if _path == path:
+            return path
+        if _conn is not None:
+            _flush_locked()
+            _conn.close()
+        _conn, _path = _connect(path), path
+        _flush_locked()
+    print(f"LLM request telemetry: {path} (run_id={_run_id})")
+    return path
+
+
+def _flush_locked():
+    global _buffer
+    if _conn is None or not _buffer:
+        return
+    _conn.executemany(
+        f'INSERT INTO llm_requests ({", ".join(_COLUMNS)}) VALUES ({", ".join("?" * len(_COLUMNS))})',
+        _buffer,
+    )
+    _conn.commit()
+    _buffer = []
+
+
+def flush():
+    with _lock:
+        _flush_locked()
+
+
+def close():
+    """Flush buffered rows and close the telemetry DB."""
+    global _conn, _path
+    with _lock:
+        _flush_locked()
+        if _conn is not None:
+            _conn.close()
+        _conn, _path = None, None
+
+
+def set_iteration(iteration):
+    """Tag calls issued from the current task (and tasks it creates later) with iteration."""
+    _iteration.set(iteration)
+
+
+def mark_queued():
+    """Start the clock for the next call from this task before it waits for a scheduler slot."""
+    if _enabled:
+        _queued_at.set(time.perf_counter())
+
+
+@contextlib.contextmanager
+def track(stage, model):
+    """Record the LLM call made inside the block; yields its CallRecord (None when disabled)."""
+    if not _enabled:
+        yield None
+        return
+    t0 = _queued_at.get() or time.perf_counter()
+    _queued_at.set(None)
+    rec = CallRecord(stage, model, t0)
+    token = _current.set(rec)
+    try:
+        yield rec
+    except BaseException as e:
+        if rec.status != "deferred":
+            rec.status = "cancelled" if isinstance(e, (asyncio.CancelledError, KeyboardInterrupt)) else "error"
+        raise
+    finally:
+        _current.reset(token)
+        rec.latency = time.perf_counter() - t0
+        with _lock:
+            _buffer.append(rec.row())
+            if len(_buffer) >= FLUSH_EVERY:
+                _flush_locked()
+
+
+def current():
+    return _current.get()
+
+
+def on_send(endpoint):
+    """The current call's request is going out to endpoint (called once per attempt)."""
+    rec = _current.get()
+    if rec is None:
+        return
+    now = time.perf_counter()
+    rec.endpoint = endpoint
+    rec.attempts += 1
+    rec._sent = now
+    if rec.queue_wait is None:
+        rec.queue_wait = now - rec._t0
+
+
+def on_hedge():
+    rec = _current.get()
+    if rec is not None:
+        rec.hedged = True
+
+
+def on_first_token():
+    rec = _current.get()
+    if rec is not None and rec.ttft is None and rec._sent is not None:
+        rec.ttft = time.perf_counter() - rec._sent
+
+
+def on_usage(usage, early_stop=False):
+    """Server-reported token usage (OpenAI-style usage object) of the current call."""
+    rec = _current.get()
+    if rec is None:
+        return
+    rec.early_stop = rec.early_stop or early_stop
+    if usage is None:
+        return
+    rec.prompt_tokens = getattr(usage, "prompt_tokens", None)
+    rec.completion_tokens = getattr(usage, "completion_tokens", None)
+    details = getattr(usage, "prompt_tokens_details", None)
+    rec.cached_tokens = getattr(details, "cached_tokens", None) if details is not None else None
+
+
+def on_finish(finish_reason, max_tokens=None):
+    """How the current call's (last) response ended and the max_tokens it was sent with."""
+    rec = _current.get()
+    if rec is not None:
+        rec.finish_reason = finish_reason
+        rec.max_tokens = max_tokens
+
+
+def set_status(status):
+    rec = _current.get()
+    if rec is not None:
+        rec.status = status
+
+
+# -- reporting -----------------------------------------------------------------
+
+
+def _percentile(sorted_values, p):
+    """Nearest-rank percentile of an ascending list (None if empty)."""
+    if not sorted_values:
+        return None
+    k = max(0, min(len(sorted_values) - 1, math.ceil(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+def summarize(path, by=("stage", "iteration"), run_id=None):
+    """Per-group percentiles and throughput from a telemetry DB.
+
+    Returns a list of dicts (one per group, ordered by the group columns) with n, status
+    counts, latency/ttft/queue_wait percentiles, retries, token totals, requests/s and
+    completion tokens/s over the group's wall-clock span.
+    """
+    conn = sqlite3.connect(telemetry_path(path))
+    where, params = "", ()
+    if run_id is not None:
+        where, params = "WHERE run_id = ?", (run_id,)
+    rows = conn.execute(f'''
+        SELECT {", ".join(by)}, started_at, latency, ttft, queue_wait, retries,
+               prompt_tokens, completion_tokens, cached_tokens, status, hedged
+        FROM llm_requests {where}
+    ''', params).fetchall()
+    conn.close()
+
+    groups = {}
+    for row in rows:
+        groups.setdefault(tuple(row[:len(by)]), []).append(row[len(by):])
+
+    out = []
+    for key in sorted(groups, key=lambda k: tuple((v is None, v) for v in k)):
+        entries = groups[key]
+        served = [e for e in entries if e[8] == "ok"]
+        summary = dict(zip(by, key))
+        summary["n"] = len(entries)
+        summary["status"] = {}
+        for e in entries:
+            summary["status"][e[8]] = summary["status"].get(e[8], 0) + 1
+        for name, idx in (("latency", 1), ("ttft", 2), ("queue_wait", 3)):
+            values = sorted(e[idx] for e in served if e[idx] is not None)
+            for p in PERCENTILES:
+                summary[f"{name}_p{p}"] = _percentile(values, p)
+        summary["retries"] = sum(e[4] or 0 for e in entries)
+        summary["hedged"] = sum(e[9] or 0 for e in entries)
+        summary["prompt_tokens"] = sum(e[5] or 0 for e in served)
+        summary["completion_tokens"] = sum(e[6] or 0 for e in served)
+        summary["cached_tokens"] = sum(e[7] or 0 for e in served)
+        span = max(e[0] + (e[1] or 0) for e in entries) - min(e[0] for e in entries)
+        summary["wall_sec"] = span
+        summary["req_per_sec"] = len(served) / span if span > 0 else None
+        summary["out_tok_per_sec"] = summary["completion_tokens"] / span if span > 0 else None
+        out.append(summary)
+    return out
+
+
+def _fmt(value, spec=".2f"):
+    return "-" if value is None else format(value, spec)
+
+
+def print_report(path, by=("stage", "iteration"), run_id=None):
+    summaries = summarize(path, by=by, run_id=run_id)
+    if not summaries:
+        print(f"No telemetry rows in {telemetry_path(path)}")
+        return
+    print(f"\n=== LLM request telemetry ({telemetry_path(path)}{', run ' + run_id if run_id else ''}) ===")
+    for s in summaries:
+        label = " ".join(f"{k}={s[k] if s[k] is not None else '-'}" for k in by)
+        status = " ".join(f"{k}={v}" for k, v in sorted(s["status"].items()))
+        print(f"  {label}: n={s['n']} [{status}] retries={s['retries']} hedged={s['hedged']}")
+        for name in ("latency", "ttft", "queue_wait"):
+            if s[f"{name}_p50"] is None:
+                continue
+            print(
+                f"    {name:<10} p50={_fmt(s[f'{name}_p50'], '.3f')}s p95={_fmt(s[f'{name}_p95'], '.3f')}s "
+                f"p99={_fmt(s[f'{name}_p99'], '.3f')}s"
+            )
+        print(
+            f"    throughput {_fmt(s['req_per_sec'])} req/s, {_fmt(s['out_tok_per_sec'], '.1f')} output tok/s "
+            f"over {s['wall_sec']:.1f}s (tokens in={s['prompt_tokens']} cached={s['cached_tokens']} "
+            f"out={s['completion_tokens']})"
+        )
+
+
+def output_lengths(path, run_id=None, limit=None):
+    """Completion-token counts of served, full-length responses per (model, stage).
+
+    Streams cut early are left out (their length says nothing about the stage); with
+    limit only the most recent rows per group are returned, oldest first.
+    """
+    conn = sqlite3.connect(telemetry_path(path))
+    columns = {col[1] for col in conn.execute("PRAGMA table_info(llm_requests)").fetchall()}
+    where, params = "", ()
+    if run_id is not None:
+        where, params = "AND run_id = ?", (run_id,)
+    rows = conn.execute(f'''
+        SELECT model, stage, completion_tokens, {"finish_reason" if "finish_reason" in columns else "NULL"}
+        FROM llm_requests
+        WHERE status = 'ok' AND early_stop = 0 AND completion_tokens IS NOT NULL {where}
+        ORDER BY started_at
+    ''', params).fetchall()
+    conn.close()
+    lengths, truncated = {}, {}
+    for model, stage, n, finish_reason in rows:
+        lengths.setdefault((model, stage), []).append(n)
+        if finish_reason == "length":
+            truncated[(model, stage)] = truncated.get((model, stage), 0) + 1
+    if limit:
+        lengths = {k: v[-limit:] for k, v in lengths.items()}
+    return lengths, truncated
+
+
+def print_length_report(path, run_id=None):
+    lengths, truncated = output_lengths(path, run_id=run_id)
+    if not lengths:
+        print(f"No output lengths in {telemetry_path(path)}")
+        return
+    print(f"\n=== Output lengths in tokens ({telemetry_path(path)}{', run ' + run_id if run_id else ''}) ===")
+    for (model, stage), values in sorted(lengths.items(), key=lambda kv: tuple(str(v) for v in kv[0])):
+        values = sorted(values)
+        pcts = " ".join(f"p{p}={_percentile(values, p)}" for p in PERCENTILES)
+        print(
+            f"  {model} {stage or '-'}: n={len(values)} {pcts} max={values[-1]} "
+            f"truncated={truncated.get((model, stage), 0)}"
+        )
+
+
+def run_ids(path):
+    conn = sqlite3.connect(telemetry_path(path))
+    rows = conn.execute(
+        'SELECT run_id, COUNT(*), MIN(started_at) FROM llm_requests GROUP BY run_id ORDER BY MIN(started_at)'
+    ).fetchall()
+    conn.close()
+    return rows
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Print LLM request percentiles and throughput from a telemetry DB")
+    parser.add_argument("db_path", help="Results DB (its .telemetry.db is read) or the telemetry DB itself")
+    parser.add_argument("--by", choices=["stage", "iteration", "both"], default="both", help="Group rows by")
+    parser.add_argument("--run_id", default=None, help="Only this run (default: all runs in the file)")
+    parser.add_argument("--list_runs", action="store_true", help="List the runs recorded in the file")
+    parser.add_argument("--lengths", action="store_true", help="Output-length percentiles per model and stage")
+    args = parser.parse_args()
+
+    if not os.path.exists(telemetry_path(args.db_path)):
+        raise SystemExit(f"No telemetry DB at {telemetry_path(args.db_path)}")
+    if args.list_runs:
+        for rid, n, started in run_ids(args.db_path):
+            print(f"{rid}: {n} requests, started {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(started))}")
+    elif args.lengths:
+        print_length_report(args.db_path, run_id=args.run_id)
+    else:
+        group_by = {"stage": ("stage",), "iteration": ("iteration",), "both": ("stage", "iteration")}[args.by]
+        print_report(args.db_path, by=group_by, run_id=args.run_id)
@@ -0,0 +1,240 @@
+"""Token-budget admission per SGLang endpoint: requests are charged prompt tokens + max_tokens
+and admitted FIFO (with backfill for MAX_BYPASS_SEC) while the endpoint's budget has room."""
+
+import asyncio
+import contextlib
+import threading
+import time
+from collections import deque
+
+import httpx
+
+MAX_BYPASS_SEC = 2.0
+AUTO_FRACTION = 0.9
+SERVER_INFO_TIMEOUT_SEC = 5.0
+
+_budget = None  # tokens per endpoint, "auto" or None (disabled)
+_gates = {}
+_gates_lock = threading.Lock()
+
+
+class _Waiter:
+    __slots__ = ("cost", "enqueued", "loop", "future", "granted")
+
+    def __init__(self, cost, loop=None):
+        self.cost = cost
+        self.enqueued = time.monotonic()
+        self.loop = loop
+        self.future = loop.create_future() if loop is not None else None
+        self.granted = False
+
+
+class TokenGate:
+    """In-flight token budget for one endpoint; usable from threads and coroutines."""
+
+    def __init__(self, name, capacity):
+        self.name = name
+        self.capacity = max(1, int(capacity))
+        self.in_flight = 0
+        self._queue = deque()
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self.stats = {
+            "requests": 0, "waited": 0, "wait_sec": 0.0, "max_wait_sec": 0.0, "bypasses": 0,
+            "peak_tokens": 0, "tokens_admitted": 0, "oversized": 0,
+        }
+
+    def _charge(self, cost):
+        if cost > self.capacity:
+            self.stats["oversized"] += 1
+            return self.capacity
+        return max(1, int(cost))
+
+    def _admit_locked(self, cost):
+        self.in_flight += cost
+        self.stats["requests"] += 1
+        self.stats["tokens_admitted"] += cost
+        self.stats["peak_tokens"] = max(self.stats["peak_tokens"], self.in_flight)
+
+    def _dispatch_locked(self):
+        """Grant queued waiters that fit, in order, letting later ones backfill while the head is young."""
+        now = time.monotonic()
+        skipped = False
+        for w in list(self._queue):
+            if w.future is not None and w.future.done():
+                self._queue.remove(w)  # cancelled while waiting
+                continue
+            if self.in_flight + w.cost <= self.capacity:
+                self._queue.remove(w)
+                self._admit_locked(w.cost)
+                w.granted = True
+                if skipped:
+                    self.stats["bypasses"] += 1
+                if w.future is not None:
+                    w.loop.call_soon_threadsafe(_resolve, w.future)
+                continue
+            if now - w.enqueued >= MAX_BYPASS_SEC:
+                break  # this one has waited long enough: nothing behind it may overtake
+            skipped = True
+        self._cond.notify_all()
+
+    def _record_wait(self, waiter):
+        waited = time.monotonic() - waiter.enqueued
+        self.stats["waited"] += 1
+        self.stats["wait_sec"] += waited
+        self.stats["max_wait_sec"] = max(self.stats["max_wait_sec"], waited)
+
+    def _release(self, cost):
+        with self._lock:
+            self.in_flight -= cost
+            self._dispatch_locked()
+
+    async def acquire_async(self, cost):
+        with self._lock:
+            if not self._queue and self.in_flight + cost <= self.capacity:
+                self._admit_locked(cost)
+                return
+            waiter = _Waiter(cost, asyncio.get_running_loop())
+            self._queue.append(waiter)
+            self._dispatch_locked()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter.granted:
+                    self.in_flight -= cost  # granted just as we were cancelled: give the tokens back
+                    self._dispatch_locked()
+                elif waiter in self._queue:
+                    self._queue.remove(waiter)
+                    self._dispatch_locked()
+            raise
+        with self._lock:
+            self._record_wait(waiter)
+
+    def acquire(self, cost):
+        with self._cond:
+            if not self._queue and self.in_flight + cost <= self.capacity:
+                self._admit_locked(cost)
+                return
+            waiter = _Waiter(cost)
+            self._queue.append(waiter)
+            self._dispatch_locked()
+            while not waiter.granted:
+                self._cond.wait()
+            self._record_wait(waiter)
+
+    @contextlib.asynccontextmanager
+    async def reserve(self, cost):
+        """Hold cost tokens of the budget around an async request."""
+        cost = self._charge(cost)
+        await self.acquire_async(cost)
+        try:
+            yield
+        finally:
+            self._release(cost)
+
+    @contextlib.contextmanager
+    def reserve_sync(self, cost):
+        cost = self._charge(cost)
+        self.acquire(cost)
+        try:
+            yield
+        finally:
+            self._release(cost)
+
+
+def _resolve(fut):
+    if not fut.done():
+        fut.set_result(None)
+
+
+def server_kv_tokens(base_url):
+    """max_total_num_tokens reported by an SGLang server (base_url ending in /v1), or None."""
+    root = base_url.rstrip("/")
+    if root.endswith("/v1"):
+        root = root[:-3]
+    try:
+        resp = httpx.get(f"{root}/get_server_info", timeout=SERVER_INFO_TIMEOUT_SEC)
+        resp.raise_for_status()
+        info = resp.json()
+    except Exception as e:
+        print(f"Token budget: cannot read /get_server_info from {root}: {type(e).__name__}: {e}")
+        return None
+    value = info.get("max_total_num_tokens")
+    if value is None:
+        value = (info.get("internal_states") or [{}])[0].get("max_total_num_tokens")
+    return int(value) if value else None
+
+
+def configure(budget, endpoints=()):
+    """Enable per-endpoint token budgets: an int (tokens per endpoint), "auto" or None (disable).
+
+    "auto" reads each of endpoints' KV capacity here, so no request waits on /get_server_info;
+    raises RuntimeError when a server does not report it.
+    """
+    global _budget
+    gates = {}
+    if budget == "auto":
+        for endpoint in endpoints:
+            kv = server_kv_tokens(endpoint)
+            if not kv:
+                raise RuntimeError(f"--token_budget auto: no KV capacity from {endpoint}; pass a token count instead")
+            gates[endpoint] = TokenGate(endpoint, int(kv * AUTO_FRACTION))
+            print(f"Token budget for {endpoint}: {gates[endpoint].capacity} tokens ({AUTO_FRACTION:.0%} of {kv} KV tokens)")
+    with _gates_lock:
+        _gates.clear()
+        _gates.update(gates)
+    _budget = budget
+    if budget is not None:
+        print(f"Token-budget admission: {budget if budget == 'auto' else f'{int(budget)} tokens'} per endpoint")
+
+
+def is_enabled():
+    return _budget is not None
+
+
+def get_gate(endpoint):
+    gate = _gates.get(endpoint)
+    if gate is None:
+        if _budget == "auto":
+            raise RuntimeError(f"--token_budget auto: {endpoint} was not passed to configure()")
+        with _gates_lock:
+            gate = _gates.get(endpoint)
+            if gate is None:
+                gate = _gates[endpoint] = TokenGate(endpoint, _budget)
+    return gate
+
+
+def token_slot(endpoint, cost):
+    """Async context manager holding cost tokens on endpoint (no-op when disabled)."""
+    return get_gate(endpoint).reserve(cost) if _budget is not None else contextlib.nullcontext()
+
+
+def token_slot_sync(endpoint, cost):
+    return get_gate(endpoint).reserve_sync(cost) if _budget is not None else contextlib.nullcontext()
+
+
+def get_budget_stats():
+    out = {}
+    for name, gate in list(_gates.items()):
+        with gate._lock:
+            s = dict(gate.stats)
+            s["capacity"] = gate.capacity
+        s["avg_wait_sec"] = round(s["wait_sec"] / s["waited"], 4) if s["waited"] else 0.0
+        s["wait_sec"] = round(s["wait_sec"], 3)
+        s["max_wait_sec"] = round(s["max_wait_sec"], 3)
+        out[name] = s
+    return out
+
+
+def print_budget_stats():
+    stats = get_budget_stats()
+    if not stats:
+        return
+    print("\n=== Token-budget admission ===")
+    for name, s in stats.items():
+        print(
+            f"  {name}: capacity={s['capacity']} peak_in_flight={s['peak_tokens']} requests={s['requests']} "
+            f"waited={s['waited']} (avg {s['avg_wait_sec']}s, max {s['max_wait_sec']}s) "
+            f"backfilled={s['bypasses']} oversized={s['oversized']}"
+        )
@@ -0,0 +1,124 @@
+"""Warm-up before the first iteration: prefill the shared system prompts on every replica and load the
+embedder and tokenizer concurrently; work already done in this process is skipped."""
+
+import asyncio
+import hashlib
+import json
+import time
+
+from .llm_utils import sglang_request, _sglang_pool
+from .sglang_client import get_async_client
+
+PREFILL_TIMEOUT_SEC = 120.0
+
+_enabled = True
+_prefilled = set()  # (base_url, prefix hash)
+_loaded = set()  # "embedder", "tokenizer"
+_timings = {}
+
+
+def configure(enabled=True):
+    global _enabled
+    _enabled = enabled
+
+
+def is_enabled():
+    return _enabled
+
+
+def _prefix_key(create_kwargs):
+    return hashlib.sha256(json.dumps(create_kwargs["messages"], sort_keys=True).encode()).hexdigest()
+
+
+async def _prefill(base_url, create_kwargs):
+    client = get_async_client(base_url)
+    await asyncio.wait_for(client.chat.completions.create(**create_kwargs), PREFILL_TIMEOUT_SEC)
+
+
+async def prefill(prefixes):
+    """Send each (model, messages) prefix as a one-token request to every healthy replica of its
+    model. Returns (prefilled, failed) request counts."""
+    jobs = []
+    for model_name, messages in prefixes:
+        request = sglang_request(model_name, messages, max_tokens=1)
+        if request is None:
+            continue  # steering models keep their own prefix cache
+        pool_model, create_kwargs = request
+        key = _prefix_key(create_kwargs)
+        for replica in _sglang_pool(pool_model).replicas:
+            if replica.healthy and (replica.base_url, key) not in _prefilled:
+                jobs.append((replica.base_url, key, create_kwargs))
+    results = await asyncio.gather(*(_prefill(url, kw) for url, _, kw in jobs), return_exceptions=True)
+    failed = 0
+    for (base_url, key, _), result in zip(jobs, results):
+        if isinstance(result, Exception):
+            failed += 1
+            print(f"Warm-up: prefill on {base_url} failed: {type(result).__name__}: {result}")
+        else:
+            _prefilled.add((base_url, key))
+    return len(jobs) - failed, failed
+
+
+def _load_embedder():
+    from .memory import warm_embedder
+
+    warm_embedder()
+
+
+def _load_tokenizer():
+    from token_counter import count_tokens_text
+
+    count_tokens_text("warm-up")
+
+
+async def _timed(name, coro):
+    """Await coro, recording its duration; returns (ok, result)."""
+    start = time.perf_counter()
+    try:
+        return True, await coro
+    except Exception as e:
+        print(f"Warm-up: {name} failed: {type(e).__name__}: {e}")
+        return False, None
+    finally:
+        key = f"{name}_sec"
+        _timings[key] = round(_timings.get(key, 0.0) + time.perf_counter() - start, 3)
+
+
+async def warm_up(prefixes=(), embedder=False, tokenizer=True):
+    """Prefill prefixes on every replica and load the embedder / tokenizer, concurrently.
+    Prints and returns the timings (seconds per part and in total)."""
+    if not _enabled:
+        return {}
+    start = time.perf_counter()
+    tasks = {}
+    if prefixes:
+        tasks["prefill"] = _timed("prefill", prefill(prefixes))
+    if embedder and "embedder" not in _loaded:
+        tasks["embedder"] = _timed("embedder", asyncio.to_thread(_load_embedder))
+    if tokenizer and "tokenizer" not in _loaded:
+        tasks["tokenizer"] = _timed("tokenizer", asyncio.to_thread(_load_tokenizer))
+    if not tasks:
+        return dict(_timings)
+    results = dict(zip(tasks, await asyncio.gather(*tasks.values())))
+    total = time.perf_counter() - start
+    _timings["total_sec"] = round(_timings.get("total_sec", 0.0) + total, 3)
+
+    parts = []
+    for name, (ok, result) in results.items():
+        if name == "prefill":
+            done, failed = result if ok else (0, 0)
+            if not done and not failed:
+                continue  # every prefix was already cached
+            _timings["prefilled"] = _timings.get("prefilled", 0) + done
+            parts.append(f"prefill {done} request(s){f' ({failed} failed)' if failed else ''} {_timings['prefill_sec']:.2f}s")
+        else:
+            if ok:
+                _loaded.add(name)
+            parts.append(f"{name} {_timings[f'{name}_sec']:.2f}s{'' if ok else ' (failed)'}")
+    if parts:
+        print(f"Warm-up finished in {total:.2f}s: " + ", ".join(parts))
+    return dict(_timings)
+
+
+def get_timings():
+    return dict(_timings)
@@ -3,6 +3,7 @@ import json
 import re
 from tools.llm_utils import get_llm, generate_text_funcs
 from tools import llm_utils
+from tools import llm_cache
 from datasets import load_dataset
 from tools.db.db_utils import save_results, save_accuracy
 from tqdm.auto import tqdm
@@ -156,7 +157,15 @@ if __name__ == "__main__":
     )
     parser.add_argument("--difficulty", type=str, choices=["easy", "hard", "Easy", "Hard", "both"],
                         default="both", help="Difficulty: easy, hard, or both (default: both)")
+    parser.add_argument("--llm_cache", type=str, default=None,
+                        help="Path to a SQLite LLM response cache (opt-in)")
+    parser.add_argument("--llm_cache_mode", type=str, default="readwrite", choices=list(llm_cache.CACHE_MODES),
+                        help="readwrite: serve hits and store misses; replay: serve hits only")
+    parser.add_argument("--llm_cache_max_mb", type=float, default=llm_cache.DEFAULT_MAX_MB)
+    parser.add_argument("--llm_cache_max_age_days", type=float, default=None)
     args = parser.parse_args()
+    llm_cache.configure(args.llm_cache, mode=args.llm_cache_mode,
+                        max_mb=args.llm_cache_max_mb, max_age_days=args.llm_cache_max_age_days)
     if args.model not in generate_text_funcs:
         raise SystemExit(f"Unknown model: {args.model}. Choose from: {list(generate_text_funcs.keys())}")
     llm_utils.MODEL_NAME = args.model
@@ -170,4 +179,5 @@ if __name__ == "__main__":
             run_vanilla(diff, i, args.model)
     
     print(f"Best accuracy for Easy: {best_accuracy_easy}")
-    print(f"Best accuracy for Hard: {best_accuracy_hard}")
\ No newline at end of file
+    print(f"Best accuracy for Hard: {best_accuracy_hard}")
+    llm_cache.print_stats()
\ No newline at end of file